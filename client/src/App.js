@@ -21,7 +21,7 @@ import FAQ from './components/FAQ';
 import Contact from './components/Contact';
 import Pricing from './components/Pricing';
 import Payment from './components/Payment';
-import { API_BASE_URL } from './services/api';
+import { fetchAllPages } from './services/api';
 import './App.css';
 
 const App = () => {
@@ -34,11 +34,7 @@ const App = () => {
   const fetchUnits = async () => {
     setLoading(true);
     try {
-      const response = await fetch(`${API_BASE_URL}/api/units`);
-      if (response.ok) {
-        const data = await response.json();
-        setUnits(data);
-      }
+      setUnits(await fetchAllPages('/api/units'));
     } catch (error) {
       console.log('Backend not available, using static data');
     } finally {
@@ -7,7 +7,7 @@ import Customers from './Customers';
 import Payments from './Payments';
 import Reservations from './Reservations';
 import UnitsTab from './UnitTab';
-import { API_BASE_URL } from '../../services/api';
+import { API_BASE_URL, fetchPage } from '../../services/api';
 
 
 const AdminDashboard = () => {
@@ -15,8 +15,9 @@ const AdminDashboard = () => {
   const { logout, admin } = useAuth();
   const [activeTab, setActiveTab] = useState('dashboard');
   const [units, setUnits] = useState([]);
-  const [bookings, setBookings] = useState([]);
-  const [payments, setPayments] = useState([]);
+  const [unitsCursor, setUnitsCursor] = useState(null);
+  const [pendingBookings, setPendingBookings] = useState([]);
+  const [stats, setStats] = useState(null);
 
   useEffect(() => {
     const token = localStorage.getItem('admin_token');
@@ -36,20 +37,35 @@ const AdminDashboard = () => {
 
   const fetchData = async () => {
     try {
-      const [unitsRes, bookingsRes, paymentsRes] = await Promise.all([
-        fetch(`${API_BASE_URL}/api/units`),
-        fetch(`${API_BASE_URL}/api/bookings`),
-        fetch(`${API_BASE_URL}/api/payments`)
+      const token = localStorage.getItem('admin_token');
+      // Counts and totals are aggregated server-side; only the rows shown are listed
+      const [unitsPage, pendingRes, statsRes] = await Promise.all([
+        fetchPage('/api/units'),
+        fetch(`${API_BASE_URL}/api/bookings?status=pending&limit=3`),
+        fetch(`${API_BASE_URL}/api/admin/stats`, {
+          headers: { 'Authorization': `Bearer ${token}` }
+        })
       ]);
-      
-      if (unitsRes.ok) setUnits(await unitsRes.json());
-      if (bookingsRes.ok) setBookings(await bookingsRes.json());
-      if (paymentsRes.ok) setPayments(await paymentsRes.json());
+
+      setUnits(unitsPage.rows);
+      setUnitsCursor(unitsPage.next);
+      if (pendingRes.ok) setPendingBookings(await pendingRes.json());
+      if (statsRes.ok) setStats(await statsRes.json());
     } catch (error) {
       console.error('Failed to fetch data:', error);
     }
   };
 
+  const loadMoreUnits = async () => {
+    try {
+      const page = await fetchPage('/api/units', { after: unitsCursor });
+      setUnits(previous => previous.concat(page.rows));
+      setUnitsCursor(page.next);
+    } catch (error) {
+      console.error('Failed to fetch units:', error);
+    }
+  };
+
   const handleDeleteUnit = async (unitId) => {
     if (!window.confirm('Are you sure you want to delete this unit?')) return;
     try {
@@ -82,10 +98,15 @@ const AdminDashboard = () => {
     return () => clearInterval(interval);
   }, [activeTab]);
 
-  const totalUnits = units.length;
-  const availableUnits = units.filter(u => u.status === 'available').length;
-  const occupiedUnits = units.filter(u => u.status === 'booked').length;
-  const pendingPayments = payments.filter(p => p.status === 'pending').reduce((sum, p) => sum + parseFloat(p.amount || 0), 0);
+  const unitsByStatus = stats?.units.by_status || {};
+  const bookingsByStatus = stats?.bookings.by_status || {};
+  const paymentsByStatus = stats?.payments.by_status || {};
+  const totalUnits = stats?.units.total || 0;
+  const availableUnits = unitsByStatus.available || 0;
+  const occupiedUnits = unitsByStatus.booked || 0;
+  const pendingPayments = stats?.payments.pending_amount || 0;
+  const paymentMethods = Object.entries(stats?.payments.by_method || {})
+    .map(([name, customers]) => ({ name, customers }));
 
   const bookingsOverTime = [
     { month: 'Jan', value: 12 },
@@ -157,7 +178,8 @@ const AdminDashboard = () => {
           ) : activeTab === 'reservations' ? (
             <Reservations />
           ) : activeTab === 'units' ? (
-            <UnitsTab units={units} fetchData={fetchData} handleDeleteUnit={handleDeleteUnit} />
+            <UnitsTab units={units} fetchData={fetchData} handleDeleteUnit={handleDeleteUnit}
+                      hasMore={Boolean(unitsCursor)} onLoadMore={loadMoreUnits} />
           ) : (
             <>
               <div className="stats-grid">
@@ -192,7 +214,7 @@ const AdminDashboard = () => {
                       </tr>
                     </thead>
                     <tbody>
-                      {bookings.filter(b => b.status === 'pending').slice(0, 3).map((booking, idx) => (
+                      {pendingBookings.map((booking, idx) => (
                         <tr key={idx}>
                           <td>{booking.customer_name || 'N/A'}</td>
                           <td>{units.find(u => u.unit_id === booking.unit_id)?.size || 'N/A'} m²</td>
@@ -236,9 +258,9 @@ const AdminDashboard = () => {
                 <div className="card activity-card">
                   <h3 className="card-title">Recent Activity</h3>
                   <ul className="activity-list">
-                    <li>{bookings.filter(b => b.status === 'pending').length} pending bookings</li>
-                    <li>{bookings.length} Total bookings</li>
-                    <li>{payments.filter(p => p.status === 'failed').length} Failed payments</li>
+                    <li>{bookingsByStatus.pending || 0} pending bookings</li>
+                    <li>{stats?.bookings.total || 0} Total bookings</li>
+                    <li>{paymentsByStatus.failed?.count || 0} Failed payments</li>
                   </ul>
                 </div>
 
@@ -247,16 +269,7 @@ const AdminDashboard = () => {
                   <div className="chart-container" style={{width: '100%', height: '200px'}}>
                     <ResponsiveContainer width="100%" height={200} debounce={100}>
                       <BarChart 
-                        data={payments.reduce((acc, p) => {
-                          const method = p.payment_method || 'Unknown';
-                          const existing = acc.find(item => item.name === method);
-                          if (existing) {
-                            existing.customers += 1;
-                          } else {
-                            acc.push({ name: method, customers: 1 });
-                          }
-                          return acc;
-                        }, [])}
+                        data={paymentMethods}
                         layout="vertical"
                       >
                         <XAxis type="number" axisLine={false} tickLine={false} />
@@ -1,50 +1,58 @@
 import React, { useState, useEffect } from "react";
 import "./Payments.css";
-import { API_BASE_URL } from '../../services/api';
+import { API_BASE_URL, fetchPage } from '../../services/api';
 
 const Payments = () => {
   const [activeTab, setActiveTab] = useState("All Payments");
   const [filteredData, setFilteredData] = useState([]);
   const [showForm, setShowForm] = useState(false);
   const [paymentsData, setPaymentsData] = useState([]);
-  const [bookingsData, setBookingsData] = useState([]);
+  const [stats, setStats] = useState(null);
+  // cursors[i] is the `after` of page i; the first page has none
+  const [cursors, setCursors] = useState([null]);
+  const [pageIndex, setPageIndex] = useState(0);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
+    const fetchPayments = async () => {
+      try {
+        const token = localStorage.getItem('admin_token');
+        const [page, statsRes] = await Promise.all([
+          fetchPage('/api/payments', { after: cursors[pageIndex] }),
+          fetch(`${API_BASE_URL}/api/admin/stats`, {
+            headers: { 'Authorization': `Bearer ${token}` }
+          })
+        ]);
+        setPaymentsData(page.rows);
+        setNextCursor(page.next);
+        if (statsRes.ok) setStats(await statsRes.json());
+      } catch (error) {
+        console.error('Error fetching payments:', error);
+      } finally {
+        setLoading(false);
+      }
+    };
+
     fetchPayments();
     const interval = setInterval(fetchPayments, 1000);
     return () => clearInterval(interval);
-  }, []);
+  }, [cursors, pageIndex]);
 
-  const fetchPayments = async () => {
-    try {
-      const [paymentsRes, bookingsRes] = await Promise.all([
-        fetch(`${API_BASE_URL}/api/payments`),
-        fetch(`${API_BASE_URL}/api/bookings`)
-      ]);
-      
-      if (paymentsRes.ok && bookingsRes.ok) {
-        const payments = await paymentsRes.json();
-        const bookings = await bookingsRes.json();
-        setPaymentsData(payments);
-        setBookingsData(bookings);
-      }
-    } catch (error) {
-      console.error('Error fetching payments:', error);
-    } finally {
-      setLoading(false);
-    }
+  const goToNextPage = () => {
+    if (!nextCursor) return;
+    setCursors(previous => previous.slice(0, pageIndex + 1).concat(nextCursor));
+    setPageIndex(pageIndex + 1);
   };
 
-  const getCustomerName = (bookingId) => {
-    const booking = bookingsData.find(b => b.booking_id === bookingId);
-    return booking?.customer_name || 'N/A';
+  const goToPreviousPage = () => {
+    if (pageIndex > 0) setPageIndex(pageIndex - 1);
   };
 
-  const getCustomerEmail = (bookingId) => {
-    const booking = bookingsData.find(b => b.booking_id === bookingId);
-    return booking?.customer_email || 'N/A';
-  };
+  // Each payment carries its booking, so no separate bookings list is needed
+  const getCustomerName = (payment) => payment.booking?.customer_name || 'N/A';
+
+  const getCustomerEmail = (payment) => payment.booking?.customer_email || 'N/A';
 
   const getInitials = (name) => {
     return name.split(' ').map(n => n[0]).join('').toUpperCase();
@@ -68,32 +76,24 @@ const Payments = () => {
 
 
 
-  const totalRevenue = paymentsData
-    .filter(p => p.status === 'completed')
-    .reduce((sum, p) => sum + parseFloat(p.amount || 0), 0);
-
-  const paidCount = paymentsData.filter(p => p.status === 'completed').length;
-
-  const pendingAmount = paymentsData
-    .filter(p => p.status === 'pending')
-    .reduce((sum, p) => sum + parseFloat(p.amount || 0), 0);
-
-  const pendingCount = paymentsData.filter(p => p.status === 'pending').length;
-
-  const overdueAmount = paymentsData
-    .filter(p => p.status === 'failed')
-    .reduce((sum, p) => sum + parseFloat(p.amount || 0), 0);
-
-  const overdueCount = paymentsData.filter(p => p.status === 'failed').length;
+  // Totals cover every payment, not just the page on screen
+  const byStatus = stats?.payments.by_status || {};
+  const totalRevenue = byStatus.completed?.amount || 0;
+  const paidCount = byStatus.completed?.count || 0;
+  const pendingAmount = byStatus.pending?.amount || 0;
+  const pendingCount = byStatus.pending?.count || 0;
+  const overdueAmount = byStatus.failed?.amount || 0;
+  const overdueCount = byStatus.failed?.count || 0;
+  const paymentCount = Object.values(byStatus).reduce((sum, { count }) => sum + count, 0);
 
   // eslint-disable-next-line react-hooks/exhaustive-deps
   useEffect(() => {
     const transformedPayments = paymentsData.map(payment => {
-      const customerName = getCustomerName(payment.booking_id);
+      const customerName = getCustomerName(payment);
       return {
         id: `#PAY-${payment.payment_id}`,
         customer: customerName,
-        email: getCustomerEmail(payment.booking_id),
+        email: getCustomerEmail(payment),
         initials: getInitials(customerName),
         amount: `KSh ${parseFloat(payment.amount).toLocaleString()}`,
         method: payment.payment_method || 'N/A',
@@ -113,7 +113,7 @@ const Payments = () => {
         )
       );
     }
-  }, [activeTab, paymentsData, bookingsData]);
+  }, [activeTab, paymentsData]);
 
   const handleFormSubmit = (e) => {
     e.preventDefault();
@@ -291,15 +291,11 @@ const Payments = () => {
           </tbody>
         </table>
         <div className="pagination">
-          <span>Showing 1–8 of 156 payments</span>
+          <span>Showing {paymentsData.length} of {paymentCount} payments</span>
           <div className="page-buttons">
-            <button>Previous</button>
-            {[1, 2, 3, 4, 5, 20].map((n) => (
-              <button key={n} className={n === 1 ? "active" : ""}>
-                {n}
-              </button>
-            ))}
-            <button>Next</button>
+            <button onClick={goToPreviousPage} disabled={pageIndex === 0}>Previous</button>
+            <button className="active">{pageIndex + 1}</button>
+            <button onClick={goToNextPage} disabled={!nextCursor}>Next</button>
           </div>
         </div>
       </div>
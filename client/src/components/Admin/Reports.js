@@ -1,7 +1,8 @@
 import React from 'react';
 import { LineChart, Line, BarChart, Bar, PieChart, Pie, Cell, XAxis, YAxis, ResponsiveContainer, Tooltip, Legend, AreaChart, Area } from 'recharts';
 
-const Reports = ({ units, bookings, payments }) => {
+// stats is the /api/admin/stats response; the charts never need the full tables
+const Reports = ({ stats }) => {
   // Storage utilization over time (Area Chart)
   const storageUtilization = [
     { month: 'Jan', occupied: 45, available: 83 },
@@ -16,16 +17,10 @@ const Reports = ({ units, bookings, payments }) => {
   ];
 
   // Unit sizes distribution (Pie Chart)
-  const unitSizeData = units.reduce((acc, u) => {
-    const size = u.size || 'Unknown';
-    const existing = acc.find(item => item.name === size);
-    if (existing) {
-      existing.value += 1;
-    } else {
-      acc.push({ name: `${size} m²`, value: 1 });
-    }
-    return acc;
-  }, []);
+  const unitSizeData = (stats?.units.by_size || []).map(({ size, count }) => ({
+    name: size === null ? 'Unknown' : `${size} m²`,
+    value: count
+  }));
 
   // Customer growth trend
   const customerGrowth = [
@@ -41,21 +36,11 @@ const Reports = ({ units, bookings, payments }) => {
   ];
 
   // Payment status (Horizontal Bar)
-  const paymentStatusData = payments.reduce((acc, p) => {
-    const status = p.status || 'Unknown';
-    const existing = acc.find(item => item.name === status);
-    if (existing) {
-      existing.count += 1;
-      existing.amount += parseFloat(p.amount || 0);
-    } else {
-      acc.push({ 
-        name: status.charAt(0).toUpperCase() + status.slice(1), 
-        count: 1,
-        amount: parseFloat(p.amount || 0)
-      });
-    }
-    return acc;
-  }, []);
+  const paymentStatusData = Object.entries(stats?.payments.by_status || {}).map(([status, { count, amount }]) => ({
+    name: status.charAt(0).toUpperCase() + status.slice(1),
+    count,
+    amount
+  }));
 
   // Monthly bookings trend (Line Chart)
   const monthlyBookings = [
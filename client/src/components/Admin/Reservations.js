@@ -1,41 +1,51 @@
 import React, { useState, useEffect } from "react";
 import "./Reservations.css";
-import { API_BASE_URL } from '../../services/api';
+import { API_BASE_URL, fetchPage } from '../../services/api';
 
 const Reservations = () => {
   const [reservationsData, setReservationsData] = useState([]);
-  const [payments, setPayments] = useState([]);
+  const [stats, setStats] = useState(null);
+  // cursors[i] is the `after` of page i; the first page has none
+  const [cursors, setCursors] = useState([null]);
+  const [pageIndex, setPageIndex] = useState(0);
+  const [nextCursor, setNextCursor] = useState(null);
   const [activeTab, setActiveTab] = useState("All");
   const [viewMode, setViewMode] = useState('table');
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
+    const fetchData = async () => {
+      try {
+        const token = localStorage.getItem('admin_token');
+        const [page, statsRes] = await Promise.all([
+          fetchPage('/api/bookings', { after: cursors[pageIndex] }),
+          fetch(`${API_BASE_URL}/api/admin/stats`, {
+            headers: { 'Authorization': `Bearer ${token}` }
+          })
+        ]);
+        setReservationsData(page.rows);
+        setNextCursor(page.next);
+        if (statsRes.ok) setStats(await statsRes.json());
+      } catch (error) {
+        console.error('Failed to fetch data:', error);
+      } finally {
+        setLoading(false);
+      }
+    };
+
     fetchData();
     const interval = setInterval(fetchData, 3000);
     return () => clearInterval(interval);
-  }, []);
+  }, [cursors, pageIndex]);
 
-  const fetchData = async () => {
-    try {
-      const [bookingsRes, paymentsRes] = await Promise.all([
-        fetch(`${API_BASE_URL}/api/bookings`),
-        fetch(`${API_BASE_URL}/api/payments`)
-      ]);
-      
-      if (bookingsRes.ok) {
-        const bookingsData = await bookingsRes.json();
-        setReservationsData(bookingsData);
-      }
-      
-      if (paymentsRes.ok) {
-        const paymentsData = await paymentsRes.json();
-        setPayments(paymentsData);
-      }
-    } catch (error) {
-      console.error('Failed to fetch data:', error);
-    } finally {
-      setLoading(false);
-    }
+  const goToNextPage = () => {
+    if (!nextCursor) return;
+    setCursors(previous => previous.slice(0, pageIndex + 1).concat(nextCursor));
+    setPageIndex(pageIndex + 1);
+  };
+
+  const goToPreviousPage = () => {
+    if (pageIndex > 0) setPageIndex(pageIndex - 1);
   };
 
   const getStatusLabel = (booking) => {
@@ -59,9 +69,7 @@ const Reservations = () => {
     const daysUntilExpiry = (endDate - today) / (1000 * 60 * 60 * 24);
     return daysUntilExpiry > 0 && daysUntilExpiry <= 7;
   }).length;
-  const totalRevenue = payments
-    .filter(p => p.status === 'completed')
-    .reduce((sum, p) => sum + parseFloat(p.amount || 0), 0);
+  const totalRevenue = stats?.payments.by_status.completed?.amount || 0;
 
   const filteredReservations = activeTab === "All"
     ? reservationsData
@@ -201,6 +209,12 @@ const Reservations = () => {
         </table>
       </div>
       )}
+
+      <div className="tabs">
+        <button className="tab" onClick={goToPreviousPage} disabled={pageIndex === 0}>Previous</button>
+        <button className="tab active">Page {pageIndex + 1}</button>
+        <button className="tab" onClick={goToNextPage} disabled={!nextCursor}>Next</button>
+      </div>
     </div>
   );
 };
@@ -3,7 +3,7 @@ import React, { useState } from 'react';
 import UnitForm from './UnitForm';
 import { useAuth } from '../../contexts/AuthContext';
 
-const UnitsTab = ({ units, fetchData, handleDeleteUnit }) => {
+const UnitsTab = ({ units, fetchData, handleDeleteUnit, hasMore, onLoadMore }) => {
   const { admin } = useAuth();
   const [showCreateForm, setShowCreateForm] = useState(false);
   const [editingUnit, setEditingUnit] = useState(null);
@@ -57,6 +57,9 @@ const UnitsTab = ({ units, fetchData, handleDeleteUnit }) => {
           </div>
         ))}
       </div>
+      {hasMore && (
+        <button onClick={onLoadMore} className="create-btn">Load more units</button>
+      )}
     </div>
   );
 };
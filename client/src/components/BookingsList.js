@@ -1,6 +1,6 @@
 // src/components/BookingsList.js
 import React, { useState, useEffect } from 'react';
-import { API_BASE_URL } from '../services/api';
+import { fetchAllPages } from '../services/api';
 
 const BookingsList = () => {
   const [bookings, setBookings] = useState([]);
@@ -12,9 +12,7 @@ const BookingsList = () => {
 
   const fetchBookings = async () => {
     try {
-      const response = await fetch(`${API_BASE_URL}/api/bookings`);
-      const data = await response.json();
-      setBookings(Array.isArray(data) ? data : []);
+      setBookings(await fetchAllPages('/api/bookings'));
       setLoading(false);
     } catch (error) {
       console.error('Error fetching bookings:', error);
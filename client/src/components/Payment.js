@@ -62,8 +62,8 @@ const Payment = () => {
         if (response.ok && result.success) {
           alert(result.message || 'Please check your phone and enter M-Pesa PIN');
           
-          // Poll for payment status
-          const checkoutRequestId = result.checkout_request_id;
+          // Poll for payment status (the push is queued server-side and sent in the background)
+          const paymentId = result.payment_id;
           let attempts = 0;
           const maxAttempts = 30; // 30 seconds
           
@@ -71,9 +71,9 @@ const Payment = () => {
             attempts++;
             
             try {
-              const statusResponse = await fetch(`${API_BASE_URL}/api/payments`);
+              const statusResponse = await fetch(`${API_BASE_URL}/api/payments?booking_id=${bookingId}&fields=payment_id,status`);
               const payments = await statusResponse.json();
-              const payment = payments.find(p => p.checkout_request_id === checkoutRequestId);
+              const payment = payments.find(p => p.payment_id === paymentId);
               
               if (payment && payment.status === 'completed') {
                 clearInterval(pollStatus);
@@ -23,4 +23,31 @@ api.interceptors.request.use(
   }
 );
 
-export default api;
\ No newline at end of file
+export default api;
+
+// List endpoints return one page at a time (100 rows unless ?limit= says otherwise)
+// and set X-Next-Cursor while more rows remain; pass it back as `after`.
+export const fetchPage = async (path, { after, limit, headers } = {}) => {
+  const params = new URLSearchParams();
+  if (after) params.set('after', after);
+  if (limit) params.set('limit', limit);
+  const query = params.toString();
+  const separator = path.includes('?') ? '&' : '?';
+  const response = await fetch(`${API_BASE_URL}${path}${query ? separator + query : ''}`, { headers });
+  if (!response.ok) {
+    throw new Error(`Failed to fetch ${path}: ${response.status}`);
+  }
+  return { rows: await response.json(), next: response.headers.get('X-Next-Cursor') };
+};
+
+// Follows X-Next-Cursor to the last page, for small lists that are shown whole
+export const fetchAllPages = async (path, options = {}) => {
+  let rows = [];
+  let after = null;
+  do {
+    const page = await fetchPage(path, { ...options, after, limit: options.limit || 500 });
+    rows = rows.concat(page.rows);
+    after = page.next;
+  } while (after);
+  return rows;
+};
@@ -1,18 +1,42 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 from flask_cors import CORS
 from flask_migrate import Migrate
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import JWTManager, create_access_token, decode_token, jwt_required, get_jwt, get_jwt_identity
 from flask_restful import Api, Resource
-from models import db, User, Admin, Customer, StorageUnit, Booking, Feature, Payment, TransportationRequest
+from models import (db, Admin, Customer, StorageUnit, Booking, Feature, Payment, TransportationRequest,
+                    ChangeVersion, MpesaCallback, UnitFeatureLink)
 from config import Config
-from schema import (validate_admin_login, validate_storage_unit, validate_booking,
+from schema import (ValidationError, validate_admin_login, validate_storage_unit, validate_booking,
                    validate_payment, validate_transportation, validate_mpesa_stk,
-                   validate_mpesa_query)
-from datetime import datetime, date
+                   validate_mpesa_query, validate_list_query, validate_export_query,
+                   validate_availability_query, validate_bulk_unit_update, validate_many,
+                   STORAGE_UNIT_SPEC)
+from sqlalchemy import delete, func, insert, select, update, inspect as sa_inspect
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Load, joinedload, selectinload
+from datetime import datetime, date, timedelta
+import click
+import csv
+import hashlib
+import io
 import logging
+import threading
+import time
 import uuid
 import os
-from mpesa_service import MpesaService
+import random
+from mpesa_service import MpesaService, status_query_cache
+from serializers import flat_serializer
+from stk_queue import stk_queue
+from callback_inbox import callback_inbox, parse_callback
+from reconciler import payment_reconciler
+import metrics
+import responses
+import sqlite_mode
+from events import ADMIN_TOPIC, BrokerFull, booking_topic, broker, change_feed, sse_stream
+from availability import available_units_query, is_unit_available, lock_unit
 from functools import wraps
 
 app = Flask(__name__)
@@ -24,12 +48,148 @@ CORS(app,
      origins=allowed_origins,
      methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
      allow_headers=["Content-Type", "Authorization", "X-CSRF-Token"],
+     expose_headers=["X-Next-Cursor", "X-Change-Version", "ETag"],
      supports_credentials=True)
 
 db.init_app(app)
+sqlite_mode.init_app(app, db)
 migrate = Migrate(app, db)
 jwt = JWTManager(app)
 api = Api(app)
+stk_queue.init_app(app)
+callback_inbox.init_app(app)
+payment_reconciler.init_app(app)
+change_feed.init_app(app)
+metrics.init_app(app)
+# After metrics, so its hook runs first and metrics see the compressed size
+responses.init_app(app, api)
+
+
+class AdminAuthCache:
+    """Short-lived cache of (role, token_version) per admin so authorization skips the DB.
+
+    Role changes, deletions and Admin.revoke_tokens() take effect within `ttl` seconds.
+    """
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}  # admin_id -> (role, token_version, expires_at); None if deleted
+
+    def get(self, admin_id):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(admin_id)
+        if entry and entry[2] > now:
+            return entry[:2]
+
+        admin = db.session.get(Admin, admin_id)
+        state = (admin.role, admin.token_version or 0) if admin else (None, None)
+        with self._lock:
+            self._entries[admin_id] = state + (now + self.ttl,)
+        return state
+
+
+admin_auth_cache = AdminAuthCache(ttl=int(os.getenv('ADMIN_AUTH_CACHE_TTL', '30')))
+
+
+@app.cli.command('revoke-admin-tokens')
+@click.argument('username')
+def revoke_admin_tokens(username):
+    """Sign an admin out everywhere by revoking every token issued to them."""
+    admin = Admin.query.filter_by(username=username).first()
+    if not admin:
+        raise click.ClickException(f'No admin named {username}')
+    admin.revoke_tokens()
+    db.session.commit()
+    click.echo(f"Revoked tokens of {username}; running workers reject them within "
+               f"{admin_auth_cache.ttl} seconds")
+
+
+class FeatureCache:
+    """In-process feature name -> feature_id map, so unit writes resolve features without a query.
+
+    Only ids read from committed rows are cached; features upserted by the current
+    transaction are picked up on the next lookup, so a rollback never leaves a dangling
+    id behind. Entries expire after `ttl` seconds and are dropped when a feature is created.
+    """
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._expires_at = 0
+
+    def resolve(self, names):
+        """Map names to feature ids, creating the features that do not exist yet"""
+        names = set(names)
+        with self._lock:
+            if self._expires_at <= time.time():
+                self._ids, self._expires_at = {}, time.time() + self.ttl
+            feature_ids = {name: self._ids[name] for name in names if name in self._ids}
+
+        missing = names - feature_ids.keys()
+        if missing:
+            found = dict(db.session.execute(
+                select(Feature.name, Feature.feature_id).where(Feature.name.in_(missing))
+            ).all())
+            with self._lock:
+                self._ids.update(found)
+            feature_ids.update(found)
+            missing -= found.keys()
+        if missing:
+            # Concurrent writers may create the same name; the unique index makes the
+            # insert a no-op for them and the re-read returns whichever row won
+            db.session.execute(insert_ignoring_conflicts(Feature), [{'name': name} for name in missing])
+            feature_ids.update(db.session.execute(
+                select(Feature.name, Feature.feature_id).where(Feature.name.in_(missing))
+            ).all())
+        return feature_ids
+
+    def invalidate(self):
+        with self._lock:
+            self._ids, self._expires_at = {}, 0
+
+
+def insert_ignoring_conflicts(model):
+    """INSERT that skips rows violating a unique constraint (ON CONFLICT DO NOTHING)"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql_insert(model).on_conflict_do_nothing()
+    if dialect == 'sqlite':
+        return sqlite_insert(model).on_conflict_do_nothing()
+    if dialect in ('mysql', 'mariadb'):
+        return insert(model).prefix_with('IGNORE')
+    raise NotImplementedError(f'No conflict-ignoring INSERT for the {dialect} dialect')
+
+
+feature_cache = FeatureCache(ttl=int(os.getenv('FEATURE_CACHE_TTL', '300')))
+
+
+def set_unit_features(unit_id, names):
+    """Make the unit's feature links match names, touching only the links that change"""
+    wanted = set(feature_cache.resolve(name for name in names if name).values())
+    current = set(db.session.scalars(
+        select(UnitFeatureLink.feature_id).where(UnitFeatureLink.unit_id == unit_id)
+    ))
+    removed = current - wanted
+    if removed:
+        db.session.execute(
+            delete(UnitFeatureLink)
+            .where(UnitFeatureLink.unit_id == unit_id, UnitFeatureLink.feature_id.in_(removed))
+        )
+    added = wanted - current
+    if added:
+        db.session.execute(insert(UnitFeatureLink), [{'unit_id': unit_id, 'feature_id': feature_id}
+                                                     for feature_id in added])
+
+
+def read_from_replica(fn):
+    """Serve this request's queries from the read replica (DATABASE_REPLICA_URL), if configured"""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        # Left set for the whole request so streamed responses keep reading from the replica
+        g.use_replica = True
+        return fn(*args, **kwargs)
+    return wrapper
 
 
 # Role-based access control decorator
@@ -38,14 +198,155 @@ def role_required(allowed_roles):
         @wraps(fn)
         @jwt_required()
         def wrapper(*args, **kwargs):
-            admin_id = get_jwt_identity()
-            admin = Admin.query.get(admin_id)
-            if not admin or admin.role not in allowed_roles:
+            # The role claim is signed at login, so it can be trusted without a DB read;
+            # the cached state only catches revoked tokens and changed roles
+            claims = get_jwt()
+            if claims.get('role') not in allowed_roles:
+                return {'error': 'Access denied. Insufficient permissions.'}, 403
+            role, token_version = admin_auth_cache.get(int(get_jwt_identity()))
+            if role != claims.get('role') or token_version != claims.get('token_version', 0):
                 return {'error': 'Access denied. Insufficient permissions.'}, 403
             return fn(*args, **kwargs)
         return wrapper
     return decorator
 
+
+# Eager-loading profiles: every relationship to_dict() walks for each resource, loaded with a
+# fixed number of queries per request instead of lazy loads per row
+def booking_graph(path):
+    """Options loading a booking's nested relationships below the given loader path"""
+    return (
+        path.selectinload(Booking.payment).joinedload(Payment.user),
+        path.selectinload(Booking.transport_requests),
+        path.joinedload(Booking.user),
+        path.joinedload(Booking.customer).selectinload(Customer.transport_requests),
+    )
+
+
+UNIT_LOADING = booking_graph(selectinload(StorageUnit.bookings))
+BOOKING_LOADING = (joinedload(Booking.unit),) + booking_graph(Load(Booking))
+PAYMENT_LOADING = (joinedload(Payment.user), joinedload(Payment.booking).joinedload(Booking.unit)) + \
+    booking_graph(joinedload(Payment.booking))
+CUSTOMER_LOADING = (selectinload(Customer.transport_requests),
+                    selectinload(Customer.bookings).joinedload(Booking.unit)) + \
+    booking_graph(selectinload(Customer.bookings))
+
+
+def with_loading(query, model, options, fields=None):
+    """Apply an eager-loading profile unless a fields= projection skips every relationship"""
+    if fields and not set(fields) & set(sa_inspect(model).relationships.keys()):
+        return query
+    return query.options(*options)
+
+
+def list_fields(model):
+    """Field names accepted by the fields= projection on a list endpoint"""
+    mapper = sa_inspect(model)
+    relationships = [key for key in mapper.relationships.keys() if not key.startswith('_')]
+    return tuple(mapper.columns.keys()) + tuple(relationships)
+
+
+# Page size when a list request has no limit=; never more than validate_list_query's max_limit
+LIST_DEFAULT_LIMIT = min(int(os.getenv('LIST_DEFAULT_LIMIT', '100')), 500)
+
+
+def paginate(query, pk, params):
+    """Apply keyset pagination (?after=<id>&limit=) ordered by primary key.
+
+    Without limit= a page holds LIST_DEFAULT_LIMIT rows, so no request reads a whole table.
+    Returns the rows and the response headers; X-Next-Cursor is set when more rows remain.
+    """
+    if params['after'] is not None:
+        query = query.filter(pk > params['after'])
+    query = query.order_by(pk)
+    limit = params['limit'] or LIST_DEFAULT_LIMIT
+
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, {}
+    rows = rows[:limit]
+    return rows, {'X-Next-Cursor': str(getattr(rows[-1], pk.key))}
+
+
+def list_etag(versions):
+    """ETag for a list response: changes whenever a table it renders changes or the query differs"""
+    key = ','.join(f'{table}={versions[table]}' for table in sorted(versions))
+    return hashlib.sha1(f'{key}?{request.query_string.decode()}'.encode()).hexdigest()[:20]
+
+
+def change_headers(etag, version):
+    # no-cache makes browsers revalidate with If-None-Match instead of reusing a stale copy
+    return {'ETag': f'"{etag}"', 'X-Change-Version': str(version), 'Cache-Control': 'no-cache'}
+
+
+def filter_bookings(query, params):
+    """Apply the validated list/export filters to a Booking query"""
+    if params['since'] is not None:
+        query = query.filter(Booking.row_version > params['since'])
+    if 'status' in params:
+        query = query.filter(Booking.status == params['status'])
+    if 'unit_id' in params:
+        query = query.filter(Booking.unit_id == params['unit_id'])
+    if 'customer_id' in params:
+        query = query.filter(Booking.customer_id == params['customer_id'])
+    if 'site' in params:
+        query = query.join(StorageUnit, Booking.unit_id == StorageUnit.unit_id) \
+            .filter(StorageUnit.site == params['site'])
+    # Date range selects bookings whose rental period overlaps [from, to]
+    if 'from' in params:
+        query = query.filter(Booking.end_date >= params['from'])
+    if 'to' in params:
+        query = query.filter(Booking.start_date <= params['to'])
+    return query
+
+
+def filter_payments(query, params):
+    """Apply the validated list/export filters to a Payment query"""
+    if params['since'] is not None:
+        query = query.filter(Payment.row_version > params['since'])
+    if 'status' in params:
+        query = query.filter(Payment.status == params['status'])
+    if 'booking_id' in params:
+        query = query.filter(Payment.booking_id == params['booking_id'])
+    if 'site' in params:
+        query = query.join(Booking, Payment.booking_id == Booking.booking_id) \
+            .join(StorageUnit, Booking.unit_id == StorageUnit.unit_id) \
+            .filter(StorageUnit.site == params['site'])
+    if 'from' in params:
+        query = query.filter(Payment.payment_date >= params['from'])
+    if 'to' in params:
+        query = query.filter(Payment.payment_date < params['to'] + timedelta(days=1))
+    return query
+
+
+def serialize(rows, fields=None):
+    if fields:
+        return [row.to_dict(only=fields) for row in rows]
+    return [row.to_dict() for row in rows]
+
+
+def parse_unit_rows():
+    """Units of a bulk import: a JSON array (or {"units": [...]}), a CSV upload in the
+    `file` field or a text/csv body. CSV features are separated with semicolons."""
+    upload = request.files.get('file')
+    if upload or request.mimetype == 'text/csv':
+        text = upload.read().decode('utf-8-sig') if upload else request.get_data(as_text=True)
+        rows = []
+        for record in csv.DictReader(io.StringIO(text)):
+            # Blank cells count as missing so optional columns can be left empty
+            row = {key.strip(): value.strip() for key, value in record.items() if key and value and value.strip()}
+            if 'features' in row:
+                row['features'] = [name for name in row['features'].split(';') if name.strip()]
+            rows.append(row)
+        return rows
+
+    json_data = request.get_json(silent=True)
+    if isinstance(json_data, dict):
+        json_data = json_data.get('units')
+    if not isinstance(json_data, list):
+        raise ValidationError('Expected a JSON array of units or a CSV file')
+    return json_data
+
 class AdminLoginResource(Resource):
     def post(self):
         try:
@@ -61,7 +362,7 @@ class AdminLoginResource(Resource):
             if admin and admin.check_password(data['password']):
                 access_token = create_access_token(
                     identity=str(admin.admin_id),
-                    additional_claims={'role': admin.role}
+                    additional_claims={'role': admin.role, 'token_version': admin.token_version or 0}
                 )
                 return {
                     'access_token': access_token,
@@ -80,10 +381,33 @@ class AdminLoginResource(Resource):
             return {'error': 'Login failed'}, 500
 
 class StorageUnitListResource(Resource):
+    @read_from_replica
     def get(self):
         try:
-            units = StorageUnit.query.all()
-            return [unit.to_dict() for unit in units], 200
+            params = validate_list_query(request.args, list_fields(StorageUnit))
+            versions = ChangeVersion.current(('storageunit', 'booking', 'payment', 'transportationrequest',
+                                              'customer'))
+            etag = list_etag(versions)
+            cache_headers = change_headers(etag, versions['storageunit'])
+            if request.if_none_match.contains_weak(etag):
+                return None, 304, cache_headers
+
+            query = with_loading(StorageUnit.query, StorageUnit, UNIT_LOADING, params['fields'])
+            if params['since'] is not None:
+                query = query.filter(StorageUnit.row_version > params['since'])
+            if 'status' in params:
+                query = query.filter(StorageUnit.status == params['status'])
+            if 'site' in params:
+                query = query.filter(StorageUnit.site == params['site'])
+
+            flat = flat_serializer(StorageUnit, params['fields'])
+            if flat:
+                query = query.with_entities(*flat.columns)
+            units, headers = paginate(query, StorageUnit.unit_id, params)
+            headers.update(cache_headers)
+            return flat(units) if flat else serialize(units, params['fields']), 200, headers
+        except ValidationError as e:
+            return {'error': 'Validation failed', 'messages': str(e)}, 400
         except Exception as e:
             logging.error(f"Error fetching storage units: {str(e)}")
             return {'error': 'Failed to fetch storage units'}, 500
@@ -133,7 +457,9 @@ class StorageUnitListResource(Resource):
 class StorageUnitResource(Resource):
     def get(self, unit_id):
         try:
-            unit = StorageUnit.query.get_or_404(unit_id)
+            unit = db.session.get(StorageUnit, unit_id, options=UNIT_LOADING)
+            if unit is None:
+                return {'error': 'Storage unit not found'}, 404
             return unit.to_dict(), 200
         except Exception as e:
             logging.error(f"Error fetching storage unit {unit_id}: {str(e)}")
@@ -142,7 +468,7 @@ class StorageUnitResource(Resource):
     @role_required(['admin'])
     def put(self, unit_id):
         try:
-            unit = StorageUnit.query.get_or_404(unit_id)
+            unit = db.get_or_404(StorageUnit, unit_id)
             json_data = request.get_json()
             if not json_data:
                 return {'error': 'No data provided'}, 400
@@ -156,12 +482,7 @@ class StorageUnitResource(Resource):
                     setattr(unit, field, data[field])
 
             if 'features' in data:
-                unit.features.clear()
-                for feature_name in data['features']:
-                    feature = Feature.query.filter_by(name=feature_name).first()
-                    if not feature:
-                        feature = Feature(name=feature_name)
-                    unit.features.append(feature)
+                set_unit_features(unit.unit_id, data['features'])
 
             db.session.commit()
             return unit.to_dict(), 200
@@ -175,7 +496,7 @@ class StorageUnitResource(Resource):
     @role_required(['admin'])
     def delete(self, unit_id):
         try:
-            unit = StorageUnit.query.get_or_404(unit_id)
+            unit = db.get_or_404(StorageUnit, unit_id)
             db.session.delete(unit)
             db.session.commit()
             return {"message": "Storage unit deleted successfully"}, 200
@@ -185,6 +506,113 @@ class StorageUnitResource(Resource):
             return {'error': 'Failed to delete storage unit'}, 500
 
 
+class StorageUnitBulkResource(Resource):
+    """Bulk import (POST) and bulk rate/status changes by filter (PUT) for storage units"""
+    chunk_size = 1000
+    columns = ('unit_number', 'site', 'size', 'monthly_rate', 'status', 'location')
+
+    @role_required(['admin'])
+    def post(self):
+        try:
+            rows = parse_unit_rows()
+            max_rows = int(os.getenv('BULK_IMPORT_MAX_ROWS', '50000'))
+            if len(rows) > max_rows:
+                return {'error': f'At most {max_rows} units can be imported at once'}, 413
+
+            # Invalid rows are reported by their position in the upload and skipped
+            valid, errors = validate_many(STORAGE_UNIT_SPEC, rows)
+
+            # Each chunk commits on its own, so a database error only loses that chunk
+            created = 0
+            for start in range(0, len(valid), self.chunk_size):
+                chunk = valid[start:start + self.chunk_size]
+                try:
+                    created += self._insert_chunk([data for _, data in chunk])
+                except Exception as e:
+                    db.session.rollback()
+                    logging.error(f"Error importing storage units {chunk[0][0]}-{chunk[-1][0]}: {str(e)}")
+                    errors.extend({'row': index, 'error': 'Database error, unit not imported'} for index, _ in chunk)
+
+            errors.sort(key=lambda error: error['row'])
+            return {'created': created, 'failed': len(errors), 'errors': errors}, 201 if created else 400
+        except ValidationError as e:
+            return {'error': 'Validation failed', 'messages': str(e)}, 400
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error importing storage units: {str(e)}")
+            return {'error': 'Failed to import storage units'}, 500
+
+    def _insert_chunk(self, units):
+        # Bulk statements skip before_flush, so stamp the change version here
+        version = ChangeVersion.claim_next('storageunit')
+        unit_ids = db.session.scalars(
+            insert(StorageUnit).returning(StorageUnit.unit_id, sort_by_parameter_order=True),
+            [dict({column: data.get(column) for column in self.columns}, row_version=version) for data in units]
+        ).all()
+
+        feature_ids = feature_cache.resolve(name for data in units for name in data['features'] if name)
+        links = [
+            {'unit_id': unit_id, 'feature_id': feature_ids[name]}
+            for unit_id, data in zip(unit_ids, units)
+            for name in set(data['features']) if name
+        ]
+        if links:
+            db.session.execute(insert(UnitFeatureLink), links)
+        db.session.commit()
+        return len(unit_ids)
+
+    @role_required(['admin'])
+    def put(self):
+        try:
+            data = validate_bulk_unit_update(request.get_json(silent=True))
+            unit_filter = data['filter']
+
+            conditions = []
+            if 'unit_ids' in unit_filter:
+                conditions.append(StorageUnit.unit_id.in_(unit_filter['unit_ids']))
+            if 'site' in unit_filter:
+                conditions.append(StorageUnit.site == unit_filter['site'])
+            if 'status' in unit_filter:
+                conditions.append(StorageUnit.status == unit_filter['status'])
+            if 'min_size' in unit_filter:
+                conditions.append(StorageUnit.size >= unit_filter['min_size'])
+            if 'max_size' in unit_filter:
+                conditions.append(StorageUnit.size <= unit_filter['max_size'])
+
+            updated = db.session.execute(
+                update(StorageUnit.__table__)
+                .where(*conditions)
+                .values(**data['set'], row_version=ChangeVersion.claim_next('storageunit'))
+            ).rowcount
+            db.session.commit()
+            return {'updated': updated}, 200
+        except ValidationError as e:
+            return {'error': 'Validation failed', 'messages': str(e)}, 400
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error bulk updating storage units: {str(e)}")
+            return {'error': 'Failed to update storage units'}, 500
+
+
+class UnitAvailabilityResource(Resource):
+    @read_from_replica
+    def get(self):
+        try:
+            params = validate_availability_query(request.args, list_fields(StorageUnit))
+            query = with_loading(available_units_query(params), StorageUnit, UNIT_LOADING, params['fields'])
+
+            flat = flat_serializer(StorageUnit, params['fields'])
+            if flat:
+                query = query.with_entities(*flat.columns)
+            units, headers = paginate(query, StorageUnit.unit_id, params)
+            return flat(units) if flat else serialize(units, params['fields']), 200, headers
+        except ValidationError as e:
+            return {'error': 'Validation failed', 'messages': str(e)}, 400
+        except Exception as e:
+            logging.error(f"Error searching unit availability: {str(e)}")
+            return {'error': 'Failed to search availability'}, 500
+
+
 class FeatureListResource(Resource):
     def get(self):
         try:
@@ -203,6 +631,7 @@ class FeatureListResource(Resource):
             feature = Feature(name=data['name'])
             db.session.add(feature)
             db.session.commit()
+            feature_cache.invalidate()
             return feature.to_dict(), 201
         except Exception as e:
             db.session.rollback()
@@ -212,10 +641,27 @@ class FeatureListResource(Resource):
 
 class BookingListResource(Resource):
     @jwt_required(optional=True)
+    @read_from_replica
     def get(self):
         try:
-            bookings = Booking.query.all()
-            return [booking.to_dict() for booking in bookings], 200
+            params = validate_list_query(request.args, list_fields(Booking))
+            versions = ChangeVersion.current(('booking', 'storageunit', 'payment', 'transportationrequest',
+                                              'customer'))
+            etag = list_etag(versions)
+            cache_headers = change_headers(etag, versions['booking'])
+            if request.if_none_match.contains_weak(etag):
+                return None, 304, cache_headers
+
+            query = filter_bookings(with_loading(Booking.query, Booking, BOOKING_LOADING, params['fields']), params)
+
+            flat = flat_serializer(Booking, params['fields'])
+            if flat:
+                query = query.with_entities(*flat.columns)
+            bookings, headers = paginate(query, Booking.booking_id, params)
+            headers.update(cache_headers)
+            return flat(bookings) if flat else serialize(bookings, params['fields']), 200, headers
+        except ValidationError as e:
+            return {'error': 'Validation failed', 'messages': str(e)}, 400
         except Exception as e:
             logging.error(f"Error fetching bookings: {str(e)}")
             return {'error': 'Failed to fetch bookings'}, 500
@@ -229,60 +675,17 @@ class BookingListResource(Resource):
             # Validate input
             data = validate_booking(json_data)
 
-            # Check if unit exists and is available
-            unit = StorageUnit.query.get(data['unit_id'])
-            if not unit:
-                return {'error': 'Storage unit not found'}, 404
-            if unit.status != 'available':
-                return {'error': 'Storage unit is not available'}, 400
-
-            # Create or find customer
-            customer = Customer.query.filter_by(email=data['customer_email']).first()
-            if not customer:
-                customer = Customer(
-                    name=data['customer_name'].strip(),
-                    email=data['customer_email'].strip(),
-                    phone=data['customer_phone'].strip()
-                )
-                db.session.add(customer)
-                db.session.flush()  # Get customer_id
-
-            booking = Booking(
-                unit_id=data['unit_id'],
-                customer_id=customer.customer_id,
-                customer_name=data['customer_name'].strip(),
-                customer_email=data['customer_email'].strip(),
-                customer_phone=data['customer_phone'].strip(),
-                start_date=data['start_date'],
-                end_date=data['end_date'],
-                total_cost=data['total_cost'],
-                status=data['status']
-            )
-
-            # Update unit status to booked
-            unit.status = 'booked'
-
-            db.session.add(booking)
-            db.session.add(unit)
-            db.session.flush()  # Get the booking_id before commit
-
-            result = {
-                'booking_id': booking.booking_id,
-                'unit_id': booking.unit_id,
-                'customer_id': customer.customer_id,
-                'customer_name': booking.customer_name,
-                'customer_email': booking.customer_email,
-                'customer_phone': booking.customer_phone,
-                'start_date': booking.start_date.isoformat(),
-                'end_date': booking.end_date.isoformat(),
-                'total_cost': float(booking.total_cost),
-                'status': booking.status,
-                'booking_date': booking.booking_date.isoformat()
-            }
-
-            db.session.commit()
-
-            return result, 201
+            # Lock waits and deadlocks surface as OperationalError; retry those with backoff
+            attempts = int(os.getenv('BOOKING_LOCK_RETRIES', '3'))
+            for attempt in range(attempts):
+                try:
+                    return self._reserve(data)
+                except OperationalError as e:
+                    db.session.rollback()
+                    if attempt == attempts - 1:
+                        logging.warning(f"Booking unit {data['unit_id']} gave up after {attempts} attempts: {str(e)}")
+                        return {'error': 'Storage unit is being booked by another customer, please try again'}, 409
+                    time.sleep(random.uniform(0, 0.05 * (2 ** attempt)))
         except ValidationError as e:
             return {'error': 'Validation failed', 'messages': str(e)}, 400
         except Exception as e:
@@ -290,11 +693,72 @@ class BookingListResource(Resource):
             logging.error(f"Error creating booking: {str(e)}")
             return {'error': f'Failed to create booking: {str(e)}'}, 500
 
+    def _reserve(self, data):
+        # Lock the unit before checking availability, so concurrent bookings of the same
+        # unit queue up here and exactly one can claim each date range
+        if not lock_unit(data['unit_id']):
+            db.session.rollback()
+            return {'error': 'Storage unit not found'}, 404
+        if not is_unit_available(data['unit_id'], data['start_date'], data['end_date']):
+            db.session.rollback()
+            return {'error': 'Storage unit is not available for the selected dates'}, 409
+        unit = db.session.get(StorageUnit, data['unit_id'])
+
+        # Create or find customer
+        customer = Customer.query.filter_by(email=data['customer_email']).first()
+        if not customer:
+            customer = Customer(
+                name=data['customer_name'].strip(),
+                email=data['customer_email'].strip(),
+                phone=data['customer_phone'].strip()
+            )
+            db.session.add(customer)
+            db.session.flush()  # Get customer_id
+
+        booking = Booking(
+            unit_id=data['unit_id'],
+            customer_id=customer.customer_id,
+            customer_name=data['customer_name'].strip(),
+            customer_email=data['customer_email'].strip(),
+            customer_phone=data['customer_phone'].strip(),
+            start_date=data['start_date'],
+            end_date=data['end_date'],
+            total_cost=data['total_cost'],
+            status=data['status']
+        )
+
+        # The unit's status reflects today's occupancy; future bookings only hold their dates
+        if booking.start_date <= date.today():
+            unit.status = 'booked'
+
+        db.session.add(booking)
+        db.session.flush()  # Get the booking_id before commit
+
+        result = {
+            'booking_id': booking.booking_id,
+            'unit_id': booking.unit_id,
+            'customer_id': customer.customer_id,
+            'customer_name': booking.customer_name,
+            'customer_email': booking.customer_email,
+            'customer_phone': booking.customer_phone,
+            'start_date': booking.start_date.isoformat(),
+            'end_date': booking.end_date.isoformat(),
+            'total_cost': float(booking.total_cost),
+            'status': booking.status,
+            'booking_date': booking.booking_date.isoformat()
+        }
+
+        db.session.commit()
+
+        return result, 201
+
 
 class BookingResource(Resource):
     def get(self, booking_id):
         try:
-            booking = Booking.query.get_or_404(booking_id)
+            booking = db.session.get(Booking, booking_id, options=BOOKING_LOADING)
+            if booking is None:
+                return {'error': 'Booking not found'}, 404
             return booking.to_dict(), 200
         except Exception as e:
             logging.error(f"Error fetching booking {booking_id}: {str(e)}")
@@ -302,10 +766,27 @@ class BookingResource(Resource):
 
 
 class PaymentListResource(Resource):
+    @read_from_replica
     def get(self):
         try:
-            payments = Payment.query.all()
-            return [payment.to_dict() for payment in payments], 200
+            params = validate_list_query(request.args, list_fields(Payment))
+            versions = ChangeVersion.current(('payment', 'booking', 'storageunit', 'transportationrequest',
+                                              'customer'))
+            etag = list_etag(versions)
+            cache_headers = change_headers(etag, versions['payment'])
+            if request.if_none_match.contains_weak(etag):
+                return None, 304, cache_headers
+
+            query = filter_payments(with_loading(Payment.query, Payment, PAYMENT_LOADING, params['fields']), params)
+
+            flat = flat_serializer(Payment, params['fields'])
+            if flat:
+                query = query.with_entities(*flat.columns)
+            payments, headers = paginate(query, Payment.payment_id, params)
+            headers.update(cache_headers)
+            return flat(payments) if flat else serialize(payments, params['fields']), 200, headers
+        except ValidationError as e:
+            return {'error': 'Validation failed', 'messages': str(e)}, 400
         except Exception as e:
             logging.error(f"Error fetching payments: {str(e)}")
             return {'error': 'Failed to fetch payments'}, 500
@@ -320,7 +801,7 @@ class PaymentListResource(Resource):
             data = validate_payment(json_data)
             
             # Check if booking exists
-            booking = Booking.query.get(data['booking_id'])
+            booking = db.session.get(Booking, data['booking_id'])
             if not booking:
                 return {'error': 'Booking not found'}, 404
             
@@ -389,7 +870,7 @@ class MpesaSTKPushResource(Resource):
             data = validate_mpesa_stk(json_data)
             
             # Validate booking exists
-            booking = Booking.query.get(data['booking_id'])
+            booking = db.session.get(Booking, data['booking_id'])
             if not booking:
                 return {'error': 'Booking not found'}, 404
             
@@ -400,43 +881,55 @@ class MpesaSTKPushResource(Resource):
             elif not phone.startswith('254'):
                 phone = '254' + phone
             
-            # Initialize M-Pesa service
-            mpesa = MpesaService()
-            
-            # Initiate STK Push
-            result = mpesa.stk_push(
-                phone_number=phone,
-                amount=data['amount'],
-                account_reference=f"BOOKING-{data['booking_id']}",
-                transaction_desc=f"Storage Unit Payment"
-            )
-            
-            if result.get('success'):
-                # Create or update payment record
-                payment = Payment.query.filter_by(booking_id=data['booking_id']).first()
-                if not payment:
-                    payment = Payment(
-                        booking_id=data['booking_id'],
-                        amount=data['amount'],
-                        payment_method='mpesa',
-                        status='pending'
-                    )
-                    db.session.add(payment)
-                
-                payment.checkout_request_id = result.get('checkout_request_id')
-                payment.merchant_request_id = result.get('merchant_request_id')
-                payment.phone_number = phone
-                
-                db.session.commit()
-                
+            # Queue the push; the STK queue worker calls Daraja so the request returns
+            # immediately regardless of Safaricom latency
+            payment = Payment.query.filter_by(booking_id=data['booking_id']).first()
+            if payment and payment.status == 'completed':
+                return {'error': 'Booking is already paid'}, 409
+            if payment and (payment.status == 'queued' or
+                            (payment.status == 'dispatching' and not stk_queue.lease_expired(payment))):
+                # Duplicate submit while the first push is still in flight; a dispatching
+                # payment whose worker died is queued again below
                 return {
                     'success': True,
-                    'message': result.get('message'),
-                    'checkout_request_id': result.get('checkout_request_id')
-                }, 200
-            else:
-                return {'error': result.get('error')}, 400
-                
+                    'message': 'Payment request is already being processed',
+                    'payment_id': payment.payment_id,
+                    'status': payment.status
+                }, 202
+            if payment and stk_queue.prompt_live(payment):
+                # Pushing again would drop the first prompt's CheckoutRequestID, and its
+                # callback could no longer be matched if the customer accepts it
+                return {
+                    'error': 'A payment prompt was already sent to the phone; '
+                             'accept or cancel it before requesting another',
+                    'payment_id': payment.payment_id,
+                    'checkout_request_id': payment.checkout_request_id,
+                    'status': payment.status
+                }, 409
+
+            if not payment:
+                payment = Payment(
+                    booking_id=data['booking_id'],
+                    payment_method='mpesa'
+                )
+                db.session.add(payment)
+
+            payment.amount = data['amount']
+            payment.phone_number = phone
+            payment.status = 'queued'
+            payment.checkout_request_id = None
+            payment.merchant_request_id = None
+            db.session.commit()
+
+            stk_queue.notify()
+
+            return {
+                'success': True,
+                'message': 'Payment request queued. Please check your phone and enter your M-Pesa PIN',
+                'payment_id': payment.payment_id,
+                'status': payment.status
+            }, 202
+
         except ValidationError as e:
             return {'error': 'Validation failed', 'messages': e.messages}, 400
         except Exception as e:
@@ -447,47 +940,49 @@ class MpesaSTKPushResource(Resource):
 
 class MpesaCallbackResource(Resource):
     def post(self):
-        """Handle M-Pesa payment callback"""
+        """Store an M-Pesa payment callback in the inbox; callback_inbox applies it to the payment"""
         try:
-            data = request.get_json()
-            logging.info(f"M-Pesa Callback received: {data}")
-            
-            # Extract callback data
-            body = data.get('Body', {}).get('stkCallback', {})
-            result_code = body.get('ResultCode')
-            checkout_request_id = body.get('CheckoutRequestID')
-            
-            # Find payment by checkout_request_id
-            payment = Payment.query.filter_by(checkout_request_id=checkout_request_id).first()
-            
-            if payment:
-                if result_code == 0:
-                    # Payment successful
-                    callback_metadata = body.get('CallbackMetadata', {}).get('Item', [])
-                    mpesa_receipt = next((item['Value'] for item in callback_metadata if item['Name'] == 'MpesaReceiptNumber'), None)
-                    
-                    payment.status = 'completed'
-                    payment.mpesa_receipt_number = mpesa_receipt
-                    payment.transaction_id = mpesa_receipt
-                    
-                    # Update booking status to 'paid' when payment is confirmed
-                    booking = Booking.query.get(payment.booking_id)
-                    if booking:
-                        booking.status = 'paid'
-                else:
-                    # Payment failed
-                    payment.status = 'failed'
-                
-                db.session.commit()
-                logging.info(f"Payment updated: {payment.payment_id} - Status: {payment.status}")
-            
+            data = request.get_json(silent=True)
+            callback = parse_callback(data)
+            if callback is None:
+                logging.warning(f"M-Pesa callback without CheckoutRequestID: {data}")
+                return {'ResultCode': 0, 'ResultDesc': 'Success'}, 200
+
+            # Daraja retries the same CheckoutRequestID; the unique constraint drops repeats
+            stored = db.session.execute(insert_ignoring_conflicts(MpesaCallback).values(**callback)).rowcount
+            db.session.commit()
+            if stored:
+                callback_inbox.notify()
+            logging.info(f"M-Pesa callback {'stored' if stored else 'duplicate'}: {callback['checkout_request_id']}")
             return {'ResultCode': 0, 'ResultDesc': 'Success'}, 200
-            
+
         except Exception as e:
+            db.session.rollback()
             logging.error(f"Error processing M-Pesa callback: {str(e)}")
             return {'ResultCode': 1, 'ResultDesc': 'Failed'}, 500
 
 
+MPESA_QUERY_MIN_AGE = timedelta(seconds=int(os.getenv('MPESA_QUERY_MIN_AGE', '15')))
+
+
+def local_query_result(payment):
+    """Shape a locally known payment status like a Daraja stkpushquery response"""
+    result_codes = {'completed': '0', 'failed': '1'}
+    return {
+        'success': True,
+        'source': 'local',
+        'status': payment.status,
+        'data': {
+            'CheckoutRequestID': payment.checkout_request_id,
+            'ResultCode': result_codes.get(payment.status),
+            'ResultDesc': {
+                'completed': 'The service request is processed successfully.',
+                'failed': 'The payment was not completed.'
+            }.get(payment.status, 'The transaction is being processed')
+        }
+    }
+
+
 class MpesaQueryResource(Resource):
     def post(self):
         """Query M-Pesa payment status"""
@@ -499,22 +994,87 @@ class MpesaQueryResource(Resource):
             # Validate input
             data = validate_mpesa_query(json_data)
 
-            mpesa = MpesaService()
-            result = mpesa.query_stk_status(data['checkout_request_id'])
+            checkout_request_id = data['checkout_request_id']
 
-            return result, 200
+            # Answer from the local payment first; the callback has usually landed already
+            payment = Payment.query.filter_by(checkout_request_id=checkout_request_id).first()
+            if not payment:
+                # Never proxy IDs this server did not issue; they would each cost a Daraja call
+                return {'error': 'Unknown checkout request'}, 404
+            if payment.status != 'pending' or not payment.dispatched_at:
+                # Final, or still queued/dispatching: Daraja has nothing newer to say
+                return local_query_result(payment), 200
+            if datetime.utcnow() - payment.dispatched_at < MPESA_QUERY_MIN_AGE:
+                # Too early for Daraja to know anything; wait for the callback
+                return local_query_result(payment), 200
+
+            # Stale pending payment: ask Daraja, sharing one call per ID across pollers
+            result = status_query_cache.get(checkout_request_id, MpesaService().query_stk_status)
+            result_code = (result.get('data') or {}).get('ResultCode')
+            if result.get('success') and result_code is not None:
+                payment.apply_mpesa_result(result_code)
+                db.session.commit()
+            return dict(result, source='daraja'), 200
         except ValidationError as e:
-            return {'error': 'Validation failed', 'messages': e.messages}, 400
+            return {'error': 'Validation failed', 'messages': str(e)}, 400
         except Exception as e:
             logging.error(f"Error querying M-Pesa status: {str(e)}")
             return {'error': str(e)}, 500
 
 
+class ExportResource(Resource):
+    """Streams every matching row as NDJSON (default) or CSV for accounting exports.
+
+    Rows are read from a server-side cursor in yield_per batches and written as they
+    arrive, so memory stays constant regardless of history size.
+    """
+    model = None
+    filter_query = None
+
+    @role_required(['admin'])
+    @read_from_replica
+    def get(self):
+        try:
+            columns = tuple(sa_inspect(self.model).columns.keys())
+            params = validate_export_query(request.args, columns)
+            serializer = flat_serializer(self.model, params['fields'] or columns)
+            primary_key = sa_inspect(self.model).primary_key[0]
+
+            query = self.filter_query(self.model.query, params) \
+                .with_entities(*serializer.columns) \
+                .order_by(primary_key) \
+                .execution_options(yield_per=1000)
+
+            export_format = params['format']
+            filename = f"{self.model.__tablename__}-{date.today().isoformat()}.{'csv' if export_format == 'csv' else 'ndjson'}"
+            mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+            response = Response(stream_with_context(responses.stream_export(serializer, query, export_format)),
+                                mimetype=mimetype)
+            response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+            return response
+        except ValidationError as e:
+            return {'error': 'Validation failed', 'messages': str(e)}, 400
+        except Exception as e:
+            logging.error(f"Error exporting {self.model.__tablename__}: {str(e)}")
+            return {'error': 'Failed to export data'}, 500
+
+
+class BookingExportResource(ExportResource):
+    model = Booking
+    filter_query = staticmethod(filter_bookings)
+
+
+class PaymentExportResource(ExportResource):
+    model = Payment
+    filter_query = staticmethod(filter_payments)
+
+
 class CustomerListResource(Resource):
     @role_required(['admin'])
+    @read_from_replica
     def get(self):
         try:
-            customers = Customer.query.all()
+            customers = Customer.query.options(*CUSTOMER_LOADING).all()
             return [customer.to_dict() for customer in customers], 200
         except Exception as e:
             logging.error(f"Error fetching customers: {str(e)}")
@@ -525,7 +1085,9 @@ class CustomerResource(Resource):
     @role_required(['admin'])
     def get(self, customer_id):
         try:
-            customer = Customer.query.get_or_404(customer_id)
+            customer = db.session.get(Customer, customer_id, options=CUSTOMER_LOADING)
+            if customer is None:
+                return {'error': 'Customer not found'}, 404
             customer_data = customer.to_dict()
 
             # Add booking and payment summary
@@ -544,7 +1106,7 @@ class CustomerResource(Resource):
     @role_required(['admin'])
     def delete(self, customer_id):
         try:
-            customer = Customer.query.get_or_404(customer_id)
+            customer = db.get_or_404(Customer, customer_id)
 
             # Check if customer has active bookings
             active_bookings = [b for b in customer.bookings if b.status in ['pending', 'paid', 'active']]
@@ -571,9 +1133,59 @@ class CustomerResource(Resource):
             return {'error': 'Failed to delete customer'}, 500
 
 
+class AdminStatsResource(Resource):
+    @role_required(['admin'])
+    @read_from_replica
+    def get(self):
+        """Dashboard aggregates computed in SQL instead of over the full tables"""
+        try:
+            unit_status = db.session.query(StorageUnit.status, func.count(StorageUnit.unit_id)) \
+                .group_by(StorageUnit.status).all()
+            unit_sizes = db.session.query(StorageUnit.size, func.count(StorageUnit.unit_id)) \
+                .group_by(StorageUnit.size).order_by(StorageUnit.size).all()
+            booking_status = db.session.query(Booking.status, func.count(Booking.booking_id)) \
+                .group_by(Booking.status).all()
+            payment_status = db.session.query(Payment.status, func.count(Payment.payment_id),
+                                              func.coalesce(func.sum(Payment.amount), 0)) \
+                .group_by(Payment.status).all()
+            payment_methods = db.session.query(Payment.payment_method, func.count(Payment.payment_id)) \
+                .group_by(Payment.payment_method).all()
+
+            payments_by_status = {
+                status or 'unknown': {'count': count, 'amount': float(amount)}
+                for status, count, amount in payment_status
+            }
+            return {
+                'units': {
+                    'total': sum(count for _, count in unit_status),
+                    'by_status': dict(unit_status),
+                    'by_size': [{'size': float(size) if size is not None else None, 'count': count}
+                                for size, count in unit_sizes]
+                },
+                'bookings': {
+                    'total': sum(count for _, count in booking_status),
+                    'by_status': dict(booking_status)
+                },
+                'payments': {
+                    'total': sum(item['count'] for item in payments_by_status.values()),
+                    'by_status': payments_by_status,
+                    'by_method': {method or 'unknown': count for method, count in payment_methods},
+                    # Queued and dispatching STK pushes are still owed, not just 'pending' ones
+                    'pending_amount': sum(item['amount'] for status, item in payments_by_status.items()
+                                          if status not in ('completed', 'failed'))
+                }
+            }, 200
+        except Exception as e:
+            logging.error(f"Error computing admin stats: {str(e)}")
+            return {'error': 'Failed to compute stats'}, 500
+
+
 api.add_resource(AdminLoginResource, '/api/admin/login')
+api.add_resource(AdminStatsResource, '/api/admin/stats')
 api.add_resource(StorageUnitListResource, '/api/units')
 api.add_resource(StorageUnitResource, '/api/units/<int:unit_id>')
+api.add_resource(UnitAvailabilityResource, '/api/units/availability')
+api.add_resource(StorageUnitBulkResource, '/api/units/bulk')
 api.add_resource(FeatureListResource, '/api/features')
 api.add_resource(BookingListResource, '/api/bookings')
 api.add_resource(BookingResource, '/api/bookings/<int:booking_id>')
@@ -582,6 +1194,8 @@ api.add_resource(TransportationResource, '/api/transportation')
 api.add_resource(MpesaSTKPushResource, '/api/mpesa/stkpush')
 api.add_resource(MpesaCallbackResource, '/api/mpesa/callback')
 api.add_resource(MpesaQueryResource, '/api/mpesa/query')
+api.add_resource(BookingExportResource, '/api/export/bookings')
+api.add_resource(PaymentExportResource, '/api/export/payments')
 api.add_resource(CustomerListResource, '/api/customers')
 api.add_resource(CustomerResource, '/api/customers/<int:customer_id>')
 
@@ -608,6 +1222,46 @@ def get_csrf_token():
     response.headers.add('Access-Control-Allow-Credentials', 'true')
     return response, 200
 
+@app.route('/api/events', methods=['GET'])
+def event_stream():
+    """Server-Sent Events for status changes.
+
+    ?booking_id=<id> streams one booking's booking/payment events; the admin firehose
+    needs an admin JWT in ?token= because EventSource cannot send headers.
+    """
+    topics = []
+    booking_id = request.args.get('booking_id', type=int)
+    if booking_id:
+        topics.append(booking_topic(booking_id))
+    if request.args.get('token'):
+        try:
+            claims = decode_token(request.args['token'])
+        except Exception:
+            return jsonify({'error': 'Invalid token'}), 401
+        role, token_version = admin_auth_cache.get(int(claims['sub']))
+        if claims.get('role') not in ['admin'] or role != claims.get('role') or \
+                token_version != claims.get('token_version', 0):
+            return jsonify({'error': 'Access denied. Insufficient permissions.'}), 403
+        topics.append(ADMIN_TOPIC)
+    if not topics:
+        return jsonify({'error': 'booking_id or admin token is required'}), 400
+
+    # Subscribe before streaming so a full worker can still answer with a status code
+    try:
+        subscription = broker.subscribe(topics)
+    except BrokerFull as e:
+        logging.warning(f"Event stream refused: {str(e)}")
+        response = jsonify({'error': 'Too many event streams, retry later or poll'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+
+    response = Response(stream_with_context(sse_stream(subscription)), mimetype='text/event-stream')
+    # The stream's own cleanup never runs if the client leaves before the first frame
+    response.call_on_close(lambda: broker.unsubscribe(subscription))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/')
 def home():
     return jsonify({
@@ -0,0 +1,70 @@
+# Date-range availability search over storage units.
+#
+# A unit is free for [start, end) when no booking that still holds it overlaps
+# that range. The overlap probe is an indexed range query on
+# booking (unit_id, start_date, end_date), so each candidate unit costs one
+# index seek rather than a scan of its booking history.
+#
+# Bookings are the only record of occupancy. StorageUnit.status says whether the
+# unit is occupied today, and new bookings set it only when they start today, so a
+# unit booked for next month can still be booked for this week.
+from sqlalchemy import and_, exists, update
+
+from models import db, StorageUnit, Booking, Feature, UnitFeatureLink
+
+# Booking statuses that keep a unit occupied for their date range
+HOLDING_STATUSES = ('pending', 'paid', 'active')
+
+
+def overlapping_bookings(unit_id, start_date, end_date):
+    """Condition matching bookings of unit_id that hold it during [start_date, end_date)"""
+    return and_(
+        Booking.unit_id == unit_id,
+        Booking.status.in_(HOLDING_STATUSES),
+        Booking.start_date < end_date,
+        Booking.end_date > start_date,
+    )
+
+
+def is_unit_available(unit_id, start_date, end_date):
+    return not db.session.query(exists().where(overlapping_bookings(unit_id, start_date, end_date))).scalar()
+
+
+def lock_unit(unit_id):
+    """Hold the unit's row lock until the transaction ends; False if the unit does not exist.
+
+    A no-op UPDATE rather than SELECT ... FOR UPDATE because SQLite ignores FOR UPDATE;
+    the UPDATE takes the row lock on PostgreSQL and the write lock on SQLite, so an
+    overlap check made afterwards sees every booking committed for this unit.
+    """
+    locked = db.session.execute(
+        update(StorageUnit.__table__)
+        .where(StorageUnit.unit_id == unit_id)
+        .values(unit_id=StorageUnit.unit_id)
+    )
+    return locked.rowcount > 0
+
+
+def available_units_query(params):
+    """Query for units free over params['start']..params['end'] matching the search filters"""
+    query = StorageUnit.query.filter(
+        ~exists().where(overlapping_bookings(StorageUnit.unit_id, params['start'], params['end']))
+    )
+    if 'site' in params:
+        query = query.filter(StorageUnit.site == params['site'])
+    if 'min_size' in params:
+        query = query.filter(StorageUnit.size >= params['min_size'])
+    if 'max_size' in params:
+        query = query.filter(StorageUnit.size <= params['max_size'])
+    if 'min_rate' in params:
+        query = query.filter(StorageUnit.monthly_rate >= params['min_rate'])
+    if 'max_rate' in params:
+        query = query.filter(StorageUnit.monthly_rate <= params['max_rate'])
+    for name in params.get('features', ()):
+        # One correlated primary-key probe per requested feature
+        query = query.filter(exists().where(
+            UnitFeatureLink.unit_id == StorageUnit.unit_id,
+            UnitFeatureLink.feature_id == Feature.feature_id,
+            Feature.name == name,
+        ))
+    return query
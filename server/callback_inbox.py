@@ -0,0 +1,141 @@
+# Batched processing of the M-Pesa callback inbox.
+#
+# MpesaCallbackResource only inserts the callback into mpesa_callback (a duplicate
+# CheckoutRequestID is dropped by the unique constraint) and acknowledges it, so
+# Daraja gets its answer in one small write. Workers then claim unprocessed rows in
+# batches, load their payments with one query and apply each result once. A payment
+# that already has its final result is left alone, so a retried callback or one that
+# lost the race with a status query is a no-op. A callback that arrives before its
+# STK push was recorded (no payment has that CheckoutRequestID yet) is retried until
+# CALLBACK_UNMATCHED_TTL and then marked unmatched.
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
+
+from models import db, MpesaCallback, Payment
+
+
+def parse_callback(data):
+    """Inbox row values from a Daraja STK callback body; None if it has no CheckoutRequestID"""
+    body = ((data or {}).get('Body') or {}).get('stkCallback') or {}
+    checkout_request_id = body.get('CheckoutRequestID')
+    if not checkout_request_id:
+        return None
+    items = (body.get('CallbackMetadata') or {}).get('Item') or []
+    receipt_number = next((item.get('Value') for item in items if item.get('Name') == 'MpesaReceiptNumber'), None)
+    try:
+        result_code = int(body.get('ResultCode'))
+    except (TypeError, ValueError):
+        result_code = None
+    return {
+        'checkout_request_id': str(checkout_request_id),
+        'merchant_request_id': body.get('MerchantRequestID'),
+        'result_code': result_code,
+        'result_desc': (body.get('ResultDesc') or '')[:250],
+        'receipt_number': receipt_number,
+        'payload': json.dumps(data),
+        'received_at': datetime.utcnow(),
+    }
+
+
+class CallbackInbox:
+    def __init__(self, app=None):
+        self.app = None
+        self.batch_size = int(os.getenv('CALLBACK_BATCH_SIZE', '200'))
+        self.poll_interval = float(os.getenv('CALLBACK_POLL_INTERVAL', '2'))
+        self.retry_delay = timedelta(seconds=float(os.getenv('CALLBACK_RETRY_DELAY', '5')))
+        self.unmatched_ttl = timedelta(seconds=float(os.getenv('CALLBACK_UNMATCHED_TTL', '600')))
+        self.inline_worker = os.getenv('CALLBACK_INLINE_WORKER', '1') == '1'
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+
+        @app.cli.command('callback-worker')
+        def callback_worker():
+            """Apply inbox callbacks to payments in the foreground."""
+            self.run_forever()
+
+    def notify(self):
+        """Wake the worker after a callback was stored"""
+        if self.inline_worker:
+            self._ensure_started()
+        self._wake.set()
+
+    def _ensure_started(self):
+        # Threads do not survive a fork, so each gunicorn worker starts its own processor
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._thread = threading.Thread(target=self.run_forever, name='callback-inbox', daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def run_forever(self):
+        while True:
+            # Clear before draining so a callback stored mid-batch wakes us straight away
+            self._wake.clear()
+            try:
+                while self.drain_once():
+                    pass
+            except Exception as e:
+                logging.error(f"Callback inbox worker error: {str(e)}")
+            self._wake.wait(self.poll_interval)
+
+    def drain_once(self):
+        """Process one batch; returns False when nothing is ready"""
+        with self.app.app_context():
+            try:
+                return self._process_batch()
+            except Exception:
+                db.session.rollback()
+                raise
+
+    def _process_batch(self):
+        now = datetime.utcnow()
+        callbacks = MpesaCallback.query \
+            .filter(MpesaCallback.processed_at.is_(None),
+                    or_(MpesaCallback.retry_at.is_(None), MpesaCallback.retry_at <= now)) \
+            .order_by(MpesaCallback.callback_id) \
+            .with_for_update(skip_locked=True) \
+            .limit(self.batch_size).all()
+        if not callbacks:
+            db.session.commit()
+            return False
+
+        payments = {
+            payment.checkout_request_id: payment
+            for payment in Payment.query.options(joinedload(Payment.booking))
+            .filter(Payment.checkout_request_id.in_([callback.checkout_request_id for callback in callbacks]))
+        }
+        for callback in callbacks:
+            payment = payments.get(callback.checkout_request_id)
+            if payment is None:
+                if now - callback.received_at < self.unmatched_ttl:
+                    callback.retry_at = now + self.retry_delay
+                    continue
+                callback.outcome = 'unmatched'
+                logging.warning(f"No payment for M-Pesa callback {callback.checkout_request_id}")
+            elif payment.apply_mpesa_callback(callback):
+                callback.outcome = 'applied'
+                logging.info(f"Payment updated: {payment.payment_id} - Status: {payment.status}")
+            else:
+                callback.outcome = 'duplicate'
+            callback.processed_at = now
+        db.session.commit()
+        return True
+
+
+callback_inbox = CallbackInbox()
@@ -10,8 +10,39 @@ instance_path = os.path.join(basedir, "instance")
 os.makedirs(instance_path, exist_ok=True)
 
 
+def database_url(name):
+    url = os.environ.get(name)
+    # Managed Postgres hosts hand out postgres:// URLs, which SQLAlchemy no longer accepts
+    if url and url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def engine_options(url):
+    """Connection pool settings for the production (PostgreSQL) profile; SQLite keeps the defaults"""
+    if not url or not url.startswith('postgresql'):
+        return {}
+    options = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', '10')),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', '20')),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', '30')),
+        # Test connections on checkout so ones the server closed while idle are replaced
+        'pool_pre_ping': True,
+        # Recycle before the provider's idle timeout kills the connection
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', '1800')),
+    }
+    statement_timeout = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', '15000'))
+    if statement_timeout:
+        # Set to 0 behind PgBouncer in transaction mode, which rejects startup options
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    return options
+
+
 class Config:
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or f'sqlite:///{os.path.join(basedir, "instance", "storage.db")}'
+    SQLALCHEMY_DATABASE_URI = database_url('DATABASE_URL') or f'sqlite:///{os.path.join(basedir, "instance", "storage.db")}'
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    # Optional read replica; GET list endpoints read from it when configured
+    SQLALCHEMY_BINDS = {'replica': database_url('DATABASE_REPLICA_URL')} if database_url('DATABASE_REPLICA_URL') else {}
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-dev-secret-change-in-production'
@@ -0,0 +1,259 @@
+# Publish/subscribe for unit, booking and payment status changes, streamed to
+# browsers as Server-Sent Events.
+#
+# Events are read from the database rather than from the session that made the
+# change, so writes from other gunicorn workers, the CLI workers (stk-worker,
+# callback-worker, reconcile-payments) and bulk Core statements reach every
+# subscriber. Each process runs one ChangeFeed thread while it has subscribers: it
+# watches the change_version counters and, when one moves, reads the rows stamped
+# with a newer row_version and hands them to the in-process broker. On PostgreSQL
+# writers NOTIFY the change_version channel, so the feed wakes immediately; other
+# databases are polled every EVENTS_POLL_INTERVAL seconds. Deleted rows are not
+# streamed; admin views pick them up from the list ETags.
+#
+# Each subscriber holds a bounded queue and, for as long as it listens, one of the
+# worker's threads: under `gunicorn -k gthread --threads 50` a worker with 50 open
+# streams serves nothing else. The broker therefore admits at most
+# SSE_MAX_SUBSCRIBERS streams per worker (40 by default, leaving 10 of 50 threads for
+# the API) and /api/events answers 503 with Retry-After beyond that. Listeners scale
+# with workers x SSE_MAX_SUBSCRIBERS; for more, route /api/events to a separate
+# gunicorn with a large --threads and SSE_MAX_SUBSCRIBERS just below it, since an
+# idle stream thread costs little memory, only a slot.
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+
+from sqlalchemy import create_engine, select as sql_select
+from sqlalchemy.pool import NullPool
+
+from models import db, ChangeVersion, StorageUnit, Booking, Payment, CHANGE_VERSION_CHANNEL
+
+ADMIN_TOPIC = 'admin'
+
+
+def booking_topic(booking_id):
+    return f'booking:{booking_id}'
+
+
+class BrokerFull(Exception):
+    """Raised by subscribe when this worker already streams max_subscribers clients"""
+    pass
+
+
+class Subscription:
+    def __init__(self, topics, max_pending=100):
+        self.topics = set(topics)
+        self.events = queue.Queue(maxsize=max_pending)
+        self.active = True
+
+    def get(self, timeout):
+        """Next event, or None if nothing arrived within timeout seconds"""
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBroker:
+    def __init__(self, max_subscribers=None):
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+        self._count = 0
+
+    def subscribe(self, topics):
+        subscription = Subscription(topics)
+        with self._lock:
+            if self.max_subscribers is not None and self._count >= self.max_subscribers:
+                raise BrokerFull(f'{self._count} subscribers already')
+            self._count += 1
+            for topic in subscription.topics:
+                self._subscriptions.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Safe to call more than once for the same subscription"""
+        with self._lock:
+            if not subscription.active:
+                return
+            subscription.active = False
+            self._count -= 1
+            for topic in subscription.topics:
+                subscribers = self._subscriptions.get(topic)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[topic]
+
+    def has_subscribers(self):
+        with self._lock:
+            return bool(self._subscriptions)
+
+    def subscriber_count(self):
+        with self._lock:
+            return self._count
+
+    def publish(self, topics, payload):
+        with self._lock:
+            targets = set()
+            for topic in topics:
+                targets.update(self._subscriptions.get(topic, ()))
+        for subscription in targets:
+            try:
+                subscription.events.put_nowait(payload)
+            except queue.Full:
+                # Slow consumer: drop rather than grow memory; clients resync via ?since=
+                pass
+
+
+broker = EventBroker(max_subscribers=int(os.getenv('SSE_MAX_SUBSCRIBERS', '40')))
+
+
+def _payment_event(row):
+    return {'type': 'payment', 'action': 'changed', 'id': row.payment_id, 'booking_id': row.booking_id,
+            'status': row.status, 'version': row.row_version}
+
+
+def _booking_event(row):
+    return {'type': 'booking', 'action': 'changed', 'id': row.booking_id, 'booking_id': row.booking_id,
+            'unit_id': row.unit_id, 'status': row.status, 'version': row.row_version}
+
+
+def _unit_event(row):
+    return {'type': 'unit', 'action': 'changed', 'id': row.unit_id, 'status': row.status,
+            'version': row.row_version}
+
+
+# Table -> (columns read for its events, payload builder)
+FEEDS = {
+    'storageunit': ((StorageUnit.unit_id, StorageUnit.status, StorageUnit.row_version), _unit_event),
+    'booking': ((Booking.booking_id, Booking.unit_id, Booking.status, Booking.row_version), _booking_event),
+    'payment': ((Payment.payment_id, Payment.booking_id, Payment.status, Payment.row_version), _payment_event),
+}
+
+
+class ChangeFeed:
+    def __init__(self, app=None):
+        self.app = None
+        self.poll_interval = float(os.getenv('EVENTS_POLL_INTERVAL', '1'))
+        self.max_batch = int(os.getenv('EVENTS_MAX_BATCH', '500'))
+        self._versions = None
+        self._listener = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+
+    def ensure_started(self):
+        # Threads do not survive a fork, so each gunicorn worker runs its own feed
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._thread = threading.Thread(target=self.run_forever, name='change-feed', daemon=True)
+            self._pid = os.getpid()
+            self._listener = None
+            self._thread.start()
+
+    def run_forever(self):
+        while True:
+            try:
+                if broker.has_subscribers():
+                    self.poll_once()
+                else:
+                    # Nobody is listening; start from the current versions when someone is
+                    self._versions = None
+            except Exception as e:
+                logging.error(f"Change feed error: {str(e)}")
+            self._wait()
+
+    def poll_once(self):
+        """Publish events for rows changed since the last poll"""
+        with self.app.app_context():
+            versions = ChangeVersion.current(tuple(FEEDS))
+            if self._versions is None:
+                self._versions = versions
+                return
+            for table_name, (columns, build_event) in FEEDS.items():
+                last, current = self._versions[table_name], versions[table_name]
+                if current <= last:
+                    continue
+                row_version = columns[-1]
+                rows = db.session.execute(
+                    sql_select(*columns)
+                    .where(row_version > last, row_version <= current)
+                    .order_by(row_version)
+                    .limit(self.max_batch + 1)
+                ).all()
+                if len(rows) > self.max_batch:
+                    # A bulk change: tell admin views to reload instead of flooding the queues
+                    broker.publish([ADMIN_TOPIC], {'type': 'resync', 'table': table_name, 'version': current})
+                else:
+                    for row in rows:
+                        payload = build_event(row)
+                        topics = [ADMIN_TOPIC]
+                        if payload.get('booking_id'):
+                            topics.append(booking_topic(payload['booking_id']))
+                        broker.publish(topics, payload)
+                self._versions[table_name] = current
+
+    def _wait(self):
+        """Sleep until the next poll, waking early on a PostgreSQL NOTIFY"""
+        if self._listener is None and self._dialect() == 'postgresql':
+            try:
+                self._listener = self._listen()
+            except Exception as e:
+                logging.error(f"Change feed LISTEN failed, polling instead: {str(e)}")
+        if self._listener is None:
+            time.sleep(self.poll_interval)
+            return
+        connection = self._listener.driver_connection
+        try:
+            if select.select([connection], [], [], self.poll_interval)[0]:
+                connection.poll()
+                connection.notifies.clear()
+        except Exception as e:
+            logging.error(f"Change feed listener lost: {str(e)}")
+            self._listener.invalidate()
+            self._listener = None
+            time.sleep(self.poll_interval)
+
+    def _dialect(self):
+        with self.app.app_context():
+            return db.engine.dialect.name
+
+    def _listen(self):
+        # A connection of its own rather than one from the pool, since it stays in LISTEN
+        with self.app.app_context():
+            listener = create_engine(db.engine.url, poolclass=NullPool).raw_connection()
+        listener.driver_connection.autocommit = True
+        with listener.driver_connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {CHANGE_VERSION_CHANNEL}')
+        return listener
+
+
+change_feed = ChangeFeed()
+
+
+def sse_stream(subscription, heartbeat=15):
+    """Yield SSE frames for a broker subscription until the client disconnects"""
+    change_feed.ensure_started()
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            payload = subscription.get(timeout=heartbeat)
+            if payload is None:
+                yield ': keep-alive\n\n'
+                continue
+            yield f"event: {payload['type']}\ndata: {json.dumps(payload)}\n\n"
+    finally:
+        broker.unsubscribe(subscription)
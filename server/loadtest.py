@@ -0,0 +1,107 @@
+"""
+pgbench-style HTTP load test for sizing the database pool.
+
+Runs N concurrent clients against a mix of endpoints for a fixed duration and
+reports throughput and latency percentiles, like `pgbench -c N -T secs`.
+Run it against a deployment while varying DB_POOL_SIZE / DB_MAX_OVERFLOW (and
+gunicorn workers x threads): the pool is big enough once adding connections no
+longer raises tps, and too small while p99 grows with pool_timeout waits.
+
+    python loadtest.py --url http://localhost:5000 -c 50 -T 60
+    python loadtest.py -c 20 -T 30 --endpoint /api/units?limit=50 --endpoint /api/payments?limit=50
+"""
+import argparse
+import statistics
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+DEFAULT_ENDPOINTS = [
+    '/api/units?limit=50',
+    '/api/units?limit=50&fields=unit_id,unit_number,site,status,monthly_rate',
+    '/api/bookings?limit=50',
+    '/api/payments?limit=50',
+]
+
+
+def run_client(base_url, endpoints, deadline, headers, results, lock):
+    session = requests.Session()
+    local = defaultdict(list)
+    errors = defaultdict(int)
+    i = 0
+    while time.perf_counter() < deadline:
+        endpoint = endpoints[i % len(endpoints)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            response = session.get(base_url + endpoint, headers=headers, timeout=30)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - started
+        if ok:
+            local[endpoint].append(elapsed)
+        else:
+            errors[endpoint] += 1
+    with lock:
+        for endpoint, latencies in local.items():
+            results['latencies'][endpoint].extend(latencies)
+        for endpoint, count in errors.items():
+            results['errors'][endpoint] += count
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:5000', help='Base URL of the API')
+    parser.add_argument('-c', '--clients', type=int, default=10, help='Number of concurrent clients')
+    parser.add_argument('-T', '--time', type=int, default=30, help='Duration in seconds')
+    parser.add_argument('--endpoint', action='append', help='Endpoint to request (repeatable)')
+    parser.add_argument('--token', help='Bearer token for admin endpoints')
+    args = parser.parse_args()
+
+    endpoints = args.endpoint or DEFAULT_ENDPOINTS
+    headers = {'Authorization': f'Bearer {args.token}'} if args.token else {}
+    results = {'latencies': defaultdict(list), 'errors': defaultdict(int)}
+    lock = threading.Lock()
+
+    started = time.perf_counter()
+    deadline = started + args.time
+    clients = [
+        threading.Thread(target=run_client, args=(args.url, endpoints, deadline, headers, results, lock))
+        for _ in range(args.clients)
+    ]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    duration = time.perf_counter() - started
+
+    latencies = [value for values in results['latencies'].values() for value in values]
+    failed = sum(results['errors'].values())
+    print(f"number of clients: {args.clients}")
+    print(f"duration: {duration:.1f} s")
+    print(f"number of requests processed: {len(latencies)}")
+    print(f"number of failed requests: {failed}")
+    if latencies:
+        print(f"latency average = {statistics.mean(latencies) * 1000:.3f} ms")
+        print(f"latency stddev = {statistics.pstdev(latencies) * 1000:.3f} ms")
+        print(f"latency p50/p95/p99 = {percentile(latencies, 0.5) * 1000:.1f} / "
+              f"{percentile(latencies, 0.95) * 1000:.1f} / {percentile(latencies, 0.99) * 1000:.1f} ms")
+        print(f"tps = {len(latencies) / duration:.1f}")
+    print("per endpoint (requests, failures, average ms, p99 ms):")
+    for endpoint in endpoints:
+        values = results['latencies'].get(endpoint, [])
+        average = statistics.mean(values) * 1000 if values else 0
+        p99 = percentile(values, 0.99) * 1000 if values else 0
+        print(f"  {endpoint}: {len(values)}, {results['errors'].get(endpoint, 0)}, {average:.1f}, {p99:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+# Per-endpoint request instrumentation exposed in Prometheus text format on /metrics.
+#
+# For every request we record, labelled by Flask-RESTful endpoint and method: wall
+# time, time spent in the database and number of SQL statements (from SQLAlchemy
+# cursor events), response size and time spent waiting on Daraja. Metrics are kept
+# per process; scrape each gunicorn worker, or aggregate in Prometheus. Every Daraja
+# call is also timed on its own, including those made by the background workers.
+#
+# Set SLOW_REQUEST_MS to log requests slower than that, together with their SQL.
+#
+# /metrics needs `Authorization: Bearer $METRICS_TOKEN` when METRICS_TOKEN is set and
+# is only served to loopback clients otherwise.
+import hmac
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Statements kept per request for the slow request log
+MAX_LOGGED_STATEMENTS = 50
+
+
+class Histogram:
+    """Cumulative histogram keyed by a tuple of label values"""
+    def __init__(self, name, documentation, label_names, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in sorted(series.items()):
+            label_text = ','.join(f'{name}="{value}"' for name, value in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {values[-1]}')
+            lines.append(f'{self.name}_count{{{label_text}}} {cumulative}')
+        return '\n'.join(lines)
+
+
+class Counter:
+    def __init__(self, name, documentation, label_names):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            label_text = ','.join(f'{name}="{value}"' for name, value in zip(self.label_names, labels))
+            lines.append(f'{self.name}{{{label_text}}} {value}')
+        return '\n'.join(lines)
+
+
+REQUEST_LABELS = ('endpoint', 'method')
+
+requests_total = Counter('http_requests_total', 'Requests handled', REQUEST_LABELS + ('status',))
+request_seconds = Histogram('http_request_duration_seconds', 'Wall time per request',
+                            REQUEST_LABELS, SECONDS_BUCKETS)
+db_seconds = Histogram('http_request_db_seconds', 'Time spent executing SQL per request',
+                       REQUEST_LABELS, SECONDS_BUCKETS)
+sql_statements = Histogram('http_request_sql_statements', 'SQL statements executed per request',
+                           REQUEST_LABELS, COUNT_BUCKETS)
+response_bytes = Histogram('http_response_bytes', 'Response body size (streamed responses excluded)',
+                           REQUEST_LABELS, BYTES_BUCKETS)
+daraja_seconds = Histogram('http_request_daraja_seconds', 'Time spent waiting on Daraja per request',
+                           REQUEST_LABELS, SECONDS_BUCKETS)
+
+daraja_call_seconds = Histogram('daraja_call_duration_seconds', 'Duration of each Daraja HTTP call',
+                                ('path',), SECONDS_BUCKETS)
+
+METRICS = (requests_total, request_seconds, db_seconds, sql_statements, response_bytes, daraja_seconds,
+           daraja_call_seconds)
+
+LOOPBACK_ADDRESSES = frozenset(('127.0.0.1', '::1'))
+
+
+class RequestStats:
+    def __init__(self, keep_statements):
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.sql_count = 0
+        self.daraja_time = 0.0
+        self.statements = [] if keep_statements else None
+
+
+def _current_stats():
+    if has_request_context():
+        return g.get('request_stats')
+    return None
+
+
+def observe_daraja(path, seconds):
+    """Record a Daraja call to `path`, and add its time to the current request if there is one"""
+    daraja_call_seconds.observe((path,), seconds)
+    stats = _current_stats()
+    if stats is not None:
+        stats.daraja_time += seconds
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    stats = _current_stats()
+    if stats is None:
+        return
+    stats.db_time += elapsed
+    stats.sql_count += 1
+    if stats.statements is not None and len(stats.statements) < MAX_LOGGED_STATEMENTS:
+        stats.statements.append(f'{elapsed * 1000:.1f}ms {statement}')
+
+
+@event.listens_for(Engine, 'handle_error')
+def _discard_query_start(exception_context):
+    started = exception_context.connection.info.get('query_started') if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def _may_scrape(token):
+    if token:
+        supplied = request.headers.get('Authorization', '')
+        return hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode())
+    return request.remote_addr in LOOPBACK_ADDRESSES
+
+
+def init_app(app):
+    slow_request_ms = float(os.getenv('SLOW_REQUEST_MS', '0'))
+    metrics_token = os.getenv('METRICS_TOKEN')
+
+    @app.before_request
+    def start_request_stats():
+        g.request_stats = RequestStats(keep_statements=slow_request_ms > 0)
+
+    @app.after_request
+    def record_request_stats(response):
+        stats = g.pop('request_stats', None)
+        if stats is None or request.endpoint == 'metrics':
+            return response
+        elapsed = time.perf_counter() - stats.started
+        labels = (request.endpoint or 'unmatched', request.method)
+
+        requests_total.inc(labels + (str(response.status_code),))
+        request_seconds.observe(labels, elapsed)
+        db_seconds.observe(labels, stats.db_time)
+        sql_statements.observe(labels, stats.sql_count)
+        daraja_seconds.observe(labels, stats.daraja_time)
+        if not response.is_streamed:
+            response_bytes.observe(labels, response.calculate_content_length() or 0)
+
+        if slow_request_ms and elapsed * 1000 >= slow_request_ms:
+            logging.warning(
+                f"Slow request {request.method} {request.full_path} -> {response.status_code}: "
+                f"{elapsed * 1000:.0f}ms total, {stats.db_time * 1000:.0f}ms in {stats.sql_count} SQL statements, "
+                f"{stats.daraja_time * 1000:.0f}ms in Daraja\n" + '\n'.join(stats.statements)
+            )
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        if not _may_scrape(metrics_token):
+            return jsonify({'error': 'Access denied'}), 403
+        body = '\n\n'.join(metric.render() for metric in METRICS) + '\n'
+        return Response(body, mimetype='text/plain; version=0.0.4')
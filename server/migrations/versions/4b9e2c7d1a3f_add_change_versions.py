@@ -0,0 +1,41 @@
+"""add change versions
+
+Revision ID: 4b9e2c7d1a3f
+Revises: 280d5c49036c
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b9e2c7d1a3f'
+down_revision = '280d5c49036c'
+branch_labels = None
+depends_on = None
+
+VERSIONED_TABLES = ('storageunit', 'booking', 'payment', 'transportationrequest')
+
+
+def upgrade():
+    change_version = op.create_table('change_version',
+    sa.Column('table_name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    op.bulk_insert(change_version, [{'table_name': name, 'version': 0} for name in VERSIONED_TABLES])
+
+    for table_name in VERSIONED_TABLES:
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('row_version', sa.Integer(), nullable=False, server_default='0'))
+            batch_op.create_index(batch_op.f(f'ix_{table_name}_row_version'), ['row_version'], unique=False)
+
+
+def downgrade():
+    for table_name in reversed(VERSIONED_TABLES):
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.drop_index(batch_op.f(f'ix_{table_name}_row_version'))
+            batch_op.drop_column('row_version')
+
+    op.drop_table('change_version')
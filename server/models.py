@@ -1,10 +1,122 @@
 from datetime import datetime, date
+from flask import g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event, func, insert, inspect, select, update
 from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy_serializer import SerializerMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 
-db = SQLAlchemy()
+
+
+class RoutingSession(FlaskSession):
+    """Sends queries to the 'replica' bind for requests marked with g.use_replica.
+
+    Flushes always go to the primary, and without a configured replica every query does.
+    """
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() and g.get('use_replica'):
+            replica = self._db.engines.get('replica')
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# PostgreSQL channel notified (on commit) whenever a change version is claimed; see events.ChangeFeed
+CHANGE_VERSION_CHANNEL = 'change_version'
+
+
+class ChangeVersion(db.Model):
+    """Monotonically increasing change counter per versioned table"""
+    __tablename__ = "change_version"
+
+    table_name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+    @classmethod
+    def current(cls, table_names):
+        """Return {table_name: version} for the given tables (0 if never changed)"""
+        rows = db.session.execute(
+            select(cls.table_name, cls.version).where(cls.table_name.in_(table_names))
+        ).all()
+        versions = dict.fromkeys(table_names, 0)
+        versions.update(dict(rows))
+        return versions
+
+    @classmethod
+    def claim_next(cls, table_name):
+        """Next version of table_name, for rows written with bulk statements that skip before_flush"""
+        return _next_change_version(db.session.connection(), table_name)
+
+
+class VersionedMixin:
+    """Stamps each inserted or updated row with its table's next change version"""
+    row_version = db.Column(db.Integer, default=0, nullable=False, index=True)
+
+
+def _next_change_version(connection, table_name):
+    table = ChangeVersion.__table__
+    result = connection.execute(
+        update(table).where(table.c.table_name == table_name).values(version=table.c.version + 1)
+    )
+    if connection.dialect.name == 'postgresql':
+        # Delivered when the transaction commits, so listeners never see a version early
+        connection.execute(select(func.pg_notify(CHANGE_VERSION_CHANNEL, table_name)))
+    if result.rowcount == 0:
+        connection.execute(insert(table).values(table_name=table_name, version=1))
+        return 1
+    return connection.execute(
+        select(table.c.version).where(table.c.table_name == table_name)
+    ).scalar_one()
+
+
+@event.listens_for(Session, "before_flush")
+def _track_versioned_changes(session, flush_context, instances):
+    touched = session.info.setdefault('versioned_changes', {})
+    for obj in session.new:
+        if isinstance(obj, VersionedMixin):
+            touched.setdefault(obj.__tablename__, set()).add(obj)
+    for obj in session.dirty:
+        if isinstance(obj, VersionedMixin) and session.is_modified(obj, include_collections=False):
+            touched.setdefault(obj.__tablename__, set()).add(obj)
+    for obj in session.deleted:
+        if isinstance(obj, VersionedMixin):
+            touched.setdefault(obj.__tablename__, set())
+
+
+@event.listens_for(Session, "before_commit")
+def _stamp_change_versions(session):
+    # Versions are claimed as the last statements before COMMIT, so the counter row is
+    # locked only for the commit itself rather than for the whole transaction, while
+    # versions still become visible in the order they were handed out
+    session.flush()
+    touched = session.info.pop('versioned_changes', None)
+    if not touched:
+        return
+    connection = session.connection()
+    # Same table order in every transaction, so two writers cannot deadlock on the counters
+    for table_name in sorted(touched):
+        version = _next_change_version(connection, table_name)
+        objs = [obj for obj in touched[table_name] if inspect(obj).persistent]
+        if not objs:
+            continue
+        primary_key = inspect(type(objs[0])).primary_key[0]
+        connection.execute(
+            update(primary_key.table)
+            .where(primary_key.in_([inspect(obj).identity[0] for obj in objs]))
+            .values(row_version=version)
+        )
+        for obj in objs:
+            set_committed_value(obj, 'row_version', version)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_versioned_changes(session):
+    session.info.pop('versioned_changes', None)
 
 
 class User(db.Model, SerializerMixin):
@@ -39,15 +151,17 @@ class User(db.Model, SerializerMixin):
 
 
 class Admin(db.Model, SerializerMixin):
-    serialize_rules = ('-password_hash',)
+    serialize_rules = ('-password_hash', '-token_version')
     serialize_types = ((datetime, lambda x: x.isoformat()), (date, lambda x: x.isoformat()))
     __tablename__ = "admin"
 
     admin_id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(50), nullable=False)
+    username = db.Column(db.String(50), nullable=False, index=True)
     email = db.Column(db.String(100), nullable=False)
     password_hash = db.Column(db.String(200), nullable=False)
     role = db.Column(db.String(20), default="manager")
+    # Embedded in issued JWTs; bumping it revokes every outstanding token for this admin
+    token_version = db.Column(db.Integer, default=0, nullable=False, server_default="0")
 
     def set_password(self, password):
         if not password:
@@ -59,18 +173,21 @@ class Admin(db.Model, SerializerMixin):
             return False
         return check_password_hash(self.password_hash, password)
 
+    def revoke_tokens(self):
+        self.token_version = (self.token_version or 0) + 1
+
     def __repr__(self):
         return f"<Admin {self.username}>"
 
 
-class Customer(db.Model, SerializerMixin):
+class Customer(db.Model, SerializerMixin, VersionedMixin):
     serialize_rules = ('-bookings.customer', '-transport_requests.customer')
     serialize_types = ((datetime, lambda x: x.isoformat()), (date, lambda x: x.isoformat()))
     __tablename__ = "customer"
 
     customer_id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    email = db.Column(db.String(100), nullable=False)
+    email = db.Column(db.String(100), nullable=False, index=True)
     phone = db.Column(db.String(20), nullable=False)
     national_id = db.Column(db.String(50))
     address = db.Column(db.String(250))
@@ -114,17 +231,20 @@ class UnitFeatureLink(db.Model, SerializerMixin):
     _feature = db.relationship("Feature", back_populates="_unit_links")
 
 
-class StorageUnit(db.Model, SerializerMixin):
+class StorageUnit(db.Model, SerializerMixin, VersionedMixin):
     serialize_rules = ('-bookings.unit', '-_feature_links')
     serialize_types = ((datetime, lambda x: x.isoformat()), (date, lambda x: x.isoformat()))
     __tablename__ = "storageunit"
+    __table_args__ = (
+        db.Index("ix_storageunit_site_status", "site", "status"),
+    )
 
     unit_id = db.Column(db.Integer, primary_key=True)
     unit_number = db.Column(db.String(20), nullable=False)
     site = db.Column(db.String(50), nullable=False)
     size = db.Column(db.Numeric(5, 2), nullable=True)  # Size in square meters
     monthly_rate = db.Column(db.Numeric(8, 2), nullable=False)
-    status = db.Column(db.String(20), default="available", nullable=False)
+    status = db.Column(db.String(20), default="available", nullable=False, index=True)
     location = db.Column(db.String(100))
 
     bookings = db.relationship("Booking", back_populates="unit", cascade="all, delete-orphan")
@@ -139,15 +259,20 @@ class StorageUnit(db.Model, SerializerMixin):
         return f"<StorageUnit {self.unit_number} ({self.status})>"
 
 
-class Booking(db.Model, SerializerMixin):
+class Booking(db.Model, SerializerMixin, VersionedMixin):
     serialize_rules = ('-user.bookings', '-unit.bookings', '-customer.bookings', '-payment.booking', '-transport_requests.booking', '-customer', '-unit')
     serialize_types = ((datetime, lambda x: x.isoformat()), (date, lambda x: x.isoformat()))
     __tablename__ = "booking"
+    __table_args__ = (
+        db.Index("ix_booking_unit_id_status", "unit_id", "status"),
+        # Covers the date-overlap probe in availability.overlapping_bookings
+        db.Index("ix_booking_unit_id_dates", "unit_id", "start_date", "end_date", "status"),
+    )
 
     booking_id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.user_id", ondelete="CASCADE"), nullable=True)
     unit_id = db.Column(db.Integer, db.ForeignKey("storageunit.unit_id", ondelete="CASCADE"))
-    customer_id = db.Column(db.Integer, db.ForeignKey("customer.customer_id", ondelete="CASCADE"), nullable=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey("customer.customer_id", ondelete="CASCADE"), nullable=True, index=True)
     # Legacy customer details (kept for backward compatibility)
     customer_name = db.Column(db.String(100))
     customer_email = db.Column(db.String(100))
@@ -155,7 +280,7 @@ class Booking(db.Model, SerializerMixin):
     # Booking details
     start_date = db.Column(db.Date, nullable=False)
     end_date = db.Column(db.Date, nullable=False)
-    status = db.Column(db.String(20), default="pending", nullable=False)
+    status = db.Column(db.String(20), default="pending", nullable=False, index=True)
     approval_status = db.Column(db.String(20), default="pending_approval", nullable=False)
     total_cost = db.Column(db.Numeric(8, 2), nullable=False)
     booking_date = db.Column(db.DateTime, default=datetime.utcnow)
@@ -181,25 +306,28 @@ class Booking(db.Model, SerializerMixin):
         return f"<Booking {self.booking_id} - {self.status}>"
 
 
-class Payment(db.Model, SerializerMixin):
+class Payment(db.Model, SerializerMixin, VersionedMixin):
     serialize_rules = ('-booking.payment', '-user.payments')
     serialize_types = ((datetime, lambda x: x.isoformat()), (date, lambda x: x.isoformat()))
     __tablename__ = "payment"
 
     payment_id = db.Column(db.Integer, primary_key=True)
     # amazonq-ignore-next-line
-    booking_id = db.Column(db.Integer, db.ForeignKey("booking.booking_id", ondelete="CASCADE"))
+    booking_id = db.Column(db.Integer, db.ForeignKey("booking.booking_id", ondelete="CASCADE"), index=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.user_id", ondelete="CASCADE"), nullable=True)
     amount = db.Column(db.Numeric(10, 2), nullable=False)
     payment_method = db.Column(db.String(30))
     payment_date = db.Column(db.DateTime, default=datetime.utcnow)
-    status = db.Column(db.String(20), default="pending")
+    status = db.Column(db.String(20), default="pending", index=True)
     transaction_id = db.Column(db.String(200))
     # M-Pesa specific fields
     mpesa_receipt_number = db.Column(db.String(100))
-    checkout_request_id = db.Column(db.String(100))
+    checkout_request_id = db.Column(db.String(100), index=True)
     merchant_request_id = db.Column(db.String(100))
     phone_number = db.Column(db.String(20))
+    claimed_at = db.Column(db.DateTime)  # When an STK queue worker took the push; see stk_queue lease
+    dispatched_at = db.Column(db.DateTime)  # When the STK push was accepted by Daraja
+    reconciled_at = db.Column(db.DateTime)  # Last status query by the reconciler
 
     booking = db.relationship("Booking", back_populates="payment")
     user = db.relationship("User", back_populates="payments")
@@ -207,6 +335,31 @@ class Payment(db.Model, SerializerMixin):
     def __repr__(self):
         return f"<Payment {self.payment_id} - {self.status}>"
     
+    def apply_mpesa_result(self, result_code, receipt_number=None):
+        """Record a final M-Pesa result (from a callback or status query) on this payment and its booking"""
+        if str(result_code) == '0':
+            self.status = 'completed'
+            if receipt_number:
+                self.mpesa_receipt_number = receipt_number
+                self.transaction_id = receipt_number
+            if self.booking:
+                self.booking.status = 'paid'
+        else:
+            self.status = 'failed'
+
+    def apply_mpesa_callback(self, callback):
+        """Apply an inbox callback; False if the payment already has its final result"""
+        if self.status in ('completed', 'failed'):
+            if self.status == 'completed' and str(callback.result_code) == '0' \
+                    and callback.receipt_number and not self.mpesa_receipt_number:
+                # Settled by a status query, which carries no receipt; record the callback's
+                self.mpesa_receipt_number = callback.receipt_number
+                self.transaction_id = self.transaction_id or callback.receipt_number
+                return True
+            return False
+        self.apply_mpesa_result(callback.result_code, callback.receipt_number)
+        return True
+
     def update_from_mpesa_callback(self, callback_data):
         """Update payment from M-Pesa callback data"""
         self.mpesa_receipt_number = callback_data.get('mpesa_receipt_number')
@@ -214,7 +367,32 @@ class Payment(db.Model, SerializerMixin):
         self.status = 'completed' if callback_data.get('result_code') == 0 else 'failed'
 
 
-class TransportationRequest(db.Model, SerializerMixin):
+class MpesaCallback(db.Model, SerializerMixin):
+    """Append-only inbox of STK callbacks, one row per CheckoutRequestID.
+
+    Daraja retries are dropped by the unique constraint on insert; callback_inbox
+    applies unprocessed rows to their payments in batches.
+    """
+    serialize_types = ((datetime, lambda x: x.isoformat()),)
+    __tablename__ = "mpesa_callback"
+
+    callback_id = db.Column(db.Integer, primary_key=True)
+    checkout_request_id = db.Column(db.String(100), nullable=False, unique=True)
+    merchant_request_id = db.Column(db.String(100))
+    result_code = db.Column(db.Integer)
+    result_desc = db.Column(db.String(250))
+    receipt_number = db.Column(db.String(100))
+    payload = db.Column(db.Text)  # Raw callback body, kept for audits and replays
+    received_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    retry_at = db.Column(db.DateTime)  # Set while waiting for the payment to get its CheckoutRequestID
+    processed_at = db.Column(db.DateTime, index=True)
+    outcome = db.Column(db.String(20))  # applied, duplicate or unmatched
+
+    def __repr__(self):
+        return f"<MpesaCallback {self.checkout_request_id} - {self.outcome or 'unprocessed'}>"
+
+
+class TransportationRequest(db.Model, SerializerMixin, VersionedMixin):
     serialize_rules = ('-booking.transport_requests', '-user.transport_requests', '-customer.transport_requests')
     serialize_types = ((datetime, lambda x: x.isoformat()), (date, lambda x: x.isoformat()))
     __tablename__ = "transportationrequest"
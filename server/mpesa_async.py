@@ -0,0 +1,226 @@
+# Asyncio variant of MpesaService so one worker can keep hundreds of Daraja
+# requests in flight instead of blocking a thread per request.
+import asyncio  # For the background event loop and concurrency limits
+import os  # For accessing environment variables
+import random  # For jittered retry backoff
+import threading  # For running the event loop beside the WSGI worker
+import time  # For timing Daraja calls
+from urllib.parse import urlsplit  # For labelling Daraja timings by API path
+
+try:
+    import httpx  # Async HTTP client (optional; the sync MpesaService is used without it)
+except ImportError:
+    httpx = None
+
+from metrics import observe_daraja
+from mpesa_service import MpesaService, daraja_http, is_transaction_pending, token_cache
+
+
+async def _in_thread(fn, *args):
+    # The shared token file is written under a blocking flock, which must not stall the loop
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+class AsyncMpesaService(MpesaService):
+    """
+    Same credentials, payloads and result dicts as MpesaService, but every Daraja call is
+    awaited on a shared httpx.AsyncClient. Token caching, the circuit breaker and the retry
+    budget are shared with the sync client.
+    """
+    def __init__(self, client, token_lock=None):
+        super().__init__()
+        self.client = client
+        # Services sharing a loop pass one lock so a cold start fetches a single token
+        self._token_lock = token_lock or asyncio.Lock()
+
+    async def _request(self, method, url, idempotent=False, expected=None, **kwargs):
+        """Async counterpart of DarajaHttpClient.request"""
+        daraja_http.retry_budget.deposit()
+        attempt = 0
+        while True:
+            daraja_http.breaker.before_request()
+            started = time.perf_counter()
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.HTTPError as e:
+                daraja_http.breaker.record_failure()
+                # Only errors before the request was sent are safe to retry for an STK push
+                retryable = idempotent or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                if not daraja_http._should_retry(retryable, attempt):
+                    raise
+            except BaseException:
+                # Anything else, cancellation included, must still end a half-open trial
+                daraja_http.breaker.record_failure()
+                raise
+            else:
+                if response.status_code < 500 or (expected and expected(response)):
+                    daraja_http.breaker.record_success()
+                    return response
+                daraja_http.breaker.record_failure()
+                if not daraja_http._should_retry(idempotent, attempt):
+                    return response
+            finally:
+                observe_daraja(urlsplit(url).path, time.perf_counter() - started)
+            attempt += 1
+            await asyncio.sleep(random.uniform(0, daraja_http.backoff_base * (2 ** attempt)))
+
+    async def get_access_token(self):
+        """
+        Return a cached OAuth token, fetching a new one (once, for all waiting coroutines)
+        when it is missing or about to expire.
+
+        Returns:
+            str: Access token if successful, None if failed
+        """
+        token = token_cache.peek(self.token_cache_key)
+        if token:
+            return token
+        async with self._token_lock:
+            token = token_cache.peek(self.token_cache_key)
+            if token:
+                return token
+            try:
+                url = f'{self.base_url}/oauth/v1/generate?grant_type=client_credentials'
+                response = await self._request('GET', url, idempotent=True,
+                                               auth=(self.consumer_key, self.consumer_secret))
+                response.raise_for_status()
+                data = response.json()
+                token = data.get('access_token')
+                if not token:
+                    raise ValueError('No access_token in OAuth response')
+                await _in_thread(token_cache.put, self.token_cache_key, token, int(data.get('expires_in', 3599)))
+                return token
+            except Exception as e:
+                print(f"Error getting access token: {str(e)}")
+                return None
+
+    async def stk_push(self, phone_number, amount, account_reference, transaction_desc):
+        """
+        Initiate STK Push without blocking the calling thread.
+
+        Returns:
+            dict: Response with success status, checkout_request_id, and message
+        """
+        access_token = await self.get_access_token()
+        if not access_token:
+            return {'success': False, 'error': 'Failed to get access token'}
+
+        password, timestamp = self.generate_password()
+        payload = self.build_stk_push_payload(phone_number, amount, account_reference,
+                                              transaction_desc, password, timestamp)
+        headers = {'Authorization': f'Bearer {access_token}', 'Content-Type': 'application/json'}
+
+        try:
+            # Never retried once sent, to avoid double prompts on the customer's phone
+            response = await self._request('POST', f'{self.base_url}/mpesa/stkpush/v1/processrequest',
+                                           json=payload, headers=headers)
+            if response.status_code == 401:
+                await _in_thread(token_cache.invalidate, self.token_cache_key)
+            response.raise_for_status()
+            return self.parse_stk_push_response(response.json())
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+    async def query_stk_status(self, checkout_request_id):
+        """
+        Query the status of an STK Push transaction without blocking the calling thread.
+
+        Returns:
+            dict: Response with success status and transaction data
+        """
+        access_token = await self.get_access_token()
+        if not access_token:
+            return {'success': False, 'error': 'Failed to get access token'}
+
+        password, timestamp = self.generate_password()
+        payload = self.build_query_payload(checkout_request_id, password, timestamp)
+        headers = {'Authorization': f'Bearer {access_token}', 'Content-Type': 'application/json'}
+
+        try:
+            response = await self._request('POST', f'{self.base_url}/mpesa/stkpushquery/v1/query',
+                                           idempotent=True, expected=is_transaction_pending,
+                                           json=payload, headers=headers)
+            if response.status_code == 401:
+                await _in_thread(token_cache.invalidate, self.token_cache_key)
+            if not is_transaction_pending(response):
+                response.raise_for_status()
+            return {'success': True, 'data': response.json()}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+
+# httpcore matches every queued request against every pooled connection on each
+# request event, so one pool's CPU cost grows with the square of its size. Several small
+# pools keep 200 calls in flight at about twice the throughput of a single large one.
+CONNECTIONS_PER_CLIENT = 8
+
+
+class DarajaLoop:
+    """
+    One background event loop per worker that owns the AsyncClients. Request threads hand
+    Daraja calls to it, so all in-flight calls share one loop and its connections;
+    MPESA_MAX_IN_FLIGHT bounds how many run concurrently.
+    """
+    def __init__(self):
+        self.max_in_flight = int(os.getenv('MPESA_MAX_IN_FLIGHT', '200'))
+        self._loop = None
+        self._slots = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return httpx is not None
+
+    def _ensure_started(self):
+        # The loop thread does not survive a fork, so each gunicorn worker starts its own
+        if self._loop is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._loop is not None and self._pid == os.getpid():
+                return
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                token_lock = asyncio.Lock()
+                services = [
+                    AsyncMpesaService(httpx.AsyncClient(
+                        timeout=httpx.Timeout(daraja_http.read_timeout, connect=daraja_http.connect_timeout),
+                        limits=httpx.Limits(max_connections=CONNECTIONS_PER_CLIENT,
+                                            max_keepalive_connections=CONNECTIONS_PER_CLIENT)
+                    ), token_lock)
+                    for _ in range(-(-self.max_in_flight // CONNECTIONS_PER_CLIENT))
+                ]
+                # One slot per call allowed in flight, at most CONNECTIONS_PER_CLIENT per
+                # client; light load stays on the first clients and their warm connections
+                self._slots = asyncio.Queue()
+                for index in range(self.max_in_flight):
+                    self._slots.put_nowait(services[index // CONNECTIONS_PER_CLIENT])
+                ready.set()
+                loop.run_forever()
+
+            threading.Thread(target=run, name='daraja-loop', daemon=True).start()
+            ready.wait()
+            self._loop = loop
+            self._pid = os.getpid()
+
+    async def _call(self, method_name, args):
+        service = await self._slots.get()
+        try:
+            return await getattr(service, method_name)(*args)
+        finally:
+            self._slots.put_nowait(service)
+
+    def submit(self, method_name, *args):
+        """Schedule an AsyncMpesaService call; returns a concurrent.futures.Future"""
+        self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(self._call(method_name, args), self._loop)
+
+    def run(self, method_name, *args, timeout=None):
+        """Run an AsyncMpesaService call on the loop and wait for its result"""
+        return self.submit(method_name, *args).result(timeout)
+
+
+daraja_loop = DarajaLoop()
@@ -3,8 +3,361 @@ import requests  # For making HTTP API calls to M-Pesa
 import base64  # For encoding the password required by M-Pesa API
 from datetime import datetime  # For generating timestamps
 import os  # For accessing environment variables
+import json  # For reading/writing the shared token cache file
+import random  # For jittered retry backoff
+import threading  # For single-flight token refresh within a worker
+import time  # For tracking token expiry
+from contextlib import contextmanager
+from urllib.parse import urlsplit  # For labelling Daraja timings by API path
+from requests.adapters import HTTPAdapter  # For connection pool sizing
 from requests.auth import HTTPBasicAuth  # For OAuth authentication
 
+from metrics import observe_daraja  # For Daraja call timing
+
+try:
+    import fcntl  # For cross-process locking of the shared token cache (POSIX only)
+except ImportError:
+    fcntl = None
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Daraja while the circuit breaker is open"""
+    pass
+
+
+class CircuitBreaker:
+    """
+    Fails fast after `failure_threshold` consecutive Daraja failures, then lets a single
+    trial request through once `reset_timeout` seconds have passed.
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def before_request(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.time() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+                raise CircuitOpenError('M-Pesa service is temporarily unavailable, please try again shortly')
+            # Half-open: allow one trial request through
+            self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.time()
+
+
+# Daraja answers stkpushquery with HTTP 500 and this error code while the customer has
+# not acted on the prompt yet. It is the normal "still pending" answer, not an outage.
+TRANSACTION_PENDING_ERROR = '500.001.1001'
+
+
+def is_transaction_pending(response):
+    """True for Daraja's 'The transaction is being processed' stkpushquery response"""
+    if response.status_code != 500:
+        return False
+    try:
+        body = response.json()
+    except ValueError:
+        return False
+    return isinstance(body, dict) and body.get('errorCode') == TRANSACTION_PENDING_ERROR
+
+
+class RetryBudget:
+    """
+    Caps retries to a fraction of recent requests so retries cannot multiply load on a
+    struggling Daraja: each request earns `ratio` tokens, each retry spends one.
+    """
+    def __init__(self, ratio=0.1, min_tokens=3, max_tokens=20):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = float(min_tokens)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class DarajaHttpClient:
+    """
+    Connection-pooled, keep-alive HTTP client for Daraja shared by every MpesaService in a
+    worker. All calls get connect/read timeouts; idempotent calls are retried with jittered
+    exponential backoff within the retry budget, and the circuit breaker fails fast when
+    Daraja is degraded.
+    """
+    def __init__(self):
+        self.connect_timeout = float(os.getenv('MPESA_CONNECT_TIMEOUT', '3.05'))
+        self.read_timeout = float(os.getenv('MPESA_READ_TIMEOUT', '10'))
+        self.max_retries = int(os.getenv('MPESA_MAX_RETRIES', '2'))
+        self.backoff_base = float(os.getenv('MPESA_RETRY_BACKOFF', '0.2'))
+        self.pool_size = int(os.getenv('MPESA_POOL_SIZE', '20'))
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv('MPESA_BREAKER_THRESHOLD', '5')),
+            reset_timeout=float(os.getenv('MPESA_BREAKER_RESET', '30'))
+        )
+        self.retry_budget = RetryBudget()
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        # Sessions are not shared across a fork, so each gunicorn worker builds its own pool
+        if self._session is None or self._session_pid != os.getpid():
+            with self._session_lock:
+                if self._session is None or self._session_pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+                    self._session_pid = os.getpid()
+        return self._session
+
+    def request(self, method, url, idempotent=False, expected=None, **kwargs):
+        """
+        Send a request to Daraja.
+
+        Non-idempotent calls (STK push) are only retried when the connection could not be
+        established, so a push is never sent twice. 5xx responses for which expected(response)
+        is true are answers rather than failures: they are returned without a retry and do not
+        count against the circuit breaker.
+        """
+        kwargs.setdefault('timeout', (self.connect_timeout, self.read_timeout))
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            self.breaker.before_request()
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.breaker.record_failure()
+                retryable = idempotent or isinstance(e, requests.exceptions.ConnectTimeout)
+                if not self._should_retry(retryable, attempt):
+                    raise
+            except Exception:
+                # Anything else (ChunkedEncodingError, ContentDecodingError, ...) is not retried,
+                # but must still end a half-open trial or the breaker would never close again
+                self.breaker.record_failure()
+                raise
+            else:
+                if response.status_code < 500 or (expected and expected(response)):
+                    self.breaker.record_success()
+                    return response
+                self.breaker.record_failure()
+                if not self._should_retry(idempotent, attempt):
+                    return response
+            finally:
+                observe_daraja(urlsplit(url).path, time.perf_counter() - started)
+            attempt += 1
+            # Full jitter: sleep somewhere in [0, base * 2^attempt)
+            time.sleep(random.uniform(0, self.backoff_base * (2 ** attempt)))
+
+    def _should_retry(self, retryable, attempt):
+        return retryable and attempt < self.max_retries and self.retry_budget.withdraw()
+
+
+daraja_http = DarajaHttpClient()
+
+
+class FileTokenBackend:
+    """
+    Shared token store so every gunicorn worker on a host reuses one OAuth token.
+    Enabled by setting MPESA_TOKEN_CACHE_FILE to a writable path.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    @contextmanager
+    def lock(self):
+        # Hold an exclusive lock while refreshing so only one worker calls Daraja
+        with open(f'{self.path}.lock', 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def load(self, key):
+        try:
+            with open(self.path) as f:
+                entry = json.load(f).get(key)
+        except (OSError, ValueError):
+            return None, 0
+        if not entry:
+            return None, 0
+        return entry.get('token'), entry.get('expires_at', 0)
+
+    def store(self, key, token, expires_at):
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = {}
+        entries[key] = {'token': token, 'expires_at': expires_at}
+        # Write to a temp file and rename so readers never see a partial file
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
+
+
+class TokenCache:
+    """
+    Process-wide OAuth token cache shared by all MpesaService instances.
+    Tokens are reused until refresh_margin seconds before they expire, and concurrent
+    callers wait on a single refresh instead of each requesting a new token.
+    """
+    def __init__(self, refresh_margin=60, backend=None):
+        self.refresh_margin = refresh_margin
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._tokens = {}  # key -> (token, expires_at)
+
+    def _fresh(self, key):
+        token, expires_at = self._tokens.get(key, (None, 0))
+        if token and time.time() < expires_at - self.refresh_margin:
+            return token
+        return None
+
+    def get(self, key, fetch):
+        """
+        Return a valid token for key, calling fetch() -> (token, expires_in) only when needed.
+        """
+        # Fast path: no locking while the cached token is still fresh
+        token = self._fresh(key)
+        if token:
+            return token
+
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            token = self._fresh(key)
+            if token:
+                return token
+
+            if not self.backend:
+                return self._refresh(key, fetch)
+
+            with self.backend.lock():
+                # Another worker may have refreshed the shared token
+                token, expires_at = self.backend.load(key)
+                if token and time.time() < expires_at - self.refresh_margin:
+                    self._tokens[key] = (token, expires_at)
+                    return token
+                token = self._refresh(key, fetch)
+                self.backend.store(key, token, self._tokens[key][1])
+                return token
+
+    def _refresh(self, key, fetch):
+        token, expires_in = fetch()
+        self._tokens[key] = (token, time.time() + expires_in)
+        return token
+
+    def peek(self, key):
+        """Return the cached token for key if it is still fresh, without refreshing"""
+        token = self._fresh(key)
+        if token or not self.backend:
+            return token
+        token, expires_at = self.backend.load(key)
+        if token and time.time() < expires_at - self.refresh_margin:
+            with self._lock:
+                self._tokens[key] = (token, expires_at)
+            return token
+        return None
+
+    def put(self, key, token, expires_in):
+        """Store a token fetched outside get(), e.g. by the async client"""
+        expires_at = time.time() + expires_in
+        with self._lock:
+            self._tokens[key] = (token, expires_at)
+            if self.backend:
+                with self.backend.lock():
+                    self.backend.store(key, token, expires_at)
+
+    def invalidate(self, key):
+        """Drop a token Daraja rejected so the next call fetches a new one"""
+        with self._lock:
+            self._tokens.pop(key, None)
+            if self.backend:
+                with self.backend.lock():
+                    self.backend.store(key, None, 0)
+
+
+class StatusQueryCache:
+    """
+    Short-lived cache of stkpushquery results keyed by CheckoutRequestID. Concurrent lookups
+    for the same ID share one upstream call, so many pollers cost at most one Daraja query
+    per ID per `ttl` seconds.
+    """
+    def __init__(self, ttl=10, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._results = {}  # checkout_request_id -> (result, fetched_at)
+        self._in_flight = {}  # checkout_request_id -> threading.Event
+
+    def get(self, checkout_request_id, fetch):
+        while True:
+            with self._lock:
+                cached = self._results.get(checkout_request_id)
+                if cached and time.time() - cached[1] < self.ttl:
+                    return cached[0]
+                event = self._in_flight.get(checkout_request_id)
+                owner = event is None
+                if owner:
+                    event = self._in_flight[checkout_request_id] = threading.Event()
+            if not owner:
+                # Someone else is querying this ID; wait for their result and re-check
+                event.wait()
+                continue
+            try:
+                result = fetch(checkout_request_id)
+                with self._lock:
+                    if len(self._results) >= self.max_entries:
+                        self._prune()
+                    self._results[checkout_request_id] = (result, time.time())
+                return result
+            finally:
+                with self._lock:
+                    self._in_flight.pop(checkout_request_id, None)
+                event.set()
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        for key in [k for k, (_, fetched_at) in self._results.items() if fetched_at < cutoff]:
+            del self._results[key]
+
+
+status_query_cache = StatusQueryCache(ttl=float(os.getenv('MPESA_QUERY_CACHE_TTL', '10')))
+
+_token_cache_file = os.getenv('MPESA_TOKEN_CACHE_FILE')
+token_cache = TokenCache(backend=FileTokenBackend(_token_cache_file) if _token_cache_file else None)
+
 # Service class to handle all M-Pesa payment operations
 class MpesaService:
     def __init__(self):
@@ -29,30 +382,51 @@ class MpesaService:
         
         # Base URL for M-Pesa API endpoints
         # Sandbox: For testing without real money transactions
-        self.base_url = 'https://sandbox.safaricom.co.ke'
+        # MPESA_BASE_URL can point at a local mock Daraja server for testing
+        self.base_url = os.getenv('MPESA_BASE_URL', 'https://sandbox.safaricom.co.ke')
         # Production: Uncomment this when going live with real transactions
         # self.base_url = 'https://api.safaricom.co.ke'
         
-    def get_access_token(self):
+    @property
+    def token_cache_key(self):
+        # Tokens are scoped to the app credentials and environment they were issued for
+        return f'{self.base_url}|{self.consumer_key}'
+
+    def _request_access_token(self):
         """
-        Generate OAuth access token for authenticating M-Pesa API requests.
-        This token is required for all subsequent API calls and expires after 1 hour.
-        
+        Request a new OAuth token from Daraja.
+
         Returns:
-            str: Access token if successful, None if failed
+            tuple: (access_token, expires_in_seconds)
         """
         # Construct the OAuth endpoint URL
         url = f'{self.base_url}/oauth/v1/generate?grant_type=client_credentials'
+
+        # Make GET request with Basic Authentication (consumer_key:consumer_secret)
+        response = daraja_http.request('GET', url, idempotent=True,
+                                       auth=HTTPBasicAuth(self.consumer_key, self.consumer_secret))
+
+        # Raise exception if request failed (status code 4xx or 5xx)
+        response.raise_for_status()
+
+        data = response.json()
+        token = data.get('access_token')
+        if not token:
+            raise ValueError('No access_token in OAuth response')
+        # Daraja returns expires_in as a string of seconds (normally 3599)
+        return token, int(data.get('expires_in', 3599))
+
+    def get_access_token(self):
+        """
+        Return an OAuth access token for authenticating M-Pesa API requests.
+        Tokens expire after 1 hour, so they are cached process-wide (and optionally across
+        workers) and only requested from Daraja when missing or about to expire.
         
+        Returns:
+            str: Access token if successful, None if failed
+        """
         try:
-            # Make GET request with Basic Authentication (consumer_key:consumer_secret)
-            response = requests.get(url, auth=HTTPBasicAuth(self.consumer_key, self.consumer_secret))
-            
-            # Raise exception if request failed (status code 4xx or 5xx)
-            response.raise_for_status()
-            
-            # Extract and return the access token from JSON response
-            return response.json().get('access_token')
+            return token_cache.get(self.token_cache_key, self._request_access_token)
         except Exception as e:
             # Log error and return None if authentication fails
             print(f"Error getting access token: {str(e)}")
@@ -78,6 +452,62 @@ class MpesaService:
         # Return both the password and timestamp (timestamp needed in API payload)
         return encoded, timestamp
     
+    def build_stk_push_payload(self, phone_number, amount, account_reference, transaction_desc,
+                               password, timestamp):
+        """
+        Build the processrequest payload for an STK Push.
+
+        Returns:
+            dict: JSON body for /mpesa/stkpush/v1/processrequest
+        """
+        return {
+            'BusinessShortCode': self.business_short_code,  # Your paybill/till number
+            'Password': password,  # Base64 encoded password from generate_password()
+            'Timestamp': timestamp,  # Timestamp used in password generation
+            'TransactionType': 'CustomerPayBillOnline',  # Type of transaction (paybill)
+            'Amount': int(amount),  # Amount in KES (must be integer)
+            'PartyA': phone_number,  # Customer's phone number (payer)
+            'PartyB': self.business_short_code,  # Your business receiving the payment
+            'PhoneNumber': phone_number,  # Phone to receive the STK push prompt
+            'CallBackURL': self.callback_url,  # Where M-Pesa sends payment result
+            'AccountReference': account_reference,  # Your internal reference (e.g., invoice #)
+            'TransactionDesc': transaction_desc  # Description shown to customer
+        }
+
+    def parse_stk_push_response(self, result):
+        """
+        Convert a processrequest JSON response into the service's result dict.
+
+        Returns:
+            dict: Response with success status, checkout_request_id, and message
+        """
+        if result.get('ResponseCode') == '0':  # '0' means success
+            return {
+                'success': True,
+                'checkout_request_id': result.get('CheckoutRequestID'),  # Use this to query status
+                'merchant_request_id': result.get('MerchantRequestID'),  # M-Pesa's internal ID
+                'message': result.get('CustomerMessage')  # Message shown to customer
+            }
+        # STK push request was rejected by M-Pesa
+        return {
+            'success': False,
+            'error': result.get('errorMessage', 'STK Push failed')
+        }
+
+    def build_query_payload(self, checkout_request_id, password, timestamp):
+        """
+        Build the stkpushquery payload for a previously initiated STK Push.
+
+        Returns:
+            dict: JSON body for /mpesa/stkpushquery/v1/query
+        """
+        return {
+            'BusinessShortCode': self.business_short_code,  # Your business number
+            'Password': password,  # Base64 encoded password
+            'Timestamp': timestamp,  # Current timestamp
+            'CheckoutRequestID': checkout_request_id  # ID from the original STK push
+        }
+
     def stk_push(self, phone_number, amount, account_reference, transaction_desc):
         """
         Initiate STK Push (Lipa Na M-Pesa Online) - sends payment prompt to customer's phone.
@@ -110,40 +540,20 @@ class MpesaService:
         }
         
         # Step 5: Build the request payload with all required parameters
-        payload = {
-            'BusinessShortCode': self.business_short_code,  # Your paybill/till number
-            'Password': password,  # Base64 encoded password from step 2
-            'Timestamp': timestamp,  # Timestamp used in password generation
-            'TransactionType': 'CustomerPayBillOnline',  # Type of transaction (paybill)
-            'Amount': int(amount),  # Amount in KES (must be integer)
-            'PartyA': phone_number,  # Customer's phone number (payer)
-            'PartyB': self.business_short_code,  # Your business receiving the payment
-            'PhoneNumber': phone_number,  # Phone to receive the STK push prompt
-            'CallBackURL': self.callback_url,  # Where M-Pesa sends payment result
-            'AccountReference': account_reference,  # Your internal reference (e.g., invoice #)
-            'TransactionDesc': transaction_desc  # Description shown to customer
-        }
+        payload = self.build_stk_push_payload(phone_number, amount, account_reference,
+                                              transaction_desc, password, timestamp)
         
         try:
-            # Step 6: Send POST request to M-Pesa API
-            response = requests.post(url, json=payload, headers=headers)
+            # Step 6: Send POST request to M-Pesa API (never retried once sent, to avoid double prompts)
+            response = daraja_http.request('POST', url, json=payload, headers=headers)
+            if response.status_code == 401:
+                # Cached token was rejected (revoked or expired early); fetch a new one next time
+                token_cache.invalidate(self.token_cache_key)
             response.raise_for_status()  # Raise exception for HTTP errors
             result = response.json()  # Parse JSON response
             
             # Step 7: Check if STK push was successfully initiated
-            if result.get('ResponseCode') == '0':  # '0' means success
-                return {
-                    'success': True,
-                    'checkout_request_id': result.get('CheckoutRequestID'),  # Use this to query status
-                    'merchant_request_id': result.get('MerchantRequestID'),  # M-Pesa's internal ID
-                    'message': result.get('CustomerMessage')  # Message shown to customer
-                }
-            else:
-                # STK push request was rejected by M-Pesa
-                return {
-                    'success': False,
-                    'error': result.get('errorMessage', 'STK Push failed')
-                }
+            return self.parse_stk_push_response(result)
         except Exception as e:
             # Handle network errors, timeouts, or other exceptions
             return {'success': False, 'error': str(e)}
@@ -177,19 +587,18 @@ class MpesaService:
         }
         
         # Step 5: Build payload with transaction identifier
-        payload = {
-            'BusinessShortCode': self.business_short_code,  # Your business number
-            'Password': password,  # Base64 encoded password
-            'Timestamp': timestamp,  # Current timestamp
-            'CheckoutRequestID': checkout_request_id  # ID from the original STK push
-        }
+        payload = self.build_query_payload(checkout_request_id, password, timestamp)
         
         try:
-            # Step 6: Send query request to M-Pesa
-            response = requests.post(url, json=payload, headers=headers)
-            response.raise_for_status()
+            # Step 6: Send query request to M-Pesa (read-only, so safe to retry)
+            response = daraja_http.request('POST', url, idempotent=True, expected=is_transaction_pending,
+                                           json=payload, headers=headers)
+            if response.status_code == 401:
+                token_cache.invalidate(self.token_cache_key)
+            if not is_transaction_pending(response):
+                response.raise_for_status()
             
-            # Return the transaction status data
+            # Return the transaction status data (no ResultCode while it is still being processed)
             # Response includes: ResultCode, ResultDesc, and transaction details
             return {'success': True, 'data': response.json()}
         except Exception as e:
@@ -0,0 +1,177 @@
+# Reconciliation of STK pushes whose callback never arrived.
+#
+# Every RECONCILE_INTERVAL seconds the sweeper looks for payments still 'pending'
+# with a CheckoutRequestID, dispatched more than RECONCILE_MIN_AGE_MINUTES ago, and
+# asks Daraja for their status (stkpushquery), RECONCILE_CONCURRENCY at a time and at
+# most RECONCILE_RATE queries per second. Final results are applied to the payment and
+# its booking like a callback would be; anything else leaves the payment pending.
+#
+# Each payment is claimed by stamping reconciled_at before it is queried. That stamp is
+# the checkpoint: a restarted or concurrent sweeper skips payments queried within the
+# last RECONCILE_REQUERY_MINUTES, so a backlog of thousands is worked through once per
+# window rather than from the start on every run. Payments older than
+# RECONCILE_MAX_AGE_HOURS are left for manual follow-up.
+#
+# Run one sweeper per deployment: `flask reconcile-worker` as its own process, or
+# `flask reconcile-payments` from cron. RECONCILE_INLINE_WORKER=1 instead starts a
+# sweeper thread in every web worker process, which only suits single-process setups.
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import func, or_, update
+
+from models import db, Payment
+from mpesa_service import MpesaService
+from mpesa_async import daraja_loop
+from stk_queue import RateLimiter
+
+
+class PaymentReconciler:
+    def __init__(self, app=None):
+        self.app = None
+        self.batch_size = int(os.getenv('RECONCILE_CONCURRENCY', '5'))
+        self.interval = float(os.getenv('RECONCILE_INTERVAL', '60'))
+        self.min_age = timedelta(minutes=float(os.getenv('RECONCILE_MIN_AGE_MINUTES', '10')))
+        self.requery_after = timedelta(minutes=float(os.getenv('RECONCILE_REQUERY_MINUTES', '30')))
+        self.max_age = timedelta(hours=float(os.getenv('RECONCILE_MAX_AGE_HOURS', '48')))
+        self.rate_limiter = RateLimiter(float(os.getenv('RECONCILE_RATE', '2')))
+        self.inline_worker = os.getenv('RECONCILE_INLINE_WORKER', '0') == '1'
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+
+        @app.cli.command('reconcile-payments')
+        def reconcile_payments():
+            """Query Daraja once for every stale pending payment (for cron)."""
+            counts = self.sweep()
+            click.echo(f"Reconciled {counts['applied']} of {counts['queried']} stale payments "
+                       f"({counts['unresolved']} still pending)")
+
+        @app.cli.command('reconcile-worker')
+        def reconcile_worker():
+            """Sweep stale pending payments every RECONCILE_INTERVAL seconds in the foreground."""
+            self.run_forever()
+
+        if self.inline_worker:
+            app.before_request(self._ensure_started)
+
+    def _ensure_started(self):
+        # Threads do not survive a fork, so each gunicorn worker starts its own sweeper;
+        # the claims keep them from querying the same payment, but the rate limit is per process
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._thread = threading.Thread(target=self.run_forever, name='payment-reconciler', daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def run_forever(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logging.error(f"Payment reconciler error: {str(e)}")
+            time.sleep(self.interval)
+
+    def sweep(self):
+        """Work through all stale pending payments; returns counts of what happened"""
+        counts = {'queried': 0, 'applied': 0, 'unresolved': 0}
+        with self.app.app_context():
+            while True:
+                jobs = self._claim()
+                if not jobs:
+                    break
+                pending = []
+                for job in jobs:
+                    self.rate_limiter.acquire()
+                    pending.append((job, self._dispatch(job)))
+                failures = 0
+                for job, future in pending:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {'success': False, 'error': str(e)}
+                    counts['queried'] += 1
+                    if self._complete(job, result):
+                        counts['applied'] += 1
+                    else:
+                        counts['unresolved'] += 1
+                    failures += not result.get('success')
+                if failures == len(pending):
+                    # Daraja is down or the circuit is open; resume from the checkpoint next run
+                    logging.warning(f"Payment reconciler stopping early: {failures} status queries failed")
+                    break
+        if counts['queried']:
+            logging.info(f"Payment reconciler: {counts}")
+        return counts
+
+    def _claim(self):
+        now = datetime.utcnow()
+        sent_at = func.coalesce(Payment.dispatched_at, Payment.payment_date)
+        stale = (
+            Payment.status == 'pending',
+            Payment.checkout_request_id.isnot(None),
+            sent_at < now - self.min_age,
+            sent_at > now - self.max_age,
+            or_(Payment.reconciled_at.is_(None), Payment.reconciled_at < now - self.requery_after),
+        )
+        candidates = db.session.query(Payment.payment_id, Payment.checkout_request_id) \
+            .filter(*stale) \
+            .order_by(Payment.payment_id) \
+            .with_for_update(skip_locked=True) \
+            .limit(self.batch_size).all()
+
+        jobs = []
+        for candidate in candidates:
+            # Conditional update so concurrent sweepers never query the same payment twice
+            claimed = db.session.execute(
+                update(Payment.__table__)
+                .where(Payment.payment_id == candidate.payment_id, *stale)
+                .values(reconciled_at=now)
+            ).rowcount
+            if claimed:
+                jobs.append(candidate)
+        db.session.commit()
+        return jobs
+
+    def _dispatch(self, job):
+        if daraja_loop.available:
+            return daraja_loop.submit('query_stk_status', job.checkout_request_id)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.batch_size, thread_name_prefix='reconcile')
+        return self._executor.submit(MpesaService().query_stk_status, job.checkout_request_id)
+
+    def _complete(self, job, result):
+        """Apply a final Daraja result; False if the payment stays pending"""
+        result_code = (result.get('data') or {}).get('ResultCode')
+        if not result.get('success') or result_code is None:
+            return False
+        try:
+            payment = db.session.get(Payment, job.payment_id)
+            # The callback may have landed while we were asking
+            if not payment or payment.status != 'pending':
+                return False
+            payment.apply_mpesa_result(result_code)
+            db.session.commit()
+            logging.info(f"Payment reconciled: {payment.payment_id} - Status: {payment.status}")
+            return True
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error reconciling payment {job.payment_id}: {str(e)}")
+            return False
+
+
+payment_reconciler = PaymentReconciler()
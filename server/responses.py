@@ -0,0 +1,166 @@
+# JSON encoding and compression for API responses.
+#
+# Resources return dicts that Flask-RESTful encodes through output_json below, and
+# jsonify()/request.get_json() go through FastJSONProvider. Both use orjson when it is
+# installed (compact output, several times faster than the stdlib encoder) and fall
+# back to json otherwise; JSON_BACKEND=json forces the stdlib. Values to_dict() would
+# have converted are rendered the same way here: dates and datetimes as ISO strings,
+# times as HH:MM and Decimals as strings.
+#
+# Responses of at least COMPRESS_MIN_BYTES in a text type are compressed with brotli
+# (if installed) or gzip, whichever the client accepts, preferring brotli. Streamed
+# responses (exports, server-sent events) are sent as they are. Compression runs
+# before the metrics hook, so http_response_bytes records bytes on the wire.
+#
+# stream_export() writes export rows as NDJSON with the same encoder, or as CSV.
+import csv
+import gzip
+import io
+import json
+import os
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from flask import make_response, request
+from flask.json.provider import DefaultJSONProvider
+
+from serializers import format_datetime, format_decimal, format_time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = frozenset((
+    'application/json', 'application/x-ndjson', 'application/javascript',
+    'text/csv', 'text/plain', 'text/html', 'text/css',
+))
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return format_datetime(value)
+    if isinstance(value, time):
+        return format_time(value)
+    if isinstance(value, Decimal):
+        return format_decimal(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+if orjson is not None and os.getenv('JSON_BACKEND', 'orjson') == 'orjson':
+    # Dates and times go through _default so they match to_dict() rather than orjson's RFC 3339
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def dumps(data):
+        return orjson.dumps(data, default=_default, option=_ORJSON_OPTIONS)
+
+    loads = orjson.loads
+else:
+    def dumps(data):
+        return json.dumps(data, default=_default, separators=(',', ':')).encode()
+
+    loads = json.loads
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider (jsonify, request.get_json) backed by dumps/loads above"""
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
+
+
+def output_json(data, code, headers=None):
+    """Flask-RESTful representation for application/json"""
+    response = make_response(dumps(data), code)
+    response.mimetype = 'application/json'
+    response.headers.extend(headers or {})
+    return response
+
+
+def stream_export(serializer, rows, fmt='ndjson', chunk_size=1000):
+    """Yield NDJSON or CSV in chunks from an iterable of result rows.
+
+    Rows are converted and written chunk_size at a time, so memory stays flat no matter
+    how many rows the (server-side) cursor produces.
+    """
+    writer = buffer = None
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(serializer.keys)
+
+    pending = []
+    for row in rows:
+        pending.append(row)
+        if len(pending) >= chunk_size:
+            yield _encode_chunk(serializer, pending, buffer, writer)
+            pending = []
+    if pending or writer:
+        yield _encode_chunk(serializer, pending, buffer, writer)
+
+
+def _encode_chunk(serializer, rows, buffer, writer):
+    records = serializer(rows)
+    if writer is None:
+        return b''.join([dumps(record) + b'\n' for record in records])
+    writer.writerows([record[key] for key in serializer.keys] for record in records)
+    chunk = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return chunk
+
+
+def _negotiate(accept_encodings):
+    """Best encoding the client accepts: br over gzip on equal preference; None for identity"""
+    gzip_quality = accept_encodings.quality('gzip')
+    if brotli is not None:
+        brotli_quality = accept_encodings.quality('br')
+        if brotli_quality and brotli_quality >= gzip_quality:
+            return 'br'
+    return 'gzip' if gzip_quality else None
+
+
+def init_app(app, api):
+    min_bytes = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+    gzip_level = int(os.getenv('COMPRESS_GZIP_LEVEL', '6'))
+    brotli_quality = int(os.getenv('COMPRESS_BROTLI_QUALITY', '4'))
+
+    app.json = FastJSONProvider(app)
+    api.representations['application/json'] = output_json
+
+    @app.after_request
+    def compress_response(response):
+        if (response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        if (response.content_length or 0) < min_bytes:
+            return response
+        encoding = _negotiate(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        body = response.get_data()
+        if encoding == 'br':
+            compressed = brotli.compress(body, quality=brotli_quality)
+        else:
+            compressed = gzip.compress(body, compresslevel=gzip_level, mtime=0)
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        # The compressed body is a different representation, so its validator becomes weak
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
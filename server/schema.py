@@ -1,17 +1,20 @@
 # Input validation functions (replacing marshmallow schemas)
-from datetime import date, datetime
+from datetime import date, datetime, time
 import re
 
 class ValidationError(Exception):
-    pass
+    """str() is the first problem found; messages lists all of them"""
+    def __init__(self, message, messages=None):
+        super().__init__(message)
+        self.messages = messages or [message]
 
 def validate_admin_login(data):
     """Validate admin login input"""
-    if not data or 'username' not in data or 'password' not in data:
+    if not isinstance(data, dict) or 'username' not in data or 'password' not in data:
         raise ValidationError('Username and password are required')
 
-    username = data['username'].strip()
-    password = data['password']
+    username = data['username'].strip() if isinstance(data['username'], str) else ''
+    password = data['password'] if isinstance(data['password'], str) else ''
 
     if not username or len(username) < 1 or len(username) > 50:
         raise ValidationError('Username must be between 1 and 50 characters')
@@ -21,295 +24,436 @@ def validate_admin_login(data):
 
     return {'username': username, 'password': password}
 
-def validate_storage_unit(data, partial=False):
-    """Validate storage unit input"""
-    if not data:
-        raise ValidationError('No data provided')
-
-    result = {}
-
-    # Required fields
-    if not partial or 'unit_number' in data:
-        unit_number = data.get('unit_number', '').strip()
-        if not unit_number or len(unit_number) < 1 or len(unit_number) > 20:
-            raise ValidationError('Unit number must be between 1 and 20 characters')
-        result['unit_number'] = unit_number
-
-    if not partial or 'site' in data:
-        site = data.get('site', '').strip()
-        if not site or len(site) < 1 or len(site) > 50:
-            raise ValidationError('Site must be between 1 and 50 characters')
-        result['site'] = site
-
-    if not partial or 'monthly_rate' in data:
-        monthly_rate = data.get('monthly_rate')
-        if monthly_rate is None:
-            raise ValidationError('Monthly rate is required')
+# Declarative payload specs, built once at import. Each Field names a key and a
+# rule for parsing it. Rules are closures with their messages and limits bound when
+# the spec is built, and Spec.check() runs them in one loop over the fields.
+# check() collects every message instead of stopping at the first, which lets
+# validate_many() report all problems in a batch in one pass.
+MISSING = object()
+
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
+
+class Field:
+    """One key of a payload.
+
+    `rule(value)` returns (parsed value, None) or (None, message); rules report problems
+    rather than raising, because a batch full of bad rows would otherwise spend most of
+    its time unwinding exceptions. `required` is the message for a missing value (None
+    if optional); optional fields take `default` (a callable builds a fresh value) or
+    are left out. None counts as missing unless keep_none is set.
+    """
+    def __init__(self, key, rule, required=None, default=MISSING, keep_none=False):
+        self.key = key
+        self.rule = rule
+        self.required = required
+        self.default = default
+        self.keep_none = keep_none
+
+
+class Spec:
+    def __init__(self, fields, checks=()):
+        self.fields = tuple(fields)
+        # check(result, today) returns a message or None; skipped when a key it reads failed to parse
+        self.checks = tuple(checks)
+        self.check = self._compile()
+
+    def _compile(self):
+        # Plain tuples, unpacked in the loop, are cheaper than attribute lookups per record
+        fields = tuple((field.key, field.rule, field.required, field.default, field.default is not MISSING,
+                        callable(field.default), field.keep_none) for field in self.fields)
+        checks = self.checks
+
+        def check(data, partial=False, today=None):
+            """Return (result, messages) for one record; partial skips absent required fields and defaults"""
+            result = {}
+            messages = []
+            get = data.get
+            for key, rule, required, default, has_default, fresh, keep_none in fields:
+                value = get(key)
+                if value is not None:
+                    value, message = rule(value)
+                    if message is None:
+                        result[key] = value
+                    else:
+                        messages.append(message)
+                elif keep_none and key in data:
+                    result[key] = None
+                elif required and not (partial and key not in data):
+                    messages.append(required)
+                elif has_default and not partial:
+                    result[key] = default() if fresh else default
+            if checks:
+                if today is None:
+                    today = date.today()
+                for rule in checks:
+                    try:
+                        message = rule(result, today)
+                    except KeyError:
+                        continue
+                    if message:
+                        messages.append(message)
+            return result, messages
+        return check
+
+    def validate(self, data, partial=False):
+        """Validated record, or ValidationError carrying every message"""
+        if not data:
+            raise ValidationError('No data provided')
+        if not isinstance(data, dict):
+            raise ValidationError('Expected a JSON object')
+        result, messages = self.check(data, partial)
+        if messages:
+            raise ValidationError(messages[0], messages)
+        return result
+
+
+def validate_many(spec, records, partial=False):
+    """Validate a batch; returns ([(index, result)], [{'row': index, 'error': ..., 'messages': [...]}])"""
+    check = spec.check
+    today = date.today()
+    valid, errors = [], []
+    for index, record in enumerate(records):
+        if isinstance(record, dict):
+            result, messages = check(record, partial, today)
+        else:
+            messages = ['Each record must be an object']
+        if messages:
+            errors.append({'row': index, 'error': messages[0], 'messages': messages})
+        else:
+            valid.append((index, result))
+    return valid, errors
+
+
+def text(message, max_length, min_length=1, pattern=None):
+    match = pattern.match if pattern is not None else None
+
+    def rule(value):
+        if isinstance(value, str):
+            value = value.strip()
+            if min_length <= len(value) <= max_length and (match is None or match(value)):
+                return value, None
+        return None, message
+    return rule
+
+
+def number(label, minimum=0):
+    invalid = f'{label} must be a valid number'
+    below = f'{label} must be non-negative' if minimum == 0 else f'{label} must be at least {minimum}'
+
+    def rule(value):
         try:
-            monthly_rate = float(monthly_rate)
-            if monthly_rate < 0:
-                raise ValidationError('Monthly rate must be non-negative')
+            value = float(value)
         except (ValueError, TypeError):
-            raise ValidationError('Monthly rate must be a valid number')
-        result['monthly_rate'] = monthly_rate
+            return None, invalid
+        if value >= minimum:
+            return value, None
+        return None, below
+    return rule
 
-    # Optional fields
-    if 'size' in data:
-        size = data['size']
-        if size is not None:
-            try:
-                size = float(size)
-                if size < 0:
-                    raise ValidationError('Size must be non-negative')
-            except (ValueError, TypeError):
-                raise ValidationError('Size must be a valid number')
-        result['size'] = size
-
-    if 'status' in data:
-        status = data['status']
-        if status not in ['available', 'booked']:
-            raise ValidationError('Status must be either available or booked')
-        result['status'] = status
-    else:
-        result['status'] = 'available'
-
-    if 'location' in data:
-        location = data.get('location', '').strip()
-        if len(location) > 100:
-            raise ValidationError('Location must be at most 100 characters')
-        result['location'] = location
-
-    if 'features' in data:
-        features = data['features']
-        if not isinstance(features, list):
-            raise ValidationError('Features must be a list')
-        result['features'] = [str(f).strip() for f in features]
-    else:
-        result['features'] = []
 
-    return result
+def positive_int(label):
+    invalid = f'{label} must be a valid integer'
+    not_positive = f'{label} must be a positive integer'
 
-def validate_booking(data):
-    """Validate booking input"""
-    if not data:
-        raise ValidationError('No data provided')
+    def rule(value):
+        try:
+            value = int(value)
+        except (ValueError, TypeError):
+            return None, invalid
+        if value > 0:
+            return value, None
+        return None, not_positive
+    return rule
 
-    result = {}
 
-    # Required fields
-    if 'unit_id' not in data:
-        raise ValidationError('Unit ID is required')
-    try:
-        unit_id = int(data['unit_id'])
-        if unit_id <= 0:
-            raise ValidationError('Unit ID must be a positive integer')
-    except (ValueError, TypeError):
-        raise ValidationError('Unit ID must be a valid integer')
-    result['unit_id'] = unit_id
-
-    customer_name = data.get('customer_name', '').strip()
-    if not customer_name or len(customer_name) < 1 or len(customer_name) > 100:
-        raise ValidationError('Customer name must be between 1 and 100 characters')
-    result['customer_name'] = customer_name
-
-    customer_email = data.get('customer_email', '').strip()
-    email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    if not customer_email or len(customer_email) > 100 or not re.match(email_pattern, customer_email):
-        raise ValidationError('Valid email is required and must be at most 100 characters')
-    result['customer_email'] = customer_email
-
-    customer_phone = data.get('customer_phone', '').strip()
-    if not customer_phone or len(customer_phone) < 1 or len(customer_phone) > 20:
-        raise ValidationError('Customer phone must be between 1 and 20 characters')
-    result['customer_phone'] = customer_phone
-
-    # Date validation
-    try:
-        start_date = datetime.fromisoformat(data['start_date']).date() if isinstance(data['start_date'], str) else data['start_date']
-        end_date = datetime.fromisoformat(data['end_date']).date() if isinstance(data['end_date'], str) else data['end_date']
-    except (ValueError, TypeError):
-        raise ValidationError('Invalid date format')
-
-    if start_date >= end_date:
-        raise ValidationError('End date must be after start date')
-    if start_date < date.today():
-        raise ValidationError('Start date cannot be in the past')
+def choice(options, message):
+    options = frozenset(options)
 
-    result['start_date'] = start_date
-    result['end_date'] = end_date
+    def rule(value):
+        try:
+            if value in options:
+                return value, None
+        except TypeError:
+            # Unhashable JSON values (objects, arrays) are never one of the options
+            pass
+        return None, message
+    return rule
+
+
+def iso_date(message):
+    def rule(value):
+        if isinstance(value, str):
+            try:
+                # Plain dates take the fast path; full timestamps are cut to their date
+                value = date.fromisoformat(value) if len(value) == 10 else datetime.fromisoformat(value).date()
+            except ValueError:
+                return None, message
+            return value, None
+        if isinstance(value, datetime):
+            return value.date(), None
+        if isinstance(value, date):
+            return value, None
+        return None, message
+    return rule
+
+
+def iso_time(message):
+    def rule(value):
+        if isinstance(value, time):
+            return value, None
+        try:
+            return datetime.fromisoformat(value).time(), None
+        except (ValueError, TypeError):
+            return None, message
+    return rule
+
+
+def string_list(message):
+    def rule(value):
+        if isinstance(value, list):
+            return [str(item).strip() for item in value], None
+        return None, message
+    return rule
+
+
+def _not_in_past(key, message):
+    return lambda result, today: message if result[key] < today else None
+
+
+STORAGE_UNIT_SPEC = Spec([
+    Field('unit_number', text('Unit number must be between 1 and 20 characters', 20),
+          required='Unit number must be between 1 and 20 characters'),
+    Field('site', text('Site must be between 1 and 50 characters', 50),
+          required='Site must be between 1 and 50 characters'),
+    Field('monthly_rate', number('Monthly rate'), required='Monthly rate is required'),
+    Field('size', number('Size'), keep_none=True),
+    Field('status', choice(('available', 'booked'), 'Status must be either available or booked'),
+          default='available'),
+    Field('location', text('Location must be at most 100 characters', 100, min_length=0)),
+    Field('features', string_list('Features must be a list'), default=list),
+])
+
+BOOKING_SPEC = Spec([
+    Field('unit_id', positive_int('Unit ID'), required='Unit ID is required'),
+    Field('customer_name', text('Customer name must be between 1 and 100 characters', 100),
+          required='Customer name must be between 1 and 100 characters'),
+    Field('customer_email', text('Valid email is required and must be at most 100 characters', 100,
+                                 pattern=EMAIL_PATTERN),
+          required='Valid email is required and must be at most 100 characters'),
+    Field('customer_phone', text('Customer phone must be between 1 and 20 characters', 20),
+          required='Customer phone must be between 1 and 20 characters'),
+    Field('start_date', iso_date('Invalid date format'), required='Invalid date format'),
+    Field('end_date', iso_date('Invalid date format'), required='Invalid date format'),
+    Field('total_cost', number('Total cost'), required='Total cost is required'),
+    Field('status', choice(('pending', 'paid', 'active', 'completed', 'cancelled'), 'Invalid status'),
+          default='pending'),
+], checks=[
+    lambda result, today: 'End date must be after start date' if result['start_date'] >= result['end_date'] else None,
+    _not_in_past('start_date', 'Start date cannot be in the past'),
+])
+
+PAYMENT_SPEC = Spec([
+    Field('booking_id', positive_int('Booking ID'), required='Booking ID is required'),
+    Field('amount', number('Amount'), required='Amount is required'),
+    Field('payment_method', text('Payment method must be at most 30 characters', 30, min_length=0),
+          default='pending'),
+    Field('status', choice(('pending', 'completed', 'failed'), 'Invalid status'), default='pending'),
+])
+
+TRANSPORTATION_SPEC = Spec([
+    Field('booking_id', positive_int('Booking ID'), required='Booking ID is required'),
+    Field('customer_name', text('Customer name must be between 1 and 100 characters', 100),
+          required='Customer name must be between 1 and 100 characters'),
+    Field('pickup_address', text('Pickup address must be between 1 and 250 characters', 250),
+          required='Pickup address must be between 1 and 250 characters'),
+    Field('pickup_date', iso_date('Invalid date/time format'), required='Invalid date/time format'),
+    Field('pickup_time', iso_time('Invalid date/time format'), required='Invalid date/time format'),
+    Field('distance', number('Distance')),
+    Field('special_instructions', text('Special instructions must be at most 1000 characters', 1000, min_length=0),
+          default=''),
+    Field('status', choice(('pending', 'scheduled', 'completed', 'cancelled'), 'Invalid status'),
+          default='pending'),
+], checks=[
+    _not_in_past('pickup_date', 'Pickup date cannot be in the past'),
+])
+
+MPESA_STK_SPEC = Spec([
+    Field('booking_id', positive_int('Booking ID'), required='Booking ID is required'),
+    Field('phone_number', text('Phone number must be between 10 and 15 characters', 15, min_length=10),
+          required='Phone number must be between 10 and 15 characters'),
+    Field('amount', number('Amount', minimum=1), required='Amount is required'),
+])
 
-    if 'total_cost' not in data:
-        raise ValidationError('Total cost is required')
-    try:
-        total_cost = float(data['total_cost'])
-        if total_cost < 0:
-            raise ValidationError('Total cost must be non-negative')
-    except (ValueError, TypeError):
-        raise ValidationError('Total cost must be a valid number')
-    result['total_cost'] = total_cost
 
-    if 'status' in data:
-        status = data['status']
-        if status not in ['pending', 'paid', 'active', 'completed', 'cancelled']:
-            raise ValidationError('Invalid status')
-        result['status'] = status
-    else:
-        result['status'] = 'pending'
+def validate_storage_unit(data, partial=False):
+    """Validate storage unit input"""
+    return STORAGE_UNIT_SPEC.validate(data, partial)
 
-    return result
+def validate_booking(data):
+    """Validate booking input"""
+    return BOOKING_SPEC.validate(data)
 
 def validate_payment(data):
     """Validate payment input"""
-    if not data:
-        raise ValidationError('No data provided')
-
-    result = {}
-
-    if 'booking_id' not in data:
-        raise ValidationError('Booking ID is required')
-    try:
-        booking_id = int(data['booking_id'])
-        if booking_id <= 0:
-            raise ValidationError('Booking ID must be a positive integer')
-    except (ValueError, TypeError):
-        raise ValidationError('Booking ID must be a valid integer')
-    result['booking_id'] = booking_id
-
-    if 'amount' not in data:
-        raise ValidationError('Amount is required')
-    try:
-        amount = float(data['amount'])
-        if amount < 0:
-            raise ValidationError('Amount must be non-negative')
-    except (ValueError, TypeError):
-        raise ValidationError('Amount must be a valid number')
-    result['amount'] = amount
-
-    if 'payment_method' in data:
-        payment_method = data['payment_method'].strip()
-        if len(payment_method) > 30:
-            raise ValidationError('Payment method must be at most 30 characters')
-        result['payment_method'] = payment_method
-    else:
-        result['payment_method'] = 'pending'
-
-    if 'status' in data:
-        status = data['status']
-        if status not in ['pending', 'completed', 'failed']:
-            raise ValidationError('Invalid status')
-        result['status'] = status
-    else:
-        result['status'] = 'pending'
-
-    return result
+    return PAYMENT_SPEC.validate(data)
 
 def validate_transportation(data):
     """Validate transportation input"""
-    if not data:
-        raise ValidationError('No data provided')
+    return TRANSPORTATION_SPEC.validate(data)
 
-    result = {}
+def validate_mpesa_stk(data):
+    """Validate M-Pesa STK input"""
+    return MPESA_STK_SPEC.validate(data)
 
-    if 'booking_id' not in data:
-        raise ValidationError('Booking ID is required')
-    try:
-        booking_id = int(data['booking_id'])
-        if booking_id <= 0:
-            raise ValidationError('Booking ID must be a positive integer')
-    except (ValueError, TypeError):
-        raise ValidationError('Booking ID must be a valid integer')
-    result['booking_id'] = booking_id
+def validate_mpesa_query(data):
+    """Validate M-Pesa query input"""
+    if not isinstance(data, dict) or 'checkout_request_id' not in data:
+        raise ValidationError('Checkout request ID is required')
 
-    customer_name = data.get('customer_name', '').strip()
-    if not customer_name or len(customer_name) < 1 or len(customer_name) > 100:
-        raise ValidationError('Customer name must be between 1 and 100 characters')
-    result['customer_name'] = customer_name
+    checkout_request_id = str(data['checkout_request_id']).strip()
+    if not checkout_request_id:
+        raise ValidationError('Checkout request ID cannot be empty')
 
-    pickup_address = data.get('pickup_address', '').strip()
-    if not pickup_address or len(pickup_address) < 1 or len(pickup_address) > 250:
-        raise ValidationError('Pickup address must be between 1 and 250 characters')
-    result['pickup_address'] = pickup_address
+    return {'checkout_request_id': checkout_request_id}
 
+def _parse_positive_int(value, label):
     try:
-        pickup_date = datetime.fromisoformat(data['pickup_date']).date() if isinstance(data['pickup_date'], str) else data['pickup_date']
-        pickup_time = datetime.fromisoformat(data['pickup_time']).time() if isinstance(data['pickup_time'], str) else data['pickup_time']
+        value = int(value)
     except (ValueError, TypeError):
-        raise ValidationError('Invalid date/time format')
+        raise ValidationError(f'{label} must be a valid integer')
+    if value <= 0:
+        raise ValidationError(f'{label} must be a positive integer')
+    return value
+
+def validate_list_query(args, allowed_fields=(), max_limit=500):
+    """Validate pagination, filter and projection query parameters for list endpoints"""
+    result = {'after': None, 'limit': None, 'since': None, 'fields': None}
 
-    if pickup_date < date.today():
-        raise ValidationError('Pickup date cannot be in the past')
+    if args.get('after'):
+        result['after'] = _parse_positive_int(args['after'], 'after')
 
-    result['pickup_date'] = pickup_date
-    result['pickup_time'] = pickup_time
+    if args.get('limit'):
+        limit = _parse_positive_int(args['limit'], 'limit')
+        if limit > max_limit:
+            raise ValidationError(f'limit must be at most {max_limit}')
+        result['limit'] = limit
 
-    if 'distance' in data and data['distance'] is not None:
+    if args.get('since'):
         try:
-            distance = float(data['distance'])
-            if distance < 0:
-                raise ValidationError('Distance must be non-negative')
-            result['distance'] = distance
+            since = int(args['since'])
         except (ValueError, TypeError):
-            raise ValidationError('Distance must be a valid number')
-
-    if 'special_instructions' in data:
-        special_instructions = data['special_instructions'].strip()
-        if len(special_instructions) > 1000:
-            raise ValidationError('Special instructions must be at most 1000 characters')
-        result['special_instructions'] = special_instructions
-    else:
-        result['special_instructions'] = ''
-
-    if 'status' in data:
-        status = data['status']
-        if status not in ['pending', 'scheduled', 'completed', 'cancelled']:
-            raise ValidationError('Invalid status')
-        result['status'] = status
-    else:
-        result['status'] = 'pending'
+            raise ValidationError('since must be a valid integer')
+        if since < 0:
+            raise ValidationError('since must be a non-negative integer')
+        result['since'] = since
+
+    for key in ('unit_id', 'booking_id', 'customer_id'):
+        if args.get(key):
+            result[key] = _parse_positive_int(args[key], key)
+
+    for key in ('status', 'site'):
+        value = (args.get(key) or '').strip()
+        if value:
+            result[key] = value
+
+    for key in ('from', 'to'):
+        if args.get(key):
+            try:
+                result[key] = date.fromisoformat(args[key])
+            except ValueError:
+                raise ValidationError(f'{key} must be a date in YYYY-MM-DD format')
+    if 'from' in result and 'to' in result and result['from'] > result['to']:
+        raise ValidationError('from must be on or before to')
+
+    if args.get('fields'):
+        fields = tuple(f.strip() for f in args['fields'].split(',') if f.strip())
+        unknown = [f for f in fields if f not in allowed_fields]
+        if unknown:
+            raise ValidationError(f"Unknown fields: {', '.join(unknown)}")
+        result['fields'] = fields
 
     return result
 
-def validate_mpesa_stk(data):
-    """Validate M-Pesa STK input"""
-    if not data:
-        raise ValidationError('No data provided')
+def validate_export_query(args, allowed_fields=()):
+    """Validate export format, filters and column selection"""
+    result = validate_list_query(args, allowed_fields)
+    export_format = (args.get('format') or 'ndjson').strip().lower()
+    if export_format not in ['ndjson', 'csv']:
+        raise ValidationError('format must be either ndjson or csv')
+    result['format'] = export_format
+    return result
 
-    result = {}
+def validate_availability_query(args, allowed_fields=()):
+    """Validate the date range and unit filters of an availability search"""
+    result = validate_list_query(args, allowed_fields)
 
-    if 'booking_id' not in data:
-        raise ValidationError('Booking ID is required')
-    try:
-        booking_id = int(data['booking_id'])
-        if booking_id <= 0:
-            raise ValidationError('Booking ID must be a positive integer')
-    except (ValueError, TypeError):
-        raise ValidationError('Booking ID must be a valid integer')
-    result['booking_id'] = booking_id
+    for key in ('start', 'end'):
+        if not args.get(key):
+            raise ValidationError(f'{key} is required')
+        try:
+            result[key] = date.fromisoformat(args[key])
+        except ValueError:
+            raise ValidationError(f'{key} must be a date in YYYY-MM-DD format')
+    if result['start'] >= result['end']:
+        raise ValidationError('end must be after start')
+
+    for key in ('min_size', 'max_size', 'min_rate', 'max_rate'):
+        if args.get(key):
+            try:
+                value = float(args[key])
+            except (ValueError, TypeError):
+                raise ValidationError(f'{key} must be a valid number')
+            if value < 0:
+                raise ValidationError(f'{key} must be non-negative')
+            result[key] = value
 
-    phone_number = data.get('phone_number', '').strip()
-    if not phone_number or len(phone_number) < 10 or len(phone_number) > 15:
-        raise ValidationError('Phone number must be between 10 and 15 characters')
-    result['phone_number'] = phone_number
-
-    if 'amount' not in data:
-        raise ValidationError('Amount is required')
-    try:
-        amount = float(data['amount'])
-        if amount < 1:
-            raise ValidationError('Amount must be at least 1')
-    except (ValueError, TypeError):
-        raise ValidationError('Amount must be a valid number')
-    result['amount'] = amount
+    if args.get('features'):
+        result['features'] = sorted({f.strip() for f in args['features'].split(',') if f.strip()})
 
     return result
 
-def validate_mpesa_query(data):
-    """Validate M-Pesa query input"""
-    if not data or 'checkout_request_id' not in data:
-        raise ValidationError('Checkout request ID is required')
+def validate_bulk_unit_update(data):
+    """Validate a bulk storage unit update: which units to change (filter) and what to set"""
+    if not data or not isinstance(data, dict):
+        raise ValidationError('No data provided')
 
-    checkout_request_id = data['checkout_request_id'].strip()
-    if not checkout_request_id:
-        raise ValidationError('Checkout request ID cannot be empty')
+    unit_filter = data.get('filter')
+    if not isinstance(unit_filter, dict) or not unit_filter:
+        raise ValidationError('A non-empty filter is required')
+    result = {'filter': {}, 'set': {}}
+
+    if 'unit_ids' in unit_filter:
+        unit_ids = unit_filter['unit_ids']
+        if not isinstance(unit_ids, list) or not unit_ids:
+            raise ValidationError('unit_ids must be a non-empty list')
+        result['filter']['unit_ids'] = [_parse_positive_int(unit_id, 'unit_ids') for unit_id in unit_ids]
+
+    for key in ('site', 'status'):
+        if key in unit_filter:
+            value = str(unit_filter[key] or '').strip()
+            if not value:
+                raise ValidationError(f'{key} filter cannot be empty')
+            result['filter'][key] = value
+
+    for key in ('min_size', 'max_size'):
+        if key in unit_filter:
+            try:
+                result['filter'][key] = float(unit_filter[key])
+            except (ValueError, TypeError):
+                raise ValidationError(f'{key} must be a valid number')
 
-    return {'checkout_request_id': checkout_request_id}
+    unknown = set(unit_filter) - set(result['filter'])
+    if unknown:
+        raise ValidationError(f"Unknown filter keys: {', '.join(sorted(unknown))}")
+
+    changes = data.get('set')
+    if not isinstance(changes, dict) or not changes:
+        raise ValidationError('set must name at least one field to change')
+    unknown = set(changes) - {'monthly_rate', 'status'}
+    if unknown:
+        raise ValidationError(f"Only monthly_rate and status can be bulk updated, got: {', '.join(sorted(unknown))}")
+    validated = validate_storage_unit(changes, partial=True)
+    result['set'] = {key: validated[key] for key in changes}
+
+    return result
@@ -0,0 +1,78 @@
+# Flat, precompiled serializers for list endpoints.
+#
+# SerializerMixin.to_dict() walks serialize_rules and type lambdas for every
+# field of every row. When a request only asks for plain columns (fields=...),
+# FlatSerializer selects just those columns and converts the result tuples
+# directly, without hydrating ORM objects. Output matches to_dict(): dates and
+# datetimes as ISO strings (the models' serialize_types), times as HH:MM and
+# Decimals as strings (sqlalchemy_serializer's defaults). responses.stream_export
+# writes these rows out for the export endpoints.
+from functools import lru_cache
+
+from sqlalchemy import Date, DateTime, Numeric, Time, inspect as sa_inspect
+
+
+def format_datetime(value):
+    """Date or datetime as an ISO string, as the models' serialize_types render it"""
+    return value.isoformat() if value is not None else None
+
+
+def format_time(value):
+    """Time as HH:MM, as sqlalchemy_serializer renders it"""
+    return value.strftime('%H:%M') if value is not None else None
+
+
+def format_decimal(value):
+    """Decimal as a string, as sqlalchemy_serializer renders it"""
+    return str(value) if value is not None else None
+
+
+def _converter_for(column_type):
+    if isinstance(column_type, (Date, DateTime)):
+        return format_datetime
+    if isinstance(column_type, Time):
+        return format_time
+    if isinstance(column_type, Numeric):
+        return format_decimal
+    return None
+
+
+class FlatSerializer:
+    def __init__(self, model, fields):
+        mapper = sa_inspect(model)
+        self.keys = tuple(fields)
+        self.primary_key = mapper.primary_key[0]
+        # Always select the primary key so keyset pagination can read the cursor
+        selected = list(self.keys)
+        if self.primary_key.key not in selected:
+            selected.append(self.primary_key.key)
+        self.columns = tuple(getattr(model, key) for key in selected)
+        converters = [_converter_for(mapper.columns[key].type) for key in self.keys]
+        self._plain = all(converter is None for converter in converters)
+        self._fields = tuple(zip(range(len(self.keys)), self.keys, converters))
+
+    def __call__(self, rows):
+        keys = self.keys
+        if self._plain:
+            return [dict(zip(keys, row)) for row in rows]
+        fields = self._fields
+        return [
+            {key: (convert(row[i]) if convert else row[i]) for i, key, convert in fields}
+            for row in rows
+        ]
+
+
+@lru_cache(maxsize=256)
+def _compiled(model, fields):
+    return FlatSerializer(model, fields)
+
+
+def flat_serializer(model, fields):
+    """Compiled serializer for a columns-only projection, or None if fields is empty
+    or includes a relationship (those still go through to_dict())"""
+    if not fields:
+        return None
+    columns = sa_inspect(model).columns
+    if any(field not in columns for field in fields):
+        return None
+    return _compiled(model, tuple(fields))
@@ -0,0 +1,129 @@
+# Performance settings for single-node deployments on the SQLite default database.
+#
+# Every connection switches to WAL with synchronous=NORMAL, memory-mapped reads, a
+# larger page cache and a busy timeout. In WAL mode readers never wait for a writer,
+# so only writers contend. They go through one serialized writer: the first INSERT,
+# UPDATE or DELETE of a transaction waits for a thread lock plus a file lock shared by
+# all worker processes, held until COMMIT or ROLLBACK. Writers queue there and get
+# the database as soon as it is free, instead of polling in SQLite's busy handler and
+# failing with "database is locked" once busy_timeout runs out. A writer still queued
+# after SQLITE_BUSY_TIMEOUT_MS fails with that same OperationalError rather than
+# writing without the lock.
+#
+# pysqlite only opens a transaction at the first write statement, so taking the write
+# lock at that point never upgrades a stale read snapshot.
+#
+# Enabled by default for file databases; set SQLITE_PERFORMANCE_MODE=0 to disable.
+import logging
+import os
+import sqlite3
+import threading
+
+try:
+    import fcntl  # For serializing writers across worker processes (POSIX only)
+except ImportError:
+    fcntl = None
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class SerializedWriter:
+    """One write transaction at a time across all worker processes on the host.
+
+    A thread lock queues the threads of a worker and the thread at the front takes an
+    flock on `lock_path`, which queues the workers. acquire() gives up and returns False
+    if the thread lock cannot be had within `timeout` seconds.
+    """
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.lock_path = None
+        self._lock = threading.Lock()
+        self._held = threading.local()
+        self._file = None
+        self._pid = None
+
+    @property
+    def held(self):
+        return getattr(self._held, 'value', False)
+
+    def acquire(self):
+        if not self._lock.acquire(timeout=self.timeout):
+            return False
+        self._lock_file()
+        self._held.value = True
+        return True
+
+    def release(self):
+        if not self.held:
+            return
+        self._held.value = False
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._lock.release()
+
+    def _lock_file(self):
+        if not self.lock_path or not fcntl:
+            return
+        # File descriptors are per process; reopen after a fork
+        if self._file is None or self._pid != os.getpid():
+            self._file = open(self.lock_path, 'a')
+            self._pid = os.getpid()
+        # Blocks without holding the GIL; the kernel drops the lock if its holder dies
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+
+BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+
+writer = SerializedWriter(timeout=BUSY_TIMEOUT_MS / 1000)
+
+
+def configure_engine(engine):
+    mmap_size = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+    cache_kib = int(os.getenv('SQLITE_CACHE_KIB', '65536'))
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        # WAL is persistent; switching needs an exclusive lock, so only the first connection does it
+        if cursor.execute('PRAGMA journal_mode').fetchone()[0].lower() != 'wal':
+            cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA mmap_size={mmap_size}')
+        cursor.execute(f'PRAGMA cache_size=-{cache_kib}')
+        cursor.close()
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def serialize_writes(conn, cursor, statement, parameters, context, executemany):
+        if not writer.held and statement.lstrip()[:7].upper().startswith(WRITE_STATEMENTS):
+            if not writer.acquire():
+                logging.warning(f"SQLite writer lock not acquired within {writer.timeout}s")
+                raise OperationalError(statement, parameters, sqlite3.OperationalError('database is locked'))
+
+    # Fallback for Core connections; ORM sessions release in the session events below
+    @event.listens_for(engine, 'checkin')
+    def release_writer(dbapi_connection, connection_record):
+        writer.release()
+
+
+# The engine's commit/rollback events fire before the statement is sent, so ORM
+# transactions release the writer from the session events that follow it
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _release_after_transaction(session):
+    writer.release()
+
+
+def init_app(app, db):
+    if os.getenv('SQLITE_PERFORMANCE_MODE', '1') != '1':
+        return
+    with app.app_context():
+        for engine in db.engines.values():
+            database = engine.url.database
+            if engine.dialect.name == 'sqlite' and database and database != ':memory:':
+                configure_engine(engine)
+                if writer.lock_path is None:
+                    writer.lock_path = f'{database}-writer.lock'
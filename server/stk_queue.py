@@ -0,0 +1,201 @@
+# Database-backed queue for STK push dispatch.
+#
+# MpesaSTKPushResource stores a Payment in the 'queued' state and returns 202;
+# workers claim queued payments (FOR UPDATE SKIP LOCKED on PostgreSQL), send the
+# pushes to Daraja with bounded concurrency and a rate limit, and move each
+# payment to 'pending' (awaiting callback) or 'failed'. The Payment table is the
+# queue, so nothing is lost if a worker restarts before dispatching.
+#
+# A claim is a lease: claimed_at is stamped with the 'dispatching' state, and a
+# claim older than STK_QUEUE_LEASE_SECONDS belongs to a worker that died mid-batch.
+# Workers mark those payments 'failed' rather than queueing them again, since the
+# push may already have reached the customer's phone, and the customer can retry.
+#
+# A dispatched push stays live on the customer's phone for up to STK_PROMPT_SECONDS;
+# until then its callback may still complete the payment, so it is not pushed again.
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, update
+
+from models import db, ChangeVersion, Payment
+from mpesa_service import MpesaService
+from mpesa_async import daraja_loop
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` calls per second with bursts up to `burst`"""
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class StkPushQueue:
+    def __init__(self, app=None):
+        self.app = None
+        self.batch_size = int(os.getenv('STK_QUEUE_CONCURRENCY', '20'))
+        self.poll_interval = float(os.getenv('STK_QUEUE_POLL_INTERVAL', '2'))
+        self.rate_limiter = RateLimiter(float(os.getenv('STK_QUEUE_RATE', '10')))
+        self.lease = timedelta(seconds=float(os.getenv('STK_QUEUE_LEASE_SECONDS', '120')))
+        self.prompt_ttl = timedelta(seconds=float(os.getenv('STK_PROMPT_SECONDS', '120')))
+        self.inline_worker = os.getenv('STK_QUEUE_INLINE_WORKER', '1') == '1'
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+
+        @app.cli.command('stk-worker')
+        def stk_worker():
+            """Drain the STK push queue in the foreground."""
+            self.run_forever()
+
+    def notify(self):
+        """Wake the worker after a payment was queued"""
+        if self.inline_worker:
+            self._ensure_started()
+        self._wake.set()
+
+    def _ensure_started(self):
+        # Threads do not survive a fork, so each gunicorn worker starts its own drainer
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._thread = threading.Thread(target=self.run_forever, name='stk-queue', daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def run_forever(self):
+        while True:
+            try:
+                while self.drain_once():
+                    pass
+            except Exception as e:
+                logging.error(f"STK queue worker error: {str(e)}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def lease_expired(self, payment):
+        """True if a 'dispatching' payment was claimed by a worker that never finished it"""
+        return payment.claimed_at is None or payment.claimed_at < datetime.utcnow() - self.lease
+
+    def prompt_live(self, payment):
+        """True if a push reached Daraja recently enough that the customer can still accept it"""
+        return (payment.status == 'pending' and payment.checkout_request_id is not None
+                and payment.dispatched_at is not None
+                and payment.dispatched_at >= datetime.utcnow() - self.prompt_ttl)
+
+    def drain_once(self):
+        """Claim and dispatch one batch; returns False when the queue is empty"""
+        with self.app.app_context():
+            self._fail_expired()
+            jobs, claimed_at = self._claim()
+            if not jobs:
+                return False
+
+            pending = []
+            for job in jobs:
+                self.rate_limiter.acquire()
+                pending.append((job, self._dispatch(job)))
+            for job, future in pending:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'success': False, 'error': str(e)}
+                self._complete(job, claimed_at, result)
+            return True
+
+    def _fail_expired(self):
+        expired = Payment.query \
+            .filter(Payment.status == 'dispatching',
+                    or_(Payment.claimed_at.is_(None), Payment.claimed_at < datetime.utcnow() - self.lease)) \
+            .with_for_update(skip_locked=True).all()
+        for payment in expired:
+            payment.status = 'failed'
+            logging.error(f"STK push for payment {payment.payment_id} was claimed at {payment.claimed_at} "
+                          f"and never completed; marked failed")
+        db.session.commit()
+
+    def _claim(self):
+        now = datetime.utcnow()
+        candidates = db.session.query(Payment.payment_id, Payment.booking_id, Payment.phone_number, Payment.amount) \
+            .filter(Payment.status == 'queued') \
+            .order_by(Payment.payment_id) \
+            .with_for_update(skip_locked=True) \
+            .limit(self.batch_size).all()
+
+        jobs = []
+        # Core updates skip before_flush, so stamp the change version for the event feed here
+        version = ChangeVersion.claim_next('payment') if candidates else None
+        for candidate in candidates:
+            # Conditional update so two workers can never claim the same payment,
+            # even on databases without SKIP LOCKED
+            claimed = db.session.execute(
+                update(Payment.__table__)
+                .where(Payment.payment_id == candidate.payment_id, Payment.status == 'queued')
+                .values(status='dispatching', claimed_at=now, row_version=version)
+            ).rowcount
+            if claimed:
+                jobs.append(candidate)
+        db.session.commit()
+        return jobs, now
+
+    def _dispatch(self, job):
+        args = (job.phone_number, float(job.amount), f"BOOKING-{job.booking_id}", "Storage Unit Payment")
+        if daraja_loop.available:
+            return daraja_loop.submit('stk_push', *args)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.batch_size, thread_name_prefix='stk-push')
+        return self._executor.submit(MpesaService().stk_push, *args)
+
+    def _complete(self, job, claimed_at, result):
+        try:
+            payment = db.session.get(Payment, job.payment_id)
+            if not payment:
+                return
+            if payment.status != 'dispatching' or payment.claimed_at != claimed_at:
+                # Our lease expired and the payment was failed or queued again meanwhile
+                logging.error(f"STK push result for payment {job.payment_id} arrived after its lease expired: "
+                              f"{result}")
+                return
+            if result.get('success'):
+                payment.status = 'pending'
+                payment.checkout_request_id = result.get('checkout_request_id')
+                payment.merchant_request_id = result.get('merchant_request_id')
+                payment.dispatched_at = datetime.utcnow()
+            else:
+                payment.status = 'failed'
+                logging.error(f"STK push failed for payment {job.payment_id}: {result.get('error')}")
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error recording STK push result for payment {job.payment_id}: {str(e)}")
+
+
+stk_queue = StkPushQueue()
@@ -0,0 +1,116 @@
+"""
+Timing benchmark for the storage unit bulk import (POST /api/units/bulk).
+
+Builds a CSV of --rows units, a share of them invalid and most with features, and
+imports it into a fresh scratch SQLite database as an upload and as the same rows in
+JSON. For comparison it also creates --single units one POST /api/units at a time,
+the only option before the bulk endpoint, and reports everything in rows per second.
+
+    python -m tests.bench_bulk_import
+    python -m tests.bench_bulk_import --rows 50000 --invalid 0.05 --single 2000
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+import tempfile
+import time
+
+_db_dir = tempfile.mkdtemp(prefix='storage-bench-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+os.environ.pop('DATABASE_REPLICA_URL', None)
+os.environ['BULK_IMPORT_MAX_ROWS'] = str(10 ** 7)
+for worker in ('STK_QUEUE_INLINE_WORKER', 'CALLBACK_INLINE_WORKER', 'RECONCILE_INLINE_WORKER'):
+    os.environ[worker] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+from models import db, Admin, StorageUnit  # noqa: E402
+
+FEATURES = ['CCTV', 'Climate control', 'Alarm', 'Ground floor', 'Drive-up', 'Lift access']
+COLUMNS = ['unit_number', 'site', 'size', 'monthly_rate', 'status', 'location', 'features']
+
+
+def build_rows(count, invalid, prefix):
+    every = max(1, round(1 / invalid)) if invalid > 0 else 0
+    rows = []
+    for index in range(count):
+        rows.append({
+            'unit_number': f'{prefix}-{index}',
+            'site': f'Site {index % 5}',
+            'size': 5 + index % 20,
+            'monthly_rate': 'n/a' if every and index % every == 0 else 1000 + index % 500,
+            'status': 'available',
+            'location': f'Block {index % 12}',
+            'features': FEATURES[index % 4:index % 4 + index % 3],
+        })
+    return rows
+
+
+def to_csv(rows):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, COLUMNS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(dict(row, features=';'.join(row['features'])))
+    return out.getvalue().encode()
+
+
+def reset():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        admin = Admin(username='bench', email='bench@example.com', role='admin')
+        admin.set_password('bench')
+        db.session.add(admin)
+        db.session.commit()
+
+
+def login(client):
+    token = client.post('/api/admin/login', json={'username': 'bench', 'password': 'bench'}).get_json()['access_token']
+    return {'Authorization': f'Bearer {token}'}
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000, help='units per import')
+    parser.add_argument('--invalid', type=float, default=0.1, help='share of rows with a bad monthly rate')
+    parser.add_argument('--single', type=int, default=1000, help='units created one request at a time')
+    args = parser.parse_args()
+    client = app.test_client()
+
+    print(f'{args.rows} rows, {args.invalid:.0%} invalid')
+    for name in ('CSV upload', 'JSON array'):
+        reset()
+        headers = login(client)
+        rows = build_rows(args.rows, args.invalid, 'B')
+        if name == 'CSV upload':
+            upload = to_csv(rows)
+            send = lambda: client.post('/api/units/bulk', headers=headers, content_type='multipart/form-data',  # noqa: E731
+                                       data={'file': (io.BytesIO(upload), 'units.csv')})
+        else:
+            send = lambda: client.post('/api/units/bulk', headers=headers, json=rows)  # noqa: E731
+        response, elapsed = timed(send)
+        body = response.get_json()
+        print(f"{name:>18}: {elapsed:7.2f}s  {args.rows / elapsed:>9,.0f} rows/s  "
+              f"(created {body['created']}, failed {body['failed']})")
+
+    reset()
+    headers = login(client)
+    rows = build_rows(args.single, 0, 'S')
+    _, elapsed = timed(lambda: [client.post('/api/units', headers=headers, json=row) for row in rows])
+    with app.app_context():
+        created = db.session.query(StorageUnit).count()
+    print(f"{'POST /api/units':>18}: {elapsed:7.2f}s  {args.single / elapsed:>9,.0f} rows/s  "
+          f"(created {created} of {args.single})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+CPU cost against bytes saved for response compression on real API payloads.
+
+Seeds a scratch SQLite database, fetches list responses of several sizes
+uncompressed through the test client, then compresses each body with gzip and
+brotli at a few levels. Reports the compressed size, the ratio and the best
+compression time of several runs. The defaults used by responses.init_app are
+gzip level 6 and brotli quality 4.
+
+    python -m tests.bench_compression
+    python -m tests.bench_compression --runs 50
+"""
+import argparse
+import gzip
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+_db_dir = tempfile.mkdtemp(prefix='storage-bench-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+os.environ.pop('DATABASE_REPLICA_URL', None)
+for worker in ('STK_QUEUE_INLINE_WORKER', 'CALLBACK_INLINE_WORKER', 'RECONCILE_INLINE_WORKER'):
+    os.environ[worker] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import brotli  # noqa: E402
+
+from app import app  # noqa: E402
+from models import db, Booking, StorageUnit  # noqa: E402
+
+UNITS = 500
+BOOKINGS = 2000
+PAYLOADS = [
+    '/api/bookings?limit=20',
+    '/api/bookings?limit=100',
+    '/api/bookings?limit=500',
+    '/api/units?limit=500',
+    '/api/bookings?limit=500&fields=booking_id,unit_id,status,start_date,end_date',
+]
+CODECS = [
+    ('gzip 1', lambda body: gzip.compress(body, compresslevel=1, mtime=0)),
+    ('gzip 6', lambda body: gzip.compress(body, compresslevel=6, mtime=0)),
+    ('gzip 9', lambda body: gzip.compress(body, compresslevel=9, mtime=0)),
+    ('br 1', lambda body: brotli.compress(body, quality=1)),
+    ('br 4', lambda body: brotli.compress(body, quality=4)),
+    ('br 6', lambda body: brotli.compress(body, quality=6)),
+    ('br 11', lambda body: brotli.compress(body, quality=11)),
+]
+
+
+def seed():
+    with app.app_context():
+        db.create_all()
+        db.session.execute(StorageUnit.__table__.insert(), [
+            {'unit_number': f'U-{index}', 'site': f'Site {index % 5}', 'size': 5 + index % 20,
+             'monthly_rate': 1000 + index % 500, 'status': 'available', 'location': f'Block {index % 12}',
+             'row_version': 0}
+            for index in range(UNITS)])
+        start = date(2030, 1, 1)
+        db.session.execute(Booking.__table__.insert(), [
+            {'unit_id': index % UNITS + 1, 'customer_name': f'Customer {index}',
+             'customer_email': f'customer{index}@example.com', 'customer_phone': f'07{index:08d}',
+             'start_date': start + timedelta(days=index % 365),
+             'end_date': start + timedelta(days=index % 365 + 30),
+             'status': 'pending', 'approval_status': 'pending_approval', 'total_cost': 1000 + index % 900,
+             'row_version': 0}
+            for index in range(BOOKINGS)])
+        db.session.commit()
+
+
+def best_of(runs, fn):
+    best = float('inf')
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20, help='runs per measurement; the best is kept')
+    args = parser.parse_args()
+
+    seed()
+    client = app.test_client()
+    for path in PAYLOADS:
+        body = client.get(path, headers={'Accept-Encoding': 'identity'}).get_data()
+        print(f'\n{path}  ({len(body):,} bytes)')
+        for name, compress in CODECS:
+            size = len(compress(body))
+            seconds = best_of(args.runs, lambda: compress(body))
+            print(f'  {name:>7}: {size:>9,} bytes  {len(body) / size:5.1f}x  {seconds * 1000:8.3f} ms  '
+                  f'{len(body) / seconds / 1e6:8.1f} MB/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Throughput of the sync and async Daraja clients against a local stub with latency.
+
+Starts a Daraja stub in a separate process that answers OAuth at once and every
+STK push after --latency seconds. It then sends --calls STK pushes three ways:
+- MpesaService from a pool of --threads threads, like one gthread worker;
+- the same from --many-threads threads;
+- AsyncMpesaService through DarajaLoop on one event loop thread, with at most
+  MPESA_MAX_IN_FLIGHT (--in-flight) calls outstanding.
+Peak in-flight is counted by the stub. Client threads is the process's thread
+count during the run.
+
+    python -m tests.bench_daraja_clients
+    python -m tests.bench_daraja_clients --calls 2000 --latency 0.5 --in-flight 500
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class DarajaStub:
+    """Minimal keep-alive HTTP/1.1 Daraja on asyncio, so the stub itself never runs out of threads"""
+    def __init__(self, latency):
+        self.latency = latency
+        self.in_flight = self.peak = 0
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                request_line, *header_lines = head.decode('latin-1').split('\r\n')
+                headers = dict(line.split(': ', 1) for line in header_lines if ': ' in line)
+                length = int({key.lower(): value for key, value in headers.items()}.get('content-length', 0))
+                if length:
+                    await reader.readexactly(length)
+                method, path, _ = request_line.split(' ', 2)
+                if path.startswith('/stats'):
+                    body = {'peak': self.peak}
+                    self.peak = 0
+                elif method == 'GET':
+                    body = {'access_token': 'bench-token', 'expires_in': '3599'}
+                else:
+                    self.in_flight += 1
+                    self.peak = max(self.peak, self.in_flight)
+                    await asyncio.sleep(self.latency)
+                    self.in_flight -= 1
+                    body = {'MerchantRequestID': 'm-1', 'CheckoutRequestID': 'ws_CO_1', 'ResponseCode': '0',
+                            'CustomerMessage': 'Success. Request accepted for processing'}
+                data = json.dumps(body).encode()
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                             b'Content-Length: %d\r\n\r\n%s' % (len(data), data))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def serve_stub(latency, port):
+    async def serve():
+        server = await asyncio.start_server(DarajaStub(latency).handle, '127.0.0.1', 0, backlog=4096)
+        port.value = server.sockets[0].getsockname()[1]
+        await server.serve_forever()
+    asyncio.run(serve())
+
+
+def run(label, send, calls, stub_stats):
+    stub_stats()  # reset the peak
+    peak_threads, done = [threading.active_count()], threading.Event()
+
+    def sample_threads():
+        while not done.wait(0.01):
+            peak_threads[0] = max(peak_threads[0], threading.active_count())
+    sampler = threading.Thread(target=sample_threads)
+    sampler.start()
+    started = time.perf_counter()
+    results = send(calls)
+    elapsed = time.perf_counter() - started
+    done.set()
+    sampler.join()
+    ok = sum(1 for result in results if result.get('success'))
+    # The sampler itself is not a client thread
+    print(f'{label:<28}{ok:>6}/{calls:<6}{elapsed:>8.2f}s{calls / elapsed:>10,.0f}/s'
+          f"{stub_stats()['peak']:>10}{peak_threads[0] - 1:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds the stub takes per STK push')
+    parser.add_argument('--threads', type=int, default=20, help='sync client threads')
+    parser.add_argument('--many-threads', type=int, default=200, help='sync client threads, second run')
+    parser.add_argument('--in-flight', type=int, default=200, help='MPESA_MAX_IN_FLIGHT for the async client')
+    args = parser.parse_args()
+
+    port = multiprocessing.Value('i', 0)
+    stub = multiprocessing.Process(target=serve_stub, args=(args.latency, port), daemon=True)
+    stub.start()
+    while not port.value:
+        time.sleep(0.01)
+    base_url = f'http://127.0.0.1:{port.value}'
+    os.environ.update(MPESA_BASE_URL=base_url, MPESA_CONSUMER_KEY='bench', MPESA_CONSUMER_SECRET='bench',
+                      MPESA_SHORTCODE='174379', MPESA_PASSKEY='bench', MPESA_MAX_IN_FLIGHT=str(args.in_flight),
+                      MPESA_READ_TIMEOUT=str(args.latency + 30), MPESA_BREAKER_THRESHOLD='1000000')
+    os.environ.pop('MPESA_TOKEN_CACHE_FILE', None)
+    # 'Connection pool is full' warnings from the sync runs with more threads than MPESA_POOL_SIZE
+    logging.getLogger('urllib3').setLevel(logging.ERROR)
+
+    import requests
+    from mpesa_async import DarajaLoop
+    from mpesa_service import MpesaService
+
+    def stub_stats():
+        return requests.get(f'{base_url}/stats').json()
+
+    def push(service):
+        return service.stk_push('254712345678', 1, 'BENCH', 'Benchmark')
+
+    def sync_with(threads):
+        def send(calls):
+            with ThreadPoolExecutor(threads) as pool:
+                return list(pool.map(lambda _: push(MpesaService()), range(calls)))
+        return send
+
+    loop = DarajaLoop()
+
+    def send_async(calls):
+        futures = [loop.submit('stk_push', '254712345678', 1, 'BENCH', 'Benchmark') for _ in range(calls)]
+        wait(futures)
+        return [future.result() for future in futures]
+
+    push(MpesaService())  # fetch and cache the OAuth token
+    loop.run('get_access_token')
+    print(f'{args.calls} STK pushes, stub latency {args.latency * 1000:.0f} ms')
+    print(f"{'client':<28}{'ok':>13}{'time':>9}{'throughput':>12}{'in-flight':>10}{'threads':>10}")
+    run(f'MpesaService x{args.threads} threads', sync_with(args.threads), args.calls, stub_stats)
+    run(f'MpesaService x{args.many_threads} threads', sync_with(args.many_threads), args.calls, stub_stats)
+    run(f'DarajaLoop, {args.in_flight} in flight', send_async, args.calls, stub_stats)
+    stub.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Latency and memory benchmark for GET /api/bookings at different table sizes.
+
+Seeds a scratch SQLite database with N bookings, then times the whole table in one
+response (the old behaviour without limit=, reproduced by raising LIST_DEFAULT_LIMIT
+to N), the default page a request without limit= now gets, a walk over every page
+of 500 by X-Next-Cursor, and one plain and one projected keyset page taken from the
+middle of the table. Peak memory is the largest amount Python allocated during a
+request (the largest page for the walk), measured with tracemalloc on a
+separate run.
+
+    python -m tests.bench_list_endpoints
+    python -m tests.bench_list_endpoints --sizes 1000,100000 --runs 3
+
+The whole-table requests take seconds per 10k bookings; --full-max skips them above
+that many bookings. Each one runs in a forked child so that running out of memory
+(a million bookings in one response needs more than 6GB) is reported, not fatal.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+_db_dir = tempfile.mkdtemp(prefix='storage-bench-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+os.environ.pop('DATABASE_REPLICA_URL', None)
+for worker in ('STK_QUEUE_INLINE_WORKER', 'CALLBACK_INLINE_WORKER', 'RECONCILE_INLINE_WORKER'):
+    os.environ[worker] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+from app import app  # noqa: E402
+from models import db, Booking, StorageUnit  # noqa: E402
+
+UNITS = 500
+DEFAULT_LIMIT = app_module.LIST_DEFAULT_LIMIT
+BATCH = 20000
+
+
+def seed(total):
+    """Grow the bookings table to `total` rows"""
+    with app.app_context():
+        if not db.session.query(StorageUnit.unit_id).first():
+            db.session.execute(StorageUnit.__table__.insert(), [
+                {'unit_number': f'U-{index}', 'site': f'Site {index % 5}', 'size': 10,
+                 'monthly_rate': 1000, 'status': 'available', 'row_version': 0}
+                for index in range(UNITS)])
+        existing = db.session.query(db.func.count(Booking.booking_id)).scalar()
+        start = date(2030, 1, 1)
+        for first in range(existing, total, BATCH):
+            db.session.execute(Booking.__table__.insert(), [
+                {'unit_id': index % UNITS + 1, 'customer_name': 'Jane Doe',
+                 'customer_email': f'customer{index}@example.com', 'customer_phone': '0712345678',
+                 'start_date': start + timedelta(days=index % 365),
+                 'end_date': start + timedelta(days=index % 365 + 30),
+                 'status': 'pending', 'approval_status': 'pending_approval', 'total_cost': 1000,
+                 'row_version': 0}
+                for index in range(first, min(first + BATCH, total))])
+            db.session.commit()
+
+
+def get(client, url):
+    """One request; returns the body size"""
+    response = client.get(url)
+    assert response.status_code == 200, response.status_code
+    return len(response.data)
+
+
+def walk(client, url):
+    """Every page from url by X-Next-Cursor; returns the total body size.
+    Each page is released before the next, so the peak is that of the largest page."""
+    body, after = 0, None
+    while True:
+        response = client.get(url if after is None else f'{url}&after={after}')
+        assert response.status_code == 200, response.status_code
+        body += len(response.data)
+        after = response.headers.get('X-Next-Cursor')
+        if after is None:
+            return body
+
+
+def measure(fn, runs, default_limit):
+    app_module.LIST_DEFAULT_LIMIT = default_limit
+    try:
+        best = float('inf')
+        for _ in range(runs):
+            started = time.perf_counter()
+            body = fn()
+            best = min(best, time.perf_counter() - started)
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return best, peak, body
+    finally:
+        app_module.LIST_DEFAULT_LIMIT = DEFAULT_LIMIT
+
+
+def isolated(fn, *args):
+    """fn(*args) in a forked child; None if the child died, e.g. killed for memory"""
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+
+    def child():
+        sender.send(fn(*args))
+    process = multiprocessing.get_context('fork').Process(target=child)
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = None
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1000,100000,1000000', help='comma separated booking counts')
+    parser.add_argument('--full-max', type=int, default=None,
+                        help='skip the whole-table requests above this many bookings')
+    parser.add_argument('--runs', type=int, default=1, help='timed runs per request; the best is kept')
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+    print(f"{'bookings':>9}  {'request':<24}  {'latency':>10}  {'peak memory':>12}  {'body':>10}")
+    for size in sorted(int(size) for size in args.sizes.split(',')):
+        seed(size)
+        middle = size // 2
+        whole = args.full_max is None or size <= args.full_max
+        requests = [
+            ('whole table, 1 response', lambda: get(client, '/api/bookings'), size, whole),
+            ('default page', lambda: get(client, '/api/bookings'), DEFAULT_LIMIT, True),
+            ('every page of 500', lambda: walk(client, '/api/bookings?limit=500'), DEFAULT_LIMIT, whole),
+            ('page of 100', lambda: get(client, f'/api/bookings?after={middle}&limit=100'), DEFAULT_LIMIT, True),
+            ('page of 100, 5 fields',
+             lambda: get(client, f'/api/bookings?after={middle}&limit=100'
+                                 '&fields=booking_id,unit_id,start_date,end_date,status'), DEFAULT_LIMIT, True),
+        ]
+        for label, fn, default_limit, run in requests:
+            if not run:
+                print(f'{size:>9}  {label:<24}  {"skipped":>10}')
+                continue
+            if default_limit != DEFAULT_LIMIT:  # the whole table in one response
+                result = isolated(measure, fn, args.runs, default_limit)
+                if result is None:
+                    print(f'{size:>9}  {label:<24}  {"out of memory":>10}')
+                    continue
+                latency, peak, body = result
+            else:
+                latency, peak, body = measure(fn, args.runs, default_limit)
+            print(f'{size:>9}  {label:<24}  {latency * 1000:>8.1f}ms  {peak / 2 ** 20:>10.1f}MB  {body / 1024:>8.0f}KB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Microbenchmark for the flat serializers against SerializerMixin.to_dict().
+
+Seeds a scratch SQLite database with bookings and serializes the same projection
+both ways: to_dict(only=...) on ORM objects, the list endpoints' path without a
+columns-only projection, and FlatSerializer on plain result rows. Query time is
+excluded; only serialization is timed. Reports the best of several runs in rows
+per second.
+
+    python -m tests.bench_serializers
+    python -m tests.bench_serializers --rows 50000 --runs 10
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+_db_dir = tempfile.mkdtemp(prefix='storage-bench-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+os.environ.pop('DATABASE_REPLICA_URL', None)
+for worker in ('STK_QUEUE_INLINE_WORKER', 'CALLBACK_INLINE_WORKER', 'RECONCILE_INLINE_WORKER'):
+    os.environ[worker] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+from models import db, Booking, StorageUnit  # noqa: E402
+from serializers import flat_serializer  # noqa: E402
+
+FIELDS = ('booking_id', 'unit_id', 'customer_name', 'customer_email', 'start_date', 'end_date',
+          'status', 'total_cost')
+
+
+def seed(rows):
+    start = date(2030, 1, 1)
+    db.session.execute(StorageUnit.__table__.insert(), [
+        {'unit_number': 'U-1', 'site': 'Main', 'size': 10, 'monthly_rate': 1000, 'status': 'available',
+         'row_version': 0}])
+    db.session.execute(Booking.__table__.insert(), [
+        {'unit_id': 1, 'customer_name': 'Jane Doe', 'customer_email': f'customer{index}@example.com',
+         'customer_phone': '0712345678', 'start_date': start + timedelta(days=index % 365),
+         'end_date': start + timedelta(days=index % 365 + 30), 'status': 'pending',
+         'approval_status': 'pending_approval', 'total_cost': 1000, 'row_version': 0}
+        for index in range(rows)])
+    db.session.commit()
+
+
+def best_of(runs, fn):
+    best = float('inf')
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000, help='bookings to serialize')
+    parser.add_argument('--runs', type=int, default=5, help='runs per measurement; the best is kept')
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        seed(args.rows)
+        objects = db.session.scalars(db.select(Booking).order_by(Booking.booking_id)).all()
+        serializer = flat_serializer(Booking, FIELDS)
+        rows = db.session.execute(db.select(*serializer.columns).order_by(Booking.booking_id)).all()
+        assert serializer(rows) == [booking.to_dict(only=FIELDS) for booking in objects]
+
+        to_dict = best_of(args.runs, lambda: [booking.to_dict(only=FIELDS) for booking in objects])
+        flat = best_of(args.runs, lambda: serializer(rows))
+    print(f'{len(FIELDS)} booking columns, {args.rows} rows')
+    print(f'  to_dict():      {args.rows / to_dict:>12,.0f} rows/s')
+    print(f'  FlatSerializer: {args.rows / flat:>12,.0f} rows/s  ({to_dict / flat:.0f}x)')
+
+
+if __name__ == '__main__':
+    main()
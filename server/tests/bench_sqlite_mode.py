@@ -0,0 +1,144 @@
+"""
+Concurrent read/write throughput on SQLite with and without sqlite_mode.
+
+For each mode a fresh database is seeded, then --processes worker processes (like
+gunicorn workers) each run --readers threads listing a page of units and --writers
+threads updating one unit per transaction, for --seconds. Reported per mode: reads
+and writes per second, write p99 latency, and writes that failed with
+"database is locked".
+
+    python -m tests.bench_sqlite_mode
+    python -m tests.bench_sqlite_mode --processes 4 --readers 4 --writers 4 --seconds 10
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UNITS = 1000
+
+
+def load_app():
+    for worker in ('STK_QUEUE_INLINE_WORKER', 'CALLBACK_INLINE_WORKER', 'RECONCILE_INLINE_WORKER'):
+        os.environ[worker] = '0'
+    sys.path.insert(0, SERVER_DIR)
+    from app import app
+    from models import db, StorageUnit
+    return app, db, StorageUnit
+
+
+def seed():
+    app, db, StorageUnit = load_app()
+    with app.app_context():
+        db.create_all()
+        db.session.execute(StorageUnit.__table__.insert(), [
+            {'unit_number': f'U-{index}', 'site': f'Site {index % 5}', 'size': 10,
+             'monthly_rate': 1000, 'status': 'available', 'row_version': 0}
+            for index in range(UNITS)])
+        db.session.commit()
+
+
+def work(readers, writers, seconds):
+    """Run reader and writer threads in this process; prints counts as JSON"""
+    app, db, StorageUnit = load_app()
+    deadline = time.monotonic() + seconds
+    lock = threading.Lock()
+    totals = {'reads': 0, 'writes': 0, 'locked': 0, 'write_latencies': []}
+
+    def read():
+        reads = 0
+        with app.app_context():
+            while time.monotonic() < deadline:
+                after = random.randrange(UNITS)
+                db.session.query(StorageUnit).filter(StorageUnit.unit_id > after) \
+                    .order_by(StorageUnit.unit_id).limit(50).all()
+                db.session.rollback()
+                reads += 1
+        with lock:
+            totals['reads'] += reads
+
+    def write():
+        writes, locked, latencies = 0, 0, []
+        with app.app_context():
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    db.session.query(StorageUnit).filter(StorageUnit.unit_id == random.randrange(1, UNITS + 1)) \
+                        .update({StorageUnit.monthly_rate: random.randrange(500, 5000)})
+                    db.session.commit()
+                    writes += 1
+                    latencies.append(time.perf_counter() - started)
+                except Exception as e:
+                    db.session.rollback()
+                    if 'locked' not in str(e):
+                        raise
+                    locked += 1
+        with lock:
+            totals['writes'] += writes
+            totals['locked'] += locked
+            totals['write_latencies'] += latencies
+
+    threads = [threading.Thread(target=read) for _ in range(readers)] + \
+        [threading.Thread(target=write) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(json.dumps(totals))
+
+
+def run_mode(enabled, args):
+    directory = tempfile.mkdtemp(prefix='storage-bench-')
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(directory, 'bench.db')}",
+               SQLITE_PERFORMANCE_MODE='1' if enabled else '0')
+    env.pop('DATABASE_REPLICA_URL', None)
+    command = [sys.executable, '-m', 'tests.bench_sqlite_mode']
+    subprocess.run(command + ['--seed'], env=env, cwd=SERVER_DIR, check=True)
+    workers = [subprocess.Popen(command + ['--work', '--readers', str(args.readers), '--writers', str(args.writers),
+                                           '--seconds', str(args.seconds)],
+                                env=env, cwd=SERVER_DIR, stdout=subprocess.PIPE, text=True)
+               for _ in range(args.processes)]
+    totals = {'reads': 0, 'writes': 0, 'locked': 0, 'write_latencies': []}
+    for worker in workers:
+        output, _ = worker.communicate()
+        for key, value in json.loads(output.strip().splitlines()[-1]).items():
+            totals[key] += value
+    latencies = sorted(totals['write_latencies']) or [0]
+    return {
+        'reads/s': totals['reads'] / args.seconds,
+        'writes/s': totals['writes'] / args.seconds,
+        'write p99 ms': latencies[int(len(latencies) * 0.99) - 1 if len(latencies) > 1 else 0] * 1000,
+        'locked': totals['locked'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4, help='reader threads per process')
+    parser.add_argument('--writers', type=int, default=4, help='writer threads per process')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--seed', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--work', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.seed:
+        return seed()
+    if args.work:
+        return work(args.readers, args.writers, args.seconds)
+
+    print(f'{args.processes} processes x ({args.readers} readers + {args.writers} writers), {args.seconds:g}s')
+    print(f"{'mode':<10}{'reads/s':>12}{'writes/s':>12}{'write p99 ms':>15}{'locked':>10}")
+    for enabled in (False, True):
+        result = run_mode(enabled, args)
+        print(f"{'on' if enabled else 'off':<10}{result['reads/s']:>12.0f}{result['writes/s']:>12.0f}"
+              f"{result['write p99 ms']:>15.1f}{result['locked']:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Microbenchmark for the payload validators in schema.py.
+
+Times one spec's check() per record (what the single-record endpoints do) against
+validate_many() over the same batch (what the bulk import does), on a batch with a
+share of invalid rows, and reports the best of several runs in records per second.
+
+    python -m tests.bench_validators
+    python -m tests.bench_validators --records 50000 --invalid 0.25 --runs 10
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schema import BOOKING_SPEC, STORAGE_UNIT_SPEC, validate_many  # noqa: E402
+
+START = date.today() + timedelta(days=7)
+
+SAMPLES = {
+    'storage unit': (STORAGE_UNIT_SPEC,
+                     {'unit_number': 'A-101', 'site': 'Main', 'monthly_rate': 1000, 'size': 10,
+                      'status': 'available', 'features': ['CCTV', 'Climate control']},
+                     {'unit_number': '', 'site': 'Main', 'monthly_rate': 'x', 'status': {}}),
+    'booking': (BOOKING_SPEC,
+                {'unit_id': 1, 'customer_name': 'Jane Doe', 'customer_email': 'jane@example.com',
+                 'customer_phone': '0712345678', 'start_date': START.isoformat(),
+                 'end_date': (START + timedelta(days=30)).isoformat(), 'total_cost': 1000},
+                {'unit_id': 'x', 'customer_name': 'Jane Doe', 'customer_email': 'not-an-email',
+                 'customer_phone': '0712345678', 'start_date': START.isoformat(),
+                 'end_date': START.isoformat(), 'total_cost': -1}),
+}
+
+
+def best_of(runs, fn):
+    best = float('inf')
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=10000, help='records per batch')
+    parser.add_argument('--invalid', type=float, default=0.1, help='share of invalid records')
+    parser.add_argument('--runs', type=int, default=25, help='runs per measurement; the best is kept')
+    args = parser.parse_args()
+
+    every = max(1, round(1 / args.invalid)) if args.invalid > 0 else 0
+    gc.disable()
+    for name, (spec, valid, invalid) in SAMPLES.items():
+        records = [dict(invalid if every and i % every == 0 else valid) for i in range(args.records)]
+
+        def one_by_one():
+            check = spec.check
+            for record in records:
+                check(record)
+
+        per_record = best_of(args.runs, one_by_one)
+        batch = best_of(args.runs, lambda: validate_many(spec, records))
+        print(f'{name:>12}: check() {args.records / per_record:>10,.0f}/s   '
+              f'validate_many() {args.records / batch:>10,.0f}/s')
+
+
+if __name__ == '__main__':
+    main()
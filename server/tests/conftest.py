@@ -0,0 +1,95 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads its configuration at import time, so point it at a scratch database and
+# keep the background workers off before anything imports it
+_db_dir = tempfile.mkdtemp(prefix='storage-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ.pop('DATABASE_REPLICA_URL', None)
+for worker in ('STK_QUEUE_INLINE_WORKER', 'CALLBACK_INLINE_WORKER', 'RECONCILE_INLINE_WORKER'):
+    os.environ[worker] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as flask_app, admin_auth_cache, feature_cache  # noqa: E402
+from models import db, Admin, Booking, Customer, Payment, StorageUnit  # noqa: E402
+import mpesa_service  # noqa: E402
+from mpesa_service import DarajaHttpClient, MpesaService  # noqa: E402
+from tests.helpers import FakeSession  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        db.create_all()
+    # Process-wide caches would otherwise carry ids over from the previous test's database
+    admin_auth_cache._entries.clear()
+    feature_cache.invalidate()
+    yield flask_app
+    with flask_app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_headers(app, client):
+    with app.app_context():
+        admin = Admin(username='admin', email='admin@example.com', role='admin')
+        admin.set_password('admin123')
+        db.session.add(admin)
+        db.session.commit()
+    response = client.post('/api/admin/login', json={'username': 'admin', 'password': 'admin123'})
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+
+@pytest.fixture
+def make_unit(app):
+    def make_unit(**values):
+        with app.app_context():
+            unit = StorageUnit(**dict({'unit_number': 'A-1', 'site': 'Main', 'size': 10,
+                                       'monthly_rate': 1000, 'status': 'available'}, **values))
+            db.session.add(unit)
+            db.session.commit()
+            return unit.unit_id
+    return make_unit
+
+
+@pytest.fixture
+def make_booking(app):
+    def make_booking(unit_id, start_date, end_date, status='pending', payment=None, email='jane@example.com'):
+        """Insert a booking (and optionally its payment) directly; returns the booking id"""
+        with app.app_context():
+            customer = Customer.query.filter_by(email=email).first() or \
+                Customer(name='Jane', email=email, phone='0700000000')
+            booking = Booking(unit_id=unit_id, customer=customer, customer_name='Jane',
+                              customer_email=email, customer_phone='0700000000',
+                              start_date=start_date, end_date=end_date, total_cost=1000, status=status)
+            db.session.add(booking)
+            if payment:
+                db.session.add(Payment(booking=booking, amount=1000, payment_method='mpesa', **payment))
+            db.session.commit()
+            return booking.booking_id
+    return make_booking
+
+
+@pytest.fixture
+def daraja(monkeypatch):
+    """A fresh Daraja client without retries whose breaker opens on the first failure"""
+    client = DarajaHttpClient()
+    client.max_retries = 0
+    client.breaker.failure_threshold = 1
+    monkeypatch.setattr(mpesa_service, 'daraja_http', client)
+    monkeypatch.setattr(MpesaService, 'get_access_token', lambda self: 'token')
+
+    def serve(*outcomes):
+        client._session, client._session_pid = FakeSession(*outcomes), mpesa_service.os.getpid()
+        return client._session
+    client.serve = serve
+    return client
@@ -0,0 +1,76 @@
+"""
+Export N synthetic payments through GET /api/export/payments in a fresh process and
+report the process's peak RSS. test_export.py runs it in a subprocess so the peak
+is not inflated by other tests.
+
+    python -m tests.export_memory --rows 1000000 --format ndjson
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+_db_dir = tempfile.mkdtemp(prefix='storage-export-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_db_dir, 'export.db')}"
+os.environ.pop('DATABASE_REPLICA_URL', None)
+for worker in ('STK_QUEUE_INLINE_WORKER', 'CALLBACK_INLINE_WORKER', 'RECONCILE_INLINE_WORKER'):
+    os.environ[worker] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+from models import db, Admin, Payment  # noqa: E402
+
+BATCH = 10000
+
+
+def seed(rows):
+    paid = datetime(2030, 1, 1)
+    for first in range(0, rows, BATCH):
+        db.session.execute(Payment.__table__.insert(), [
+            {'amount': 1000, 'payment_method': 'mpesa', 'status': 'completed',
+             'payment_date': paid + timedelta(minutes=index), 'mpesa_receipt_number': f'R{index:09d}',
+             'checkout_request_id': f'ws_CO_{index}', 'phone_number': '254712345678', 'row_version': 0}
+            for index in range(first, min(first + BATCH, rows))])
+        db.session.commit()
+        db.session.expunge_all()
+
+
+def max_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson')
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        admin = Admin(username='admin', email='admin@example.com', role='admin')
+        admin.set_password('admin123')
+        db.session.add(admin)
+        db.session.commit()
+        seed(args.rows)
+    seeded_rss = max_rss_mb()
+
+    client = app.test_client()
+    token = client.post('/api/admin/login', json={'username': 'admin', 'password': 'admin123'}).get_json()
+    response = client.get(f'/api/export/payments?format={args.format}',
+                          headers={'Authorization': f"Bearer {token['access_token']}"})
+    lines = size = 0
+    for chunk in response.response:
+        lines += chunk.count(b'\n' if isinstance(chunk, bytes) else '\n')
+        size += len(chunk)
+    response.close()
+
+    print(json.dumps({'status': response.status_code, 'lines': lines, 'bytes': size,
+                      'seeded_rss_mb': round(seeded_rss, 1), 'max_rss_mb': round(max_rss_mb(), 1)}))
+
+
+if __name__ == '__main__':
+    main()
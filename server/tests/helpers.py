@@ -0,0 +1,62 @@
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import requests
+from sqlalchemy import event
+
+from models import db
+
+
+def booking_payload(unit_id, start_in_days, nights, **values):
+    """Body for POST /api/bookings starting start_in_days from today"""
+    start = date.today() + timedelta(days=start_in_days)
+    return dict({
+        'unit_id': unit_id,
+        'customer_name': 'Jane Doe',
+        'customer_email': 'jane@example.com',
+        'customer_phone': '0712345678',
+        'start_date': start.isoformat(),
+        'end_date': (start + timedelta(days=nights)).isoformat(),
+        'total_cost': 1000,
+    }, **values)
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code} error')
+
+
+class FakeSession:
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@contextmanager
+def count_queries(app):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
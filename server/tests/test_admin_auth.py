@@ -0,0 +1,35 @@
+from app import admin_auth_cache
+from models import db, Admin
+
+
+def test_revoked_tokens_are_rejected_once_the_cache_expires(app, client, admin_headers, monkeypatch):
+    assert client.get('/api/admin/stats', headers=admin_headers).status_code == 200
+
+    result = app.test_cli_runner().invoke(args=['revoke-admin-tokens', 'admin'])
+    assert result.exit_code == 0, result.output
+    assert result.output.startswith('Revoked tokens of admin')
+    with app.app_context():
+        assert Admin.query.filter_by(username='admin').one().token_version == 1
+
+    # Still served from this worker's cache until the entry expires
+    assert client.get('/api/admin/stats', headers=admin_headers).status_code == 200
+    monkeypatch.setattr(admin_auth_cache, 'ttl', 0)
+    admin_auth_cache._entries.clear()
+    assert client.get('/api/admin/stats', headers=admin_headers).status_code == 403
+
+    login = client.post('/api/admin/login', json={'username': 'admin', 'password': 'admin123'})
+    fresh = {'Authorization': f"Bearer {login.get_json()['access_token']}"}
+    assert client.get('/api/admin/stats', headers=fresh).status_code == 200
+
+
+def test_revoking_an_unknown_admin_fails(app):
+    result = app.test_cli_runner().invoke(args=['revoke-admin-tokens', 'nobody'])
+    assert result.exit_code != 0 and 'No admin named nobody' in result.output
+
+
+def test_role_changes_take_effect_without_a_new_login(app, client, admin_headers, monkeypatch):
+    monkeypatch.setattr(admin_auth_cache, 'ttl', 0)
+    with app.app_context():
+        Admin.query.filter_by(username='admin').one().role = 'manager'
+        db.session.commit()
+    assert client.get('/api/admin/stats', headers=admin_headers).status_code == 403
@@ -0,0 +1,42 @@
+from datetime import date
+
+from models import db, Payment
+
+
+def test_stats_match_the_seeded_tables(app, client, admin_headers, make_unit, make_booking):
+    small = make_unit(unit_number='A-1', size=5, status='booked')
+    make_unit(unit_number='A-2', size=5)
+    make_unit(unit_number='B-1', size=20)
+    first = make_booking(small, date(2030, 1, 1), date(2030, 2, 1), status='paid')
+    make_booking(small, date(2030, 3, 1), date(2030, 4, 1))
+    with app.app_context():
+        for status, amount, method in [('completed', 1500, 'mpesa'), ('failed', 700, 'mpesa'),
+                                       ('pending', 300, 'mpesa'), ('queued', 200, 'mpesa'),
+                                       ('dispatching', 100, 'mpesa'), ('pending', 50, 'cash')]:
+            db.session.add(Payment(booking_id=first, amount=amount, status=status, payment_method=method))
+        db.session.commit()
+
+    response = client.get('/api/admin/stats', headers=admin_headers)
+
+    assert response.status_code == 200
+    stats = response.get_json()
+    assert stats['units'] == {
+        'total': 3,
+        'by_status': {'available': 2, 'booked': 1},
+        'by_size': [{'size': 5.0, 'count': 2}, {'size': 20.0, 'count': 1}]
+    }
+    assert stats['bookings'] == {'total': 2, 'by_status': {'paid': 1, 'pending': 1}}
+    payments = stats['payments']
+    assert payments['total'] == 6
+    assert payments['by_status']['pending'] == {'count': 2, 'amount': 350.0}
+    assert payments['by_status']['completed'] == {'count': 1, 'amount': 1500.0}
+    assert payments['by_method'] == {'mpesa': 5, 'cash': 1}
+    # Everything not yet completed or failed is still owed
+    assert payments['pending_amount'] == 650.0
+
+
+def test_stats_of_an_empty_database(client, admin_headers):
+    stats = client.get('/api/admin/stats', headers=admin_headers).get_json()
+
+    assert stats['units']['total'] == 0
+    assert stats['payments'] == {'total': 0, 'by_status': {}, 'by_method': {}, 'pending_amount': 0}
@@ -0,0 +1,32 @@
+from datetime import date, timedelta
+
+from models import db, StorageUnit
+from tests.helpers import booking_payload
+
+
+def available_ids(client, start_in_days, nights):
+    start = date.today() + timedelta(days=start_in_days)
+    response = client.get(f'/api/units/availability?start={start.isoformat()}'
+                          f'&end={(start + timedelta(days=nights)).isoformat()}')
+    assert response.status_code == 200
+    return [unit['unit_id'] for unit in response.get_json()]
+
+
+def test_future_booking_holds_only_its_dates(app, client, make_unit):
+    unit_id = make_unit()
+    assert client.post('/api/bookings', json=booking_payload(unit_id, 30, 30)).status_code == 201
+
+    with app.app_context():
+        assert db.session.get(StorageUnit, unit_id).status == 'available'
+    assert available_ids(client, 30, 30) == []
+    assert available_ids(client, 1, 10) == [unit_id]
+    assert client.post('/api/bookings', json=booking_payload(unit_id, 1, 10)).status_code == 201
+
+
+def test_booking_starting_today_marks_the_unit_booked(app, client, make_unit):
+    unit_id = make_unit()
+    assert client.post('/api/bookings', json=booking_payload(unit_id, 0, 30)).status_code == 201
+    with app.app_context():
+        assert db.session.get(StorageUnit, unit_id).status == 'booked'
+    # Status is display only; the unit is still bookable once the booking ends
+    assert available_ids(client, 30, 10) == [unit_id]
@@ -0,0 +1,63 @@
+import os
+import threading
+
+import pytest
+
+from models import db, Booking
+from tests.helpers import booking_payload
+
+
+@pytest.mark.parametrize('start_in_days, nights, expected', [
+    (5, 10, 409),   # inside the existing booking
+    (1, 7, 409),    # overlaps its start
+    (14, 5, 409),   # overlaps its end
+    (0, 5, 201),    # ends the day it starts
+    (15, 5, 201),   # starts the day it ends
+])
+def test_overlapping_bookings_conflict_and_adjacent_ones_do_not(client, make_unit, start_in_days, nights,
+                                                                expected):
+    unit_id = make_unit()
+    assert client.post('/api/bookings', json=booking_payload(unit_id, 5, 10)).status_code == 201
+
+    response = client.post('/api/bookings', json=booking_payload(unit_id, start_in_days, nights))
+    assert response.status_code == expected
+
+
+def test_cancelled_booking_frees_its_dates(client, make_unit):
+    unit_id = make_unit()
+    response = client.post('/api/bookings', json=booking_payload(unit_id, 5, 10))
+    assert response.status_code == 201
+    with client.application.app_context():
+        db.session.get(Booking, response.get_json()['booking_id']).status = 'cancelled'
+        db.session.commit()
+    assert client.post('/api/bookings', json=booking_payload(unit_id, 5, 10)).status_code == 201
+
+
+def test_parallel_bookings_of_one_unit_have_exactly_one_winner(app, make_unit):
+    racers = int(os.getenv('BOOKING_RACERS', '200'))
+    contested = make_unit(unit_number='A-1')
+    others = [make_unit(unit_number=f'B-{index}') for index in range(10)]
+    requests = [(contested, f'racer{index}@example.com') for index in range(racers)] + \
+        [(unit_id, f'other{unit_id}@example.com') for unit_id in others]
+
+    barrier = threading.Barrier(len(requests))
+    results = {}
+
+    def book(index, unit_id, email):
+        client = app.test_client()
+        barrier.wait()
+        results[index] = client.post('/api/bookings', json=booking_payload(unit_id, 3, 30, customer_email=email))
+
+    threads = [threading.Thread(target=book, args=(index, unit_id, email))
+               for index, (unit_id, email) in enumerate(requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    statuses = [results[index].status_code for index in range(len(requests))]
+    assert sorted(statuses[:racers]) == [201] + [409] * (racers - 1)
+    # Bookings of other units are not turned away by the contested one
+    assert statuses[racers:] == [201] * len(others)
+    with app.app_context():
+        assert Booking.query.filter_by(unit_id=contested).count() == 1
@@ -0,0 +1,58 @@
+import io
+
+from models import db, Feature, StorageUnit, UnitFeatureLink
+
+CSV = (
+    'unit_number,site,size,monthly_rate,status,location,features\n'
+    'C-1,Main,10,1000,available,Ground floor,CCTV;Climate control\n'
+    'C-2,Main,,1500,booked,,\n'                     # blank optional cells
+    ',Main,10,1000,available,,CCTV\n'               # missing unit number
+    'C-4,Main,10,lots,available,,CCTV\n'            # rate is not a number
+    'C-5,Annex,20,2000,reserved,,Alarm\n'           # unknown status
+    'C-6,Annex,20,2000,available,, CCTV ;Alarm;\n'  # features padded and trailing ';'
+)
+
+
+def imported_units(app):
+    with app.app_context():
+        units = {}
+        for unit in StorageUnit.query.order_by(StorageUnit.unit_number):
+            names = db.session.scalars(
+                db.select(Feature.name).join(UnitFeatureLink, UnitFeatureLink.feature_id == Feature.feature_id)
+                .where(UnitFeatureLink.unit_id == unit.unit_id).order_by(Feature.name))
+            units[unit.unit_number] = (unit.site, unit.size, float(unit.monthly_rate), unit.status,
+                                       unit.location, list(names))
+        return units
+
+
+def check_import(app, response):
+    assert response.status_code == 201
+    body = response.get_json()
+    assert (body['created'], body['failed']) == (3, 3)
+    assert [(error['row'], error['messages']) for error in body['errors']] == [
+        (2, ['Unit number must be between 1 and 20 characters']),
+        (3, ['Monthly rate must be a valid number']),
+        (4, ['Status must be either available or booked']),
+    ]
+    assert imported_units(app) == {
+        'C-1': ('Main', 10, 1000.0, 'available', 'Ground floor', ['CCTV', 'Climate control']),
+        'C-2': ('Main', None, 1500.0, 'booked', None, []),
+        'C-6': ('Annex', 20, 2000.0, 'available', None, ['Alarm', 'CCTV']),
+    }
+
+
+def test_csv_upload_imports_valid_rows_and_reports_the_rest(app, client, admin_headers):
+    response = client.post('/api/units/bulk', headers=admin_headers, content_type='multipart/form-data',
+                           data={'file': (io.BytesIO(('\ufeff' + CSV).encode()), 'units.csv')})
+    check_import(app, response)
+
+
+def test_csv_body_is_imported_like_an_upload(app, client, admin_headers):
+    response = client.post('/api/units/bulk', headers=admin_headers, data=CSV, content_type='text/csv')
+    check_import(app, response)
+
+
+def test_features_are_created_once_across_rows(app, client, admin_headers):
+    client.post('/api/units/bulk', headers=admin_headers, data=CSV, content_type='text/csv')
+    with app.app_context():
+        assert sorted(db.session.scalars(db.select(Feature.name))) == ['Alarm', 'CCTV', 'Climate control']
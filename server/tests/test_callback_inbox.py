@@ -0,0 +1,153 @@
+import os
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from callback_inbox import callback_inbox
+from models import db, Booking, MpesaCallback, Payment
+
+
+def callback_body(checkout_request_id, result_code=0, receipt='RCP123'):
+    body = {'MerchantRequestID': f'm-{checkout_request_id}', 'CheckoutRequestID': checkout_request_id,
+            'ResultCode': result_code, 'ResultDesc': 'ok' if result_code == 0 else 'Request cancelled by user'}
+    if result_code == 0:
+        body['CallbackMetadata'] = {'Item': [{'Name': 'Amount', 'Value': 1000},
+                                             {'Name': 'MpesaReceiptNumber', 'Value': receipt}]}
+    return {'Body': {'stkCallback': body}}
+
+
+def drain():
+    while callback_inbox.drain_once():
+        pass
+
+
+@pytest.fixture
+def booking(make_unit, make_booking):
+    start = date.today() + timedelta(days=1)
+    return make_booking(make_unit(), start, start + timedelta(days=30),
+                        payment={'status': 'pending', 'checkout_request_id': 'ws_CO_1'})
+
+
+def retry_now(app):
+    """Make callbacks waiting for their payment due on the next drain"""
+    with app.app_context():
+        db.session.execute(MpesaCallback.__table__.update()
+                           .where(MpesaCallback.processed_at.is_(None)).values(retry_at=None))
+        db.session.commit()
+
+
+def test_duplicate_callback_is_stored_and_applied_once(app, client, booking):
+    for _ in range(2):
+        response = client.post('/api/mpesa/callback', json=callback_body('ws_CO_1'))
+        assert response.get_json() == {'ResultCode': 0, 'ResultDesc': 'Success'}
+    drain()
+    # A late retry carrying a different result changes nothing
+    client.post('/api/mpesa/callback', json=callback_body('ws_CO_1', result_code=1032))
+    assert not callback_inbox.drain_once()
+
+    with app.app_context():
+        assert [(c.checkout_request_id, c.outcome) for c in MpesaCallback.query] == [('ws_CO_1', 'applied')]
+        booking_row = db.session.get(Booking, booking)
+        assert (booking_row.payment.status, booking_row.payment.mpesa_receipt_number) == ('completed', 'RCP123')
+        assert booking_row.status == 'paid'
+
+
+def test_callback_fills_in_the_receipt_of_a_queried_payment(app, client, booking):
+    with app.app_context():
+        # stkpushquery settled the payment first; its response has no receipt number
+        db.session.get(Booking, booking).payment.apply_mpesa_result('0')
+        db.session.commit()
+
+    client.post('/api/mpesa/callback', json=callback_body('ws_CO_1', receipt='RCP777'))
+    drain()
+
+    with app.app_context():
+        payment = db.session.get(Booking, booking).payment
+        assert (payment.status, payment.mpesa_receipt_number, payment.transaction_id) == \
+            ('completed', 'RCP777', 'RCP777')
+        assert MpesaCallback.query.one().outcome == 'applied'
+
+
+def test_callback_that_beats_its_payment_is_retried(app, client, make_unit, make_booking):
+    start = date.today() + timedelta(days=1)
+    booking_id = make_booking(make_unit(), start, start + timedelta(days=30), payment={'status': 'pending'})
+    client.post('/api/mpesa/callback', json=callback_body('ws_CO_2'))
+    drain()
+    with app.app_context():
+        assert MpesaCallback.query.one().processed_at is None
+        # The STK push is recorded after its callback arrived
+        db.session.get(Booking, booking_id).payment.checkout_request_id = 'ws_CO_2'
+        db.session.commit()
+
+    retry_now(app)
+    drain()
+    with app.app_context():
+        assert MpesaCallback.query.one().outcome == 'applied'
+        assert db.session.get(Booking, booking_id).payment.status == 'completed'
+
+
+def test_callback_without_a_payment_expires_unmatched(app, client, monkeypatch):
+    monkeypatch.setattr(callback_inbox, 'unmatched_ttl', timedelta(0))
+    client.post('/api/mpesa/callback', json=callback_body('ws_CO_missing'))
+    drain()
+    with app.app_context():
+        assert MpesaCallback.query.one().outcome == 'unmatched'
+
+
+def test_replay_with_duplicates_and_out_of_order_callbacks(app, client, make_unit):
+    count = int(os.getenv('CALLBACK_REPLAY_COUNT', '10000'))
+    rng = random.Random(22)
+    unit_id = make_unit()
+    start = date.today() + timedelta(days=1)
+    # Every fifth payment only gets its CheckoutRequestID after its callback arrived
+    late = {f'ws_CO_{index}' for index in range(0, count, 5)}
+    with app.app_context():
+        booking_ids = db.session.scalars(Booking.__table__.insert().returning(Booking.booking_id), [
+            {'unit_id': unit_id, 'customer_name': 'Jane', 'customer_email': f'c{index}@example.com',
+             'customer_phone': '0700000000', 'start_date': start, 'end_date': start + timedelta(days=30),
+             'status': 'pending', 'approval_status': 'pending_approval', 'total_cost': 1000, 'row_version': 0}
+            for index in range(count)]).all()
+        db.session.execute(Payment.__table__.insert(), [
+            {'booking_id': booking_id, 'amount': 1000, 'payment_method': 'mpesa', 'status': 'pending',
+             'checkout_request_id': None if f'ws_CO_{index}' in late else f'ws_CO_{index}',
+             'payment_date': datetime.utcnow(), 'row_version': 0}
+            for index, booking_id in enumerate(booking_ids)])
+        db.session.commit()
+
+    # One callback per payment, and Daraja retries for 30% of them, sometimes with another result
+    results = {f'ws_CO_{index}': rng.choice((0, 0, 0, 1032)) for index in range(count)}
+    deliveries = [(checkout_request_id, code) for checkout_request_id, code in results.items()]
+    deliveries += [(checkout_request_id, rng.choice((code, 1032)))
+                   for checkout_request_id, code in rng.sample(sorted(results.items()), count * 3 // 10)]
+    rng.shuffle(deliveries)
+
+    first_result = {}
+    for delivered, (checkout_request_id, code) in enumerate(deliveries, 1):
+        response = client.post('/api/mpesa/callback',
+                               json=callback_body(checkout_request_id, code, f'R{checkout_request_id}'))
+        assert response.status_code == 200
+        first_result.setdefault(checkout_request_id, code)
+        if delivered % 1000 == 0:
+            drain()
+    drain()
+
+    # The late STK pushes are recorded now, after their callbacks
+    index = db.cast(Payment.booking_id - booking_ids[0], db.String)
+    with app.app_context():
+        db.session.execute(Payment.__table__.update()
+                           .where(Payment.checkout_request_id.is_(None))
+                           .values(checkout_request_id='ws_CO_' + index))
+        db.session.commit()
+    retry_now(app)
+    drain()
+
+    with app.app_context():
+        outcomes = dict(db.session.query(MpesaCallback.checkout_request_id, MpesaCallback.outcome))
+        assert len(outcomes) == count
+        assert set(outcomes.values()) == {'applied'}
+        # The first delivery of each CheckoutRequestID decides the payment
+        for payment_status, booking_status, checkout_request_id in db.session.query(
+                Payment.status, Booking.status, Payment.checkout_request_id).join(Payment.booking):
+            expected = 'completed' if first_result[checkout_request_id] == 0 else 'failed'
+            assert (payment_status, booking_status) == (expected, 'paid' if expected == 'completed' else 'pending')
@@ -0,0 +1,54 @@
+from datetime import date
+
+from models import db, ChangeVersion, StorageUnit
+
+
+def test_list_answers_304_until_a_rendered_table_changes(client, admin_headers, make_unit, make_booking):
+    unit_id = make_unit()
+    make_booking(unit_id, date(2030, 1, 1), date(2030, 2, 1))
+
+    for path in ('/api/units', '/api/bookings', '/api/payments'):
+        first = client.get(path)
+        assert first.status_code == 200
+        etag = first.headers['ETag']
+        assert client.get(path, headers={'If-None-Match': etag}).status_code == 304
+
+    etags = {path: client.get(path).headers['ETag'] for path in ('/api/units', '/api/bookings')}
+    # Bookings embed their unit, so editing the unit must invalidate the bookings list too
+    response = client.put(f'/api/units/{unit_id}', json={'monthly_rate': 1500}, headers=admin_headers)
+    assert response.status_code == 200
+    for path, etag in etags.items():
+        response = client.get(path, headers={'If-None-Match': etag})
+        assert response.status_code == 200, path
+
+
+def test_since_returns_only_rows_changed_after_the_version(app, client, make_unit):
+    first_id = make_unit(unit_number='A-1')
+    version = int(client.get('/api/units').headers['X-Change-Version'])
+    second_id = make_unit(unit_number='A-2')
+
+    response = client.get(f'/api/units?since={version}')
+    assert [unit['unit_id'] for unit in response.get_json()] == [second_id]
+    assert int(response.headers['X-Change-Version']) > version
+
+    with app.app_context():
+        unit = db.session.get(StorageUnit, first_id)
+        unit.status = 'maintenance'
+        db.session.commit()
+        assert unit.row_version == ChangeVersion.current(('storageunit',))['storageunit']
+    response = client.get(f'/api/units?since={version}')
+    assert sorted(unit['unit_id'] for unit in response.get_json()) == [first_id, second_id]
+
+
+def test_versions_are_claimed_once_per_commit(app, make_unit):
+    make_unit()
+    with app.app_context():
+        before = ChangeVersion.current(('storageunit',))['storageunit']
+        units = StorageUnit.query.all()
+        for rate in (1100, 1200, 1300):
+            # Several flushes in one transaction still produce a single new version
+            units[0].monthly_rate = rate
+            db.session.flush()
+        db.session.commit()
+        assert ChangeVersion.current(('storageunit',))['storageunit'] == before + 1
+        assert units[0].row_version == before + 1
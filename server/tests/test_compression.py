@@ -0,0 +1,94 @@
+import gzip
+
+import pytest
+from flask import Flask, Response
+from flask_restful import Api, Resource
+from werkzeug.http import parse_accept_header
+
+import responses
+from responses import _negotiate
+
+brotli = pytest.importorskip('brotli')
+
+BIG = [{'unit_id': index, 'unit_number': f'A-{index}', 'status': 'available'} for index in range(200)]
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('gzip, deflate, br', 'br'),
+    ('br;q=0.5, gzip', 'gzip'),
+    ('br, gzip;q=0.8', 'br'),
+    ('gzip', 'gzip'),
+    ('br;q=0, gzip', 'gzip'),
+    ('gzip;q=0, br;q=0', None),
+    ('gzip;q=0', None),
+    ('identity', None),
+    ('', None),
+    ('*', 'br'),
+])
+def test_negotiate_prefers_br_then_gzip_and_honours_q0(header, expected):
+    assert _negotiate(parse_accept_header(header)) == expected
+
+
+def test_negotiate_without_brotli_falls_back_to_gzip(monkeypatch):
+    monkeypatch.setattr(responses, 'brotli', None)
+    assert _negotiate(parse_accept_header('br, gzip')) == 'gzip'
+    assert _negotiate(parse_accept_header('br')) is None
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv('COMPRESS_MIN_BYTES', '1024')
+    app = Flask(__name__)
+    api = Api(app)
+    responses.init_app(app, api)
+
+    class Units(Resource):
+        def get(self):
+            return BIG, 200, {'ETag': '"units-1"'}
+
+    class Unit(Resource):
+        def get(self):
+            return BIG[0], 200, {'ETag': '"unit-1"'}
+
+    api.add_resource(Units, '/units')
+    api.add_resource(Unit, '/unit')
+    app.add_url_rule('/logo', 'logo', lambda: Response(b'\x89PNG' + b'\0' * 4096, mimetype='image/png'))
+    app.add_url_rule('/unchanged', 'unchanged', lambda: Response(status=304, headers={'ETag': '"units-1"'}))
+    return app.test_client()
+
+
+@pytest.mark.parametrize('accept, decompress', [('br', brotli.decompress), ('gzip', gzip.decompress)])
+def test_large_json_is_compressed_and_its_etag_weakened(client, accept, decompress):
+    plain = client.get('/units')
+    response = client.get('/units', headers={'Accept-Encoding': accept})
+
+    assert response.headers['Content-Encoding'] == accept
+    assert decompress(response.get_data()) == plain.get_data()
+    assert int(response.headers['Content-Length']) == len(response.get_data()) < len(plain.get_data())
+    assert response.headers['ETag'] == 'W/"units-1"'
+    assert 'Accept-Encoding' in response.vary
+
+
+def test_uncompressed_responses_keep_a_strong_etag_and_vary(client):
+    response = client.get('/units', headers={'Accept-Encoding': 'identity'})
+
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['ETag'] == '"units-1"'
+    assert 'Accept-Encoding' in response.vary
+
+
+def test_bodies_below_the_threshold_are_sent_as_is(client):
+    response = client.get('/unit', headers={'Accept-Encoding': 'br, gzip'})
+
+    assert len(response.get_data()) < 1024
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['ETag'] == '"unit-1"'
+    # Whether the body is compressed still depends on Accept-Encoding
+    assert 'Accept-Encoding' in response.vary
+
+
+def test_incompressible_and_bodiless_responses_are_untouched(client):
+    for path in ('/logo', '/unchanged'):
+        response = client.get(path, headers={'Accept-Encoding': 'br, gzip'})
+        assert 'Content-Encoding' not in response.headers
+        assert 'Accept-Encoding' not in response.vary
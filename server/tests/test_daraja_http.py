@@ -0,0 +1,126 @@
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from mpesa_async import DarajaLoop
+from mpesa_service import DarajaHttpClient
+
+
+class DarajaStub(BaseHTTPRequestHandler):
+    """Loopback Daraja: /slow answers after a second, anything else after server.delay"""
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with server.lock:
+            server.requests.append((self.client_address, self.path))
+            server.in_flight += 1
+            server.peak = max(server.peak, server.in_flight)
+        time.sleep(1 if self.path == '/slow' else server.delay)
+        with server.lock:
+            server.in_flight -= 1
+        body = json.dumps({'ResponseCode': '0', 'access_token': 'token', 'expires_in': '3599'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), DarajaStub)
+    server.daemon_threads = True
+    server.requests, server.delay = [], 0
+    server.lock, server.in_flight, server.peak = threading.Lock(), 0, 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client():
+    client = DarajaHttpClient()
+    client.connect_timeout, client.read_timeout = 0.5, 0.3
+    client.backoff_base = 0
+    return client
+
+
+def test_calls_reuse_one_keep_alive_connection(stub, client):
+    server, url = stub
+    for _ in range(10):
+        assert client.request('GET', f'{url}/oauth').json()['ResponseCode'] == '0'
+
+    assert len(server.requests) == 10
+    assert len({address for address, _ in server.requests}) == 1
+
+
+def test_read_timeout_is_retried_only_when_idempotent(stub, client):
+    server, url = stub
+    client.max_retries = 2
+
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.request('POST', f'{url}/slow')
+    assert len(server.requests) == 1  # an STK push is never sent twice
+
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.request('GET', f'{url}/slow', idempotent=True)
+    assert len(server.requests) == 1 + 3
+
+
+def test_connect_timeout_is_bounded(client):
+    # A listener that never accepts: once its backlog is full the kernel drops new SYNs
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(0)
+    address = listener.getsockname()
+    backlog = []
+    try:
+        for _ in range(4):
+            sock = socket.socket()
+            sock.setblocking(False)
+            sock.connect_ex(address)
+            backlog.append(sock)
+        client.max_retries = 0
+
+        started = time.monotonic()
+        with pytest.raises(requests.exceptions.ConnectTimeout):
+            client.request('POST', f'http://{address[0]}:{address[1]}/stkpush')
+        assert time.monotonic() - started < client.connect_timeout + 0.5
+    finally:
+        for sock in backlog:
+            sock.close()
+        listener.close()
+
+
+def test_loop_bounds_in_flight_calls_and_connections_per_client(stub, monkeypatch):
+    server, url = stub
+    server.delay = 0.2
+    monkeypatch.setenv('MPESA_BASE_URL', url)
+    monkeypatch.setenv('MPESA_MAX_IN_FLIGHT', '20')
+    loop = DarajaLoop()
+
+    futures = [loop.submit('stk_push', '254712345678', 1, 'REF', 'Storage') for _ in range(60)]
+
+    assert all(future.result(10)['success'] for future in futures)
+    pushes = [address for address, path in server.requests if path.endswith('/processrequest')]
+    assert len(pushes) == 60
+    # A cold start shares one token request across every client of the loop
+    assert sum(path.startswith('/oauth') for _, path in server.requests) == 1
+    assert server.peak == 20
+    # Three clients with 8, 8 and 4 slots, each reusing its own connections
+    assert len(set(pushes)) == 20
@@ -0,0 +1,83 @@
+from datetime import date
+
+from events import ADMIN_TOPIC, booking_topic, broker, change_feed
+from models import db, Payment
+from stk_queue import stk_queue
+
+
+def drain(subscription):
+    events = []
+    while True:
+        payload = subscription.get(timeout=0)
+        if payload is None:
+            return events
+        events.append(payload)
+
+
+def test_feed_publishes_changes_from_orm_and_core_writes(app, client, admin_headers, make_unit, make_booking):
+    unit_id = make_unit()
+    booking_id = make_booking(unit_id, date(2030, 1, 1), date(2030, 2, 1),
+                              payment={'status': 'queued', 'phone_number': '254700000000'})
+    admin = broker.subscribe([ADMIN_TOPIC])
+    customer = broker.subscribe([booking_topic(booking_id)])
+    try:
+        change_feed.poll_once()  # baseline
+
+        # Core UPDATE from the STK queue claim, as run by `flask stk-worker` in another process
+        with app.app_context():
+            assert len(stk_queue._claim()[0]) == 1
+        # Bulk Core UPDATE from the admin API
+        response = client.put('/api/units/bulk', json={'filter': {'unit_ids': [unit_id]},
+                                                       'set': {'status': 'booked'}}, headers=admin_headers)
+        assert response.status_code == 200
+        # ORM write
+        with app.app_context():
+            payment = Payment.query.filter_by(booking_id=booking_id).one()
+            payment.status = 'completed'
+            db.session.commit()
+            payment_id = payment.payment_id
+
+        change_feed.poll_once()
+        events = drain(admin)
+        assert {'type': 'unit', 'id': unit_id, 'status': 'booked'}.items() <= events[0].items()
+        assert {'type': 'payment', 'id': payment_id, 'status': 'completed'}.items() <= events[1].items()
+        assert [event['type'] for event in drain(customer)] == ['payment']
+
+        change_feed.poll_once()
+        assert drain(admin) == []
+    finally:
+        broker.unsubscribe(admin)
+        broker.unsubscribe(customer)
+        change_feed._versions = None
+
+
+def test_bulk_changes_send_one_resync_event(app, client, admin_headers, make_unit, monkeypatch):
+    for number in range(3):
+        make_unit(unit_number=f'B-{number}')
+    monkeypatch.setattr(change_feed, 'max_batch', 2)
+    admin = broker.subscribe([ADMIN_TOPIC])
+    try:
+        change_feed.poll_once()
+        client.put('/api/units/bulk', json={'filter': {'site': 'Main'}, 'set': {'monthly_rate': 900}},
+                   headers=admin_headers)
+        change_feed.poll_once()
+        assert [event['type'] for event in drain(admin)] == ['resync']
+    finally:
+        broker.unsubscribe(admin)
+        change_feed._versions = None
+
+
+def test_event_stream_refuses_beyond_max_subscribers(client, monkeypatch):
+    monkeypatch.setattr(broker, 'max_subscribers', broker.subscriber_count() + 1)
+
+    first = client.get('/api/events?booking_id=1')
+    assert first.status_code == 200
+    refused = client.get('/api/events?booking_id=2')
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After'] == '30'
+
+    # Closed before a single frame was read: the slot is still given back
+    first.close()
+    second = client.get('/api/events?booking_id=2')
+    assert second.status_code == 200
+    second.close()
@@ -0,0 +1,80 @@
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+from datetime import date, timedelta
+
+import responses
+from models import Booking
+from serializers import flat_serializer
+
+# Growth of peak RSS allowed while exporting, over the process after seeding
+EXPORT_RSS_CEILING_MB = 40
+
+
+def bookings(make_unit, make_booking, count):
+    unit_id = make_unit()
+    start = date.today() + timedelta(days=1)
+    return [make_booking(unit_id, start + timedelta(days=2 * i), start + timedelta(days=2 * i + 1),
+                         email=f'customer{i}@example.com')
+            for i in range(count)]
+
+
+def test_ndjson_export_streams_one_record_per_line(client, admin_headers, make_unit, make_booking):
+    booking_ids = bookings(make_unit, make_booking, 3)
+
+    response = client.get('/api/export/bookings?fields=booking_id,start_date,total_cost', headers=admin_headers)
+
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.get_data(as_text=True).splitlines()
+    records = [json.loads(line) for line in lines]
+    assert [record['booking_id'] for record in records] == booking_ids
+    # Encoded like the JSON API: ISO dates, Decimals as strings
+    assert records[0]['start_date'] == (date.today() + timedelta(days=1)).isoformat()
+    assert records[0]['total_cost'] == '1000.00'
+    assert lines[0] == responses.dumps(records[0]).decode()
+
+
+def test_csv_export_has_a_header_row(client, admin_headers, make_unit, make_booking):
+    booking_ids = bookings(make_unit, make_booking, 2)
+
+    response = client.get('/api/export/bookings?format=csv&fields=booking_id,customer_email',
+                          headers=admin_headers)
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows == [['booking_id', 'customer_email']] + \
+        [[str(booking_id), f'customer{i}@example.com'] for i, booking_id in enumerate(booking_ids)]
+
+
+def test_export_is_written_in_chunks(app, make_unit, make_booking):
+    bookings(make_unit, make_booking, 5)
+    serializer = flat_serializer(Booking, ('booking_id', 'status'))
+    with app.app_context():
+        rows = Booking.query.with_entities(*serializer.columns).order_by(Booking.booking_id)
+        chunks = list(responses.stream_export(serializer, rows, chunk_size=2))
+        csv_chunks = list(responses.stream_export(serializer, rows, fmt='csv', chunk_size=2))
+
+    assert [chunk.count(b'\n') for chunk in chunks] == [2, 2, 1]
+    # The header goes out with the first chunk of rows
+    assert [chunk.count('\n') for chunk in csv_chunks] == [3, 2, 1]
+
+
+
+def test_export_memory_does_not_grow_with_rows():
+    rows = int(os.getenv('EXPORT_TEST_ROWS', '1000000'))
+    # SQLite's mmap and page cache would otherwise fill up to their configured sizes
+    env = dict(os.environ, SQLITE_MMAP_SIZE='0', SQLITE_CACHE_KIB='2048')
+    result = subprocess.run([sys.executable, '-m', 'tests.export_memory', '--rows', str(rows)],
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            env=env, capture_output=True, text=True, check=True)
+    report = json.loads(result.stdout.splitlines()[-1])
+
+    assert report['status'] == 200
+    assert report['lines'] == rows
+    assert report['max_rss_mb'] - report['seeded_rss_mb'] < EXPORT_RSS_CEILING_MB, report
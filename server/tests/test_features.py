@@ -0,0 +1,68 @@
+import pytest
+
+from app import feature_cache, insert_ignoring_conflicts
+from models import db, Feature, UnitFeatureLink
+from tests.helpers import count_queries
+
+LINK_TABLE = UnitFeatureLink.__tablename__
+
+
+def feature_names(app, unit_id):
+    with app.app_context():
+        return sorted(db.session.scalars(
+            db.select(Feature.name).join(UnitFeatureLink, UnitFeatureLink.feature_id == Feature.feature_id)
+            .where(UnitFeatureLink.unit_id == unit_id)))
+
+
+def test_unit_update_only_touches_changed_links(app, client, admin_headers, make_unit):
+    unit_id = make_unit()
+    response = client.put(f'/api/units/{unit_id}', json={'features': ['CCTV', 'Alarm']}, headers=admin_headers)
+    assert response.status_code == 200
+    assert feature_names(app, unit_id) == ['Alarm', 'CCTV']
+
+    with count_queries(app) as statements:
+        client.put(f'/api/units/{unit_id}', json={'features': ['CCTV', 'Lift']}, headers=admin_headers)
+    assert feature_names(app, unit_id) == ['CCTV', 'Lift']
+    link_writes = [s.split()[0] for s in statements if LINK_TABLE in s and not s.startswith('SELECT')]
+    assert sorted(link_writes) == ['DELETE', 'INSERT']
+
+
+def test_committed_features_resolve_from_the_cache(app):
+    with app.app_context():
+        created = feature_cache.resolve(['CCTV'])
+        db.session.commit()
+        # Ids from the creating transaction are not cached, the first lookup reads them back
+        assert 'CCTV' not in feature_cache._ids
+        assert feature_cache.resolve(['CCTV']) == created
+        with count_queries(app) as statements:
+            assert feature_cache.resolve(['CCTV']) == created
+    assert statements == []
+
+
+def test_rolled_back_features_are_not_cached(app):
+    with app.app_context():
+        feature_cache.resolve(['Ramp'])
+        db.session.rollback()
+        assert 'Ramp' not in feature_cache._ids
+        feature_cache.resolve(['Ramp'])
+        db.session.commit()
+        assert db.session.scalar(db.select(db.func.count()).select_from(Feature)) == 1
+
+
+def test_creating_a_feature_invalidates_the_cache(app, client):
+    with app.app_context():
+        feature_cache.resolve(['CCTV'])
+        db.session.commit()
+        feature_cache.resolve(['CCTV'])
+    assert feature_cache._ids
+
+    response = client.post('/api/features', json={'name': 'Loading bay'})
+    assert response.status_code == 201
+    assert feature_cache._ids == {}
+
+
+def test_conflict_ignoring_insert_is_refused_on_unknown_dialects(app, monkeypatch):
+    with app.app_context():
+        monkeypatch.setattr(db.session.get_bind().dialect, 'name', 'mssql')
+        with pytest.raises(NotImplementedError):
+            insert_ignoring_conflicts(Feature)
@@ -0,0 +1,59 @@
+import asyncio
+
+import httpx
+from flask import g
+
+import metrics
+from metrics import RequestStats, daraja_call_seconds
+from mpesa_async import AsyncMpesaService
+from tests.helpers import FakeResponse
+
+
+def daraja_calls(path):
+    series = daraja_call_seconds._series.get((path,))
+    return sum(series[:-1]) if series else 0
+
+
+def test_sync_daraja_calls_are_timed_into_the_request(app, daraja):
+    before = daraja_calls('/timed')
+    daraja.serve(FakeResponse(200, {}))
+    with app.test_request_context('/'):
+        g.request_stats = RequestStats(keep_statements=False)
+        daraja.request('GET', 'https://daraja.test/timed')
+        assert g.request_stats.daraja_time > 0
+    assert daraja_calls('/timed') == before + 1
+
+
+def test_failed_daraja_calls_are_timed_too(daraja):
+    before = daraja_calls('/failing')
+    daraja.serve(FakeResponse(503, {}))
+    assert daraja.request('GET', 'https://daraja.test/failing').status_code == 503
+    assert daraja_calls('/failing') == before + 1
+
+
+def test_async_daraja_calls_are_timed(daraja):
+    before = daraja_calls('/async')
+
+    async def call():
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, json={}))
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await AsyncMpesaService(client)._request('GET', 'https://daraja.test/async')
+
+    assert asyncio.run(call()).status_code == 200
+    assert daraja_calls('/async') == before + 1
+
+
+def test_metrics_are_only_served_to_loopback_without_a_token(client):
+    assert client.get('/metrics').status_code == 200
+    response = client.get('/metrics', environ_base={'REMOTE_ADDR': '203.0.113.7'})
+    assert response.status_code == 403
+
+
+def test_metrics_token_is_required_when_set(app):
+    with app.test_request_context('/metrics', environ_base={'REMOTE_ADDR': '203.0.113.7'},
+                                  headers={'Authorization': 'Bearer secret'}):
+        assert metrics._may_scrape('secret')
+        assert not metrics._may_scrape('other')
+    with app.test_request_context('/metrics'):
+        # Loopback clients need the token too once one is configured
+        assert not metrics._may_scrape('secret')
@@ -0,0 +1,72 @@
+import asyncio
+
+import httpx
+import pytest
+import requests
+
+from mpesa_async import AsyncMpesaService
+from mpesa_service import CircuitOpenError, MpesaService
+from tests.helpers import FakeResponse
+
+
+def test_unexpected_error_ends_the_half_open_trial(daraja):
+    daraja.serve(requests.exceptions.ConnectionError('down'))
+    with pytest.raises(requests.exceptions.ConnectionError):
+        daraja.request('GET', 'https://daraja.test/')
+    daraja.breaker._opened_at -= daraja.breaker.reset_timeout
+
+    # The trial dies with an error that is neither a connection error nor a timeout
+    daraja.serve(requests.exceptions.ChunkedEncodingError('truncated'))
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        daraja.request('GET', 'https://daraja.test/')
+    assert not daraja.breaker._trial_in_flight
+
+    # Once the reset timeout passes again, a new trial goes through and closes the circuit
+    daraja.breaker._opened_at -= daraja.breaker.reset_timeout
+    daraja.serve(FakeResponse(200, {}))
+    assert daraja.request('GET', 'https://daraja.test/').status_code == 200
+    assert daraja.breaker._opened_at is None
+
+
+def test_pending_status_query_is_an_answer_not_a_failure(daraja):
+    pending = {'requestId': '1', 'errorCode': '500.001.1001', 'errorMessage': 'The transaction is being processed'}
+    session = daraja.serve(*[FakeResponse(500, pending) for _ in range(3)])
+
+    for _ in range(3):
+        result = MpesaService().query_stk_status('ws_CO_1')
+        assert result['success'] and result['data']['errorCode'] == '500.001.1001'
+    assert session.calls == 3
+    assert daraja.breaker._opened_at is None
+
+    # A real server error still opens the circuit
+    daraja.serve(FakeResponse(500, {'errorCode': '500.003.02', 'errorMessage': 'System is busy'}))
+    assert not MpesaService().query_stk_status('ws_CO_1')['success']
+    with pytest.raises(CircuitOpenError):
+        daraja.request('GET', 'https://daraja.test/')
+
+
+def test_async_client_retries_any_transport_error(daraja):
+    attempts = []
+
+    def handler(request):
+        attempts.append(request.url.path)
+        if len(attempts) == 1:
+            raise httpx.RemoteProtocolError('peer closed connection', request=request)
+        return httpx.Response(200, json={'ResultCode': '0', 'ResultDesc': 'ok'})
+
+    async def query():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            service = AsyncMpesaService(client)
+            service.base_url = 'https://daraja.test'
+
+            async def token():
+                return 'token'
+            service.get_access_token = token
+            return await service.query_stk_status('ws_CO_1')
+
+    # The status query is idempotent, so the dropped connection is retried
+    daraja.max_retries = 1
+    daraja.breaker.failure_threshold = 5
+    assert asyncio.run(query())['data']['ResultCode'] == '0'
+    assert len(attempts) == 2
+    assert daraja.breaker._failures == 0
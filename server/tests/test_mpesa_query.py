@@ -0,0 +1,89 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import app as app_module
+from models import db, Booking, Payment
+from mpesa_service import MpesaService, StatusQueryCache
+
+
+@pytest.fixture
+def daraja_queries(monkeypatch):
+    """Record stkpushquery calls instead of sending them; each answers ResultCode 0"""
+    calls = []
+
+    def query_stk_status(self, checkout_request_id):
+        calls.append(checkout_request_id)
+        return {'success': True, 'data': {'CheckoutRequestID': checkout_request_id, 'ResultCode': '0'}}
+    monkeypatch.setattr(MpesaService, 'query_stk_status', query_stk_status)
+    monkeypatch.setattr(app_module, 'status_query_cache', StatusQueryCache(ttl=60))
+    return calls
+
+
+@pytest.fixture
+def make_payment(app, make_unit, make_booking):
+    def make_payment(status='pending', dispatched_ago=timedelta(minutes=5), checkout_request_id='ws_CO_1'):
+        unit_id = make_unit()
+        dispatched_at = datetime.utcnow() - dispatched_ago if dispatched_ago is not None else None
+        booking_id = make_booking(unit_id, date(2030, 1, 1), date(2030, 2, 1), payment={
+            'status': status, 'checkout_request_id': checkout_request_id, 'dispatched_at': dispatched_at})
+        return booking_id
+    return make_payment
+
+
+def query(client, checkout_request_id='ws_CO_1'):
+    return client.post('/api/mpesa/query', json={'checkout_request_id': checkout_request_id})
+
+
+def test_unknown_checkout_request_is_not_sent_to_daraja(client, daraja_queries):
+    response = query(client, 'ws_CO_unknown')
+
+    assert response.status_code == 404
+    assert daraja_queries == []
+
+
+@pytest.mark.parametrize('status, dispatched_ago', [
+    ('completed', timedelta(minutes=5)),
+    ('failed', timedelta(minutes=5)),
+    ('queued', None),
+    ('dispatching', None),
+    ('pending', None),
+    ('pending', timedelta(seconds=1)),
+])
+def test_payments_daraja_cannot_update_are_answered_locally(client, daraja_queries, make_payment,
+                                                            status, dispatched_ago):
+    make_payment(status=status, dispatched_ago=dispatched_ago)
+
+    response = query(client)
+
+    assert response.status_code == 200
+    assert response.get_json()['source'] == 'local'
+    assert response.get_json()['status'] == status
+    assert daraja_queries == []
+
+
+def test_stale_pending_payment_is_queried_and_settled(app, client, daraja_queries, make_payment):
+    booking_id = make_payment()
+
+    response = query(client)
+
+    assert response.get_json()['source'] == 'daraja'
+    assert daraja_queries == ['ws_CO_1']
+    with app.app_context():
+        booking = db.session.get(Booking, booking_id)
+        assert booking.payment.status == 'completed'
+        assert booking.status == 'paid'
+
+
+def test_pollers_share_one_daraja_query_per_ttl(client, daraja_queries, make_payment, monkeypatch):
+    make_payment()
+    # Keep the payment pending so every poll reaches the cache
+    monkeypatch.setattr(Payment, 'apply_mpesa_result', lambda self, result_code, receipt_number=None: None)
+
+    for _ in range(5):
+        assert query(client).get_json()['source'] == 'daraja'
+    assert daraja_queries == ['ws_CO_1']
+
+    app_module.status_query_cache.ttl = 0
+    query(client)
+    assert daraja_queries == ['ws_CO_1', 'ws_CO_1']
@@ -0,0 +1,71 @@
+from datetime import date, timedelta
+
+
+def walk(client, path, headers=None):
+    """Follow X-Next-Cursor from the first page; returns the pages' ids"""
+    pages, after = [], None
+    while True:
+        url = path if after is None else f'{path}&after={after}'
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        pages.append([unit['unit_id'] for unit in response.get_json()])
+        after = response.headers.get('X-Next-Cursor')
+        if after is None:
+            return pages
+
+
+def test_cursor_walks_every_unit_once(client, make_unit):
+    unit_ids = [make_unit(unit_number=f'A-{index}') for index in range(7)]
+
+    pages = walk(client, '/api/units?limit=3&fields=unit_id')
+
+    assert pages == [unit_ids[0:3], unit_ids[3:6], unit_ids[6:]]
+
+
+def test_exact_last_page_has_no_cursor(client, make_unit):
+    for index in range(4):
+        make_unit(unit_number=f'A-{index}')
+    assert len(walk(client, '/api/units?limit=2&fields=unit_id')) == 2
+
+
+def test_filters_and_projection(client, make_unit):
+    make_unit(unit_number='A-1', site='Main', status='available')
+    booked = make_unit(unit_number='A-2', site='Main', status='booked')
+    make_unit(unit_number='B-1', site='Annex', status='booked')
+
+    response = client.get('/api/units?site=Main&status=booked&fields=unit_id,unit_number')
+
+    assert response.get_json() == [{'unit_id': booked, 'unit_number': 'A-2'}]
+
+
+def test_booking_date_range_selects_overlapping_bookings(client, admin_headers, make_unit, make_booking):
+    unit_id = make_unit()
+    june = date(2030, 6, 1)
+    before = make_booking(unit_id, june - timedelta(days=20), june - timedelta(days=10))
+    overlapping = make_booking(unit_id, june - timedelta(days=5), june + timedelta(days=5))
+    inside = make_booking(unit_id, june + timedelta(days=10), june + timedelta(days=20))
+
+    response = client.get(f'/api/bookings?from={june.isoformat()}&to=2030-06-30&fields=booking_id',
+                          headers=admin_headers)
+
+    ids = [booking['booking_id'] for booking in response.get_json()]
+    assert ids == [overlapping, inside]
+    assert before not in ids
+
+
+def test_invalid_list_parameters_are_rejected(client):
+    assert client.get('/api/units?limit=0').status_code == 400
+    assert client.get('/api/units?limit=501').status_code == 400
+    assert client.get('/api/units?after=x').status_code == 400
+    assert client.get('/api/units?fields=unit_id,password').status_code == 400
+    assert client.get('/api/bookings?from=2030-02-01&to=2030-01-01').status_code == 400
+
+
+def test_missing_limit_returns_a_default_page(client, make_unit, monkeypatch):
+    import app as app_module
+    monkeypatch.setattr(app_module, 'LIST_DEFAULT_LIMIT', 2)
+    unit_ids = [make_unit(unit_number=f'A-{index}') for index in range(5)]
+
+    pages = walk(client, '/api/units?fields=unit_id')
+
+    assert pages == [unit_ids[0:2], unit_ids[2:4], unit_ids[4:]]
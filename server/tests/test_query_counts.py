@@ -0,0 +1,42 @@
+from datetime import date, time, timedelta
+
+import pytest
+
+from models import db, TransportationRequest
+from tests.helpers import count_queries
+
+
+def seed(app, make_unit, make_booking, first, count):
+    """Units each with a booking (own customer), payment and transport request"""
+    for index in range(first, first + count):
+        unit_id = make_unit(unit_number=f'U-{index}')
+        start = date(2030, 1, 1) + timedelta(days=40 * index)
+        booking_id = make_booking(unit_id, start, start + timedelta(days=30),
+                                  payment={'status': 'completed'}, email=f'customer{index}@example.com')
+        with app.app_context():
+            db.session.add(TransportationRequest(booking_id=booking_id, pickup_address='Here',
+                                                 pickup_date=start, pickup_time=time(9)))
+            db.session.commit()
+
+
+# Statements per request, whatever the number of rows: the list query, one per
+# selectin-loaded collection and, where the list has an ETag, the change_version lookup
+LIST_QUERIES = {
+    '/api/units': 6,
+    '/api/bookings': 5,
+    '/api/payments': 5,
+    '/api/customers': 6,
+}
+
+
+@pytest.mark.parametrize('path', sorted(LIST_QUERIES))
+def test_list_endpoints_run_a_fixed_number_of_queries(app, client, admin_headers, make_unit, make_booking, path):
+    client.get(path, headers=admin_headers)  # warm the admin authorization cache
+    counts = []
+    for first, count in ((0, 2), (2, 8)):
+        seed(app, make_unit, make_booking, first, count)
+        with count_queries(app) as statements:
+            response = client.get(path, headers=admin_headers)
+        assert response.status_code == 200
+        counts.append(len(statements))
+    assert counts == [LIST_QUERIES[path]] * 2
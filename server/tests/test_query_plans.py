@@ -0,0 +1,69 @@
+import os
+import re
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, select, text
+
+from models import db, Admin, Booking, Customer, Payment, StorageUnit
+
+# Each hot lookup and the indexes the planner may answer it from
+HOT_QUERIES = {
+    'callback payment': (select(Payment).where(Payment.checkout_request_id == 'ws_CO_1'),
+                         {'ix_payment_checkout_request_id'}),
+    'booking payment': (select(Payment).where(Payment.booking_id == 1), {'ix_payment_booking_id'}),
+    'customer by email': (select(Customer).where(Customer.email == 'jane@example.com'), {'ix_customer_email'}),
+    'admin login': (select(Admin).where(Admin.username == 'admin'), {'ix_admin_username'}),
+    'customer bookings': (select(Booking).where(Booking.customer_id == 1), {'ix_booking_customer_id'}),
+    'bookings by status': (select(Booking).where(Booking.status == 'pending'), {'ix_booking_status'}),
+    'unit bookings by status': (select(Booking).where(Booking.unit_id == 1, Booking.status == 'active'),
+                                {'ix_booking_unit_id_status', 'ix_booking_unit_id_dates'}),
+    'unit overlap check': (select(Booking.booking_id).where(
+        Booking.unit_id == 1, Booking.start_date < date(2030, 2, 1), Booking.end_date > date(2030, 1, 1),
+        Booking.status.in_(('pending', 'paid', 'active'))), {'ix_booking_unit_id_dates'}),
+    'units by status': (select(StorageUnit).where(StorageUnit.status == 'available'),
+                        {'ix_storageunit_status', 'ix_storageunit_site_status'}),
+    'units by site': (select(StorageUnit).where(StorageUnit.site == 'Main', StorageUnit.status == 'available'),
+                      {'ix_storageunit_site_status'}),
+}
+
+
+def compiled(statement, engine):
+    return str(statement.compile(engine, compile_kwargs={'literal_binds': True}))
+
+
+def uses_index(plan, indexes):
+    return any(re.search(rf'\b{index}\b', plan) for index in indexes)
+
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_hot_queries_use_an_index_on_sqlite(app, name):
+    statement, indexes = HOT_QUERIES[name]
+    with app.app_context():
+        engine = db.engine
+        with engine.connect() as connection:
+            plan = '\n'.join(row[-1] for row in
+                             connection.execute(text(f'EXPLAIN QUERY PLAN {compiled(statement, engine)}')))
+    assert uses_index(plan, indexes), plan
+
+
+@pytest.fixture(scope='module')
+def postgres():
+    url = os.getenv('TEST_POSTGRES_URL')
+    if not url:
+        pytest.skip('TEST_POSTGRES_URL is not set')
+    engine = create_engine(url)
+    db.metadata.create_all(engine)
+    yield engine
+    db.metadata.drop_all(engine)
+    engine.dispose()
+
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_hot_queries_use_an_index_on_postgres(postgres, name):
+    statement, indexes = HOT_QUERIES[name]
+    with postgres.connect() as connection:
+        # The test tables are empty, where a sequential scan is always cheapest
+        connection.execute(text('SET enable_seqscan = off'))
+        plan = '\n'.join(row[0] for row in connection.execute(text(f'EXPLAIN {compiled(statement, postgres)}')))
+    assert uses_index(plan, indexes), plan
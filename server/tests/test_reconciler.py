@@ -0,0 +1,157 @@
+import threading
+import time
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import reconciler as reconciler_module
+from models import db, Booking, Payment
+from mpesa_service import MpesaService
+from reconciler import PaymentReconciler
+from stk_queue import RateLimiter
+
+
+class DarajaQueries:
+    """Stands in for stkpushquery, recording calls and how many overlapped"""
+    def __init__(self, result_code='0', delay=0.0):
+        self.result_code = result_code
+        self.delay = delay
+        self.calls = []
+        self.in_flight = self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def query(self, checkout_request_id):
+        with self._lock:
+            self.calls.append(checkout_request_id)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+        if self.result_code is None:
+            return {'success': False, 'error': 'Daraja unavailable'}
+        return {'success': True, 'data': {'CheckoutRequestID': checkout_request_id,
+                                          'ResultCode': self.result_code}}
+
+
+@pytest.fixture
+def reconciler(app, monkeypatch):
+    # Query through the thread pool so the stand-in sees every call
+    monkeypatch.setattr(reconciler_module, 'daraja_loop', SimpleNamespace(available=False))
+    sweeper = PaymentReconciler()
+    sweeper.app = app
+    sweeper.rate_limiter = RateLimiter(1000)
+    return sweeper
+
+
+@pytest.fixture
+def daraja(monkeypatch):
+    def serve(**options):
+        queries = DarajaQueries(**options)
+        monkeypatch.setattr(MpesaService, 'query_stk_status', lambda service, checkout_request_id:
+                            queries.query(checkout_request_id))
+        return queries
+    return serve
+
+
+@pytest.fixture
+def make_payment(app, make_unit, make_booking):
+    unit_id = make_unit()
+    counter = iter(range(1, 10000))
+
+    def make_payment(sent_ago=timedelta(minutes=20), status='pending', reconciled_ago=None, checkout=True):
+        n = next(counter)
+        now = datetime.utcnow()
+        start = date(2030, 1, 1) + timedelta(days=40 * n)
+        booking_id = make_booking(unit_id, start, start + timedelta(days=30), payment={
+            'status': status,
+            'checkout_request_id': f'ws_CO_{n}' if checkout else None,
+            'dispatched_at': now - sent_ago,
+            'reconciled_at': now - reconciled_ago if reconciled_ago is not None else None,
+        })
+        return f'ws_CO_{n}', booking_id
+    return make_payment
+
+
+def test_only_stale_pending_payments_are_queried(reconciler, daraja, make_payment):
+    queries = daraja()
+    stale, _ = make_payment()
+    requery_due, _ = make_payment(reconciled_ago=timedelta(minutes=45))
+    make_payment(sent_ago=timedelta(minutes=1))  # callback may still arrive
+    make_payment(sent_ago=timedelta(days=3))  # past RECONCILE_MAX_AGE_HOURS
+    make_payment(status='completed')
+    make_payment(checkout=False)  # never reached Daraja
+    make_payment(reconciled_ago=timedelta(minutes=5))  # queried this window
+
+    counts = reconciler.sweep()
+
+    assert sorted(queries.calls) == sorted([stale, requery_due])
+    assert counts == {'queried': 2, 'applied': 2, 'unresolved': 0}
+
+
+def test_checkpoint_keeps_a_rerun_from_querying_again(app, reconciler, daraja, make_payment):
+    queries = daraja(result_code=None)
+    for _ in range(7):
+        make_payment()
+
+    assert reconciler.sweep()['unresolved'] == 5  # first batch fails, the sweep stops early
+    assert reconciler.sweep()['unresolved'] == 2
+    assert reconciler.sweep()['queried'] == 0
+    assert len(queries.calls) == len(set(queries.calls)) == 7
+    with app.app_context():
+        assert Payment.query.filter(Payment.reconciled_at.is_(None)).count() == 0
+
+
+def test_concurrent_sweepers_never_query_a_payment_twice(reconciler, daraja, make_payment):
+    queries = daraja(delay=0.01)
+    for _ in range(20):
+        make_payment()
+    other = PaymentReconciler()
+    other.app, other.rate_limiter = reconciler.app, reconciler.rate_limiter
+
+    threads = [threading.Thread(target=sweeper.sweep) for sweeper in (reconciler, other)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(queries.calls) == len(set(queries.calls)) == 20
+
+
+def test_queries_respect_the_concurrency_and_rate_limits(reconciler, daraja, make_payment):
+    queries = daraja(delay=0.05)
+    for _ in range(9):
+        make_payment()
+    reconciler.batch_size = 3
+    reconciler.rate_limiter = RateLimiter(20, burst=1)
+
+    started = time.monotonic()
+    reconciler.sweep()
+    elapsed = time.monotonic() - started
+
+    assert len(queries.calls) == 9
+    assert queries.max_in_flight <= 3
+    # One token up front, then 20 per second for the other eight
+    assert elapsed >= 8 / 20
+
+
+@pytest.mark.parametrize('result_code, payment_status, booking_status', [
+    ('0', 'completed', 'paid'),
+    ('1032', 'failed', 'pending'),
+])
+def test_final_result_settles_payment_and_booking(app, reconciler, daraja, make_payment,
+                                                  result_code, payment_status, booking_status):
+    daraja(result_code=result_code)
+    _, booking_id = make_payment()
+
+    reconciler.sweep()
+
+    with app.app_context():
+        booking = db.session.get(Booking, booking_id)
+        assert (booking.payment.status, booking.status) == (payment_status, booking_status)
+
+
+def test_inline_sweeper_is_off_by_default(monkeypatch):
+    monkeypatch.delenv('RECONCILE_INLINE_WORKER', raising=False)
+    assert not PaymentReconciler().inline_worker
@@ -0,0 +1,39 @@
+from datetime import date, time, timedelta
+
+from sqlalchemy import inspect as sa_inspect
+
+from models import db, Booking, Payment, StorageUnit, TransportationRequest
+from serializers import flat_serializer
+
+
+def columns(model):
+    return tuple(sa_inspect(model).columns.keys())
+
+
+def assert_matches_to_dict(model, fields):
+    serializer = flat_serializer(model, fields)
+    primary_key = sa_inspect(model).primary_key[0]
+    rows = db.session.execute(db.select(*serializer.columns).order_by(primary_key)).all()
+    objects = db.session.scalars(db.select(model).order_by(primary_key)).all()
+    assert serializer(rows) == [obj.to_dict(only=fields) for obj in objects]
+
+
+def test_flat_output_matches_to_dict(app, make_unit, make_booking):
+    unit_id = make_unit()
+    start = date.today() + timedelta(days=3)
+    booking_id = make_booking(unit_id, start, start + timedelta(days=30), payment={'status': 'completed'})
+    with app.app_context():
+        db.session.add(TransportationRequest(booking_id=booking_id, pickup_address='Here',
+                                             pickup_date=start, pickup_time=time(9, 30)))
+        db.session.commit()
+
+        # Every column, so dates, datetimes, times and Decimals are all compared
+        for model in (StorageUnit, Booking, Payment, TransportationRequest):
+            assert_matches_to_dict(model, columns(model))
+        assert_matches_to_dict(Booking, ('start_date', 'total_cost'))
+
+
+def test_projections_with_relationships_fall_back_to_to_dict():
+    assert flat_serializer(Booking, ('booking_id', 'unit')) is None
+    assert flat_serializer(Booking, ()) is None
+    assert flat_serializer(Booking, ('booking_id',)) is flat_serializer(Booking, ('booking_id',))
@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import sqlite_mode
+from models import db, StorageUnit
+
+
+def test_connections_get_the_performance_pragmas(app):
+    with app.app_context():
+        pragma = lambda name: db.session.execute(text(f'PRAGMA {name}')).scalar()  # noqa: E731
+        assert pragma('journal_mode') == 'wal'
+        assert pragma('synchronous') == 1  # NORMAL
+        assert pragma('busy_timeout') == sqlite_mode.BUSY_TIMEOUT_MS
+        assert pragma('cache_size') == -65536
+        assert pragma('mmap_size') == 256 * 1024 * 1024
+
+
+def test_writer_is_taken_at_the_first_write_and_released_on_commit(app, make_unit):
+    unit_id = make_unit()
+    with app.app_context():
+        db.session.get(StorageUnit, unit_id)
+        assert not sqlite_mode.writer.held  # reads never queue
+
+        db.session.get(StorageUnit, unit_id).status = 'booked'
+        db.session.flush()
+        assert sqlite_mode.writer.held
+
+        db.session.commit()
+        assert not sqlite_mode.writer.held
+
+
+def test_writer_is_released_on_rollback(app, make_unit):
+    unit_id = make_unit()
+    with app.app_context():
+        db.session.get(StorageUnit, unit_id).status = 'booked'
+        db.session.flush()
+        db.session.rollback()
+        assert not sqlite_mode.writer.held
+
+
+def test_write_fails_instead_of_bypassing_a_busy_writer(app, make_unit, monkeypatch):
+    unit_id = make_unit()
+    monkeypatch.setattr(sqlite_mode.writer, 'timeout', 0.05)
+    holding, done = threading.Event(), threading.Event()
+
+    def hold_writer():
+        sqlite_mode.writer.acquire()
+        holding.set()
+        done.wait()
+        sqlite_mode.writer.release()
+    holder = threading.Thread(target=hold_writer)
+    holder.start()
+    holding.wait()
+    try:
+        with app.app_context():
+            db.session.get(StorageUnit, unit_id).status = 'booked'
+            with pytest.raises(OperationalError, match='database is locked'):
+                db.session.flush()
+            db.session.rollback()
+    finally:
+        done.set()
+        holder.join()
+
+    with app.app_context():
+        assert db.session.get(StorageUnit, unit_id).status == 'available'
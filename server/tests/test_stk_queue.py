@@ -0,0 +1,76 @@
+from datetime import date, datetime, timedelta
+
+from models import db, Payment
+from stk_queue import stk_queue
+
+
+def push(client, booking_id):
+    return client.post('/api/mpesa/stkpush', json={'booking_id': booking_id, 'phone_number': '0712345678',
+                                                    'amount': 1000})
+
+
+def test_crashed_dispatch_is_not_reported_in_flight_forever(app, client, make_unit, make_booking):
+    booking_id = make_booking(make_unit(), date(2030, 1, 1), date(2030, 2, 1))
+    assert push(client, booking_id).get_json()['status'] == 'queued'
+
+    with app.app_context():
+        jobs, claimed_at = stk_queue._claim()
+        assert len(jobs) == 1
+    # The worker dies here, before Daraja answered
+    response = push(client, booking_id)
+    assert response.status_code == 202
+    assert response.get_json()['message'] == 'Payment request is already being processed'
+
+    with app.app_context():
+        payment = db.session.get(Payment, jobs[0].payment_id)
+        payment.claimed_at -= stk_queue.lease + timedelta(seconds=1)
+        db.session.commit()
+    response = push(client, booking_id)
+    assert response.get_json()['status'] == 'queued'
+    assert 'already being processed' not in response.get_json()['message']
+
+
+def test_worker_fails_expired_claims_and_ignores_their_late_results(app, make_unit, make_booking):
+    booking_id = make_booking(make_unit(), date(2030, 1, 1), date(2030, 2, 1),
+                              payment={'status': 'queued', 'phone_number': '254712345678'})
+    with app.app_context():
+        jobs, claimed_at = stk_queue._claim()
+        db.session.execute(db.update(Payment).values(claimed_at=datetime.utcnow() - stk_queue.lease * 2))
+        db.session.commit()
+
+        stk_queue._fail_expired()
+        payment = Payment.query.filter_by(booking_id=booking_id).one()
+        assert payment.status == 'failed'
+
+        stk_queue._complete(jobs[0], claimed_at, {'success': True, 'checkout_request_id': 'ws_CO_late'})
+        db.session.refresh(payment)
+        assert payment.status == 'failed' and payment.checkout_request_id is None
+
+
+def test_live_claims_are_left_alone(app, make_unit, make_booking):
+    make_booking(make_unit(), date(2030, 1, 1), date(2030, 2, 1),
+                 payment={'status': 'queued', 'phone_number': '254712345678'})
+    with app.app_context():
+        jobs, claimed_at = stk_queue._claim()
+        stk_queue._fail_expired()
+        stk_queue._complete(jobs[0], claimed_at, {'success': True, 'checkout_request_id': 'ws_CO_1'})
+        payment = db.session.get(Payment, jobs[0].payment_id)
+        assert (payment.status, payment.checkout_request_id) == ('pending', 'ws_CO_1')
+
+
+def test_push_is_refused_while_the_previous_prompt_is_live(app, client, make_unit, make_booking):
+    booking_id = make_booking(make_unit(), date(2030, 1, 1), date(2030, 2, 1),
+                              payment={'status': 'pending', 'checkout_request_id': 'ws_CO_1',
+                                       'dispatched_at': datetime.utcnow()})
+    response = push(client, booking_id)
+    assert response.status_code == 409
+    assert response.get_json()['checkout_request_id'] == 'ws_CO_1'
+    with app.app_context():
+        assert Payment.query.filter_by(booking_id=booking_id).one().checkout_request_id == 'ws_CO_1'
+
+    # Once the prompt has expired on the phone the customer can ask for a new one
+    with app.app_context():
+        payment = Payment.query.filter_by(booking_id=booking_id).one()
+        payment.dispatched_at -= stk_queue.prompt_ttl + timedelta(seconds=1)
+        db.session.commit()
+    assert push(client, booking_id).get_json()['status'] == 'queued'
@@ -0,0 +1,110 @@
+import json
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+import mpesa_service
+from mpesa_service import FileTokenBackend, TokenCache
+
+
+class Fetcher:
+    """OAuth stand-in that counts how often a token was requested"""
+    def __init__(self, expires_in=3600, delay=0.0):
+        self.expires_in = expires_in
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+            token = f'token-{self.calls}'
+        time.sleep(self.delay)
+        return token, self.expires_in
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(mpesa_service.time, 'time', lambda: now[0])
+    return now
+
+
+def test_concurrent_callers_share_one_refresh():
+    cache, fetch = TokenCache(), Fetcher(delay=0.05)
+    tokens = []
+    threads = [threading.Thread(target=lambda: tokens.append(cache.get('key', fetch))) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert fetch.calls == 1
+    assert tokens == ['token-1'] * 20
+
+
+def test_token_is_refreshed_refresh_margin_before_it_expires(clock):
+    cache, fetch = TokenCache(refresh_margin=60), Fetcher(expires_in=3600)
+    assert cache.get('key', fetch) == 'token-1'
+
+    clock[0] += 3600 - 61
+    assert cache.get('key', fetch) == 'token-1'
+    clock[0] += 2
+    assert cache.get('key', fetch) == 'token-2'
+    assert fetch.calls == 2
+
+
+def test_token_stored_by_another_worker_is_reused(tmp_path):
+    path = str(tmp_path / 'token.json')
+    TokenCache(backend=FileTokenBackend(path)).get('key', Fetcher())
+    fetch = Fetcher()
+
+    assert TokenCache(backend=FileTokenBackend(path)).get('key', fetch) == 'token-1'
+    assert fetch.calls == 0
+
+
+@pytest.mark.parametrize('contents', [
+    'not json{',
+    '',
+    json.dumps({'key': {'token': 'expired', 'expires_at': 0}}),
+    # Inside the refresh margin: other workers would start failing with it soon
+    json.dumps({'key': {'token': 'expiring', 'expires_at': time.time() + 30}}),
+])
+def test_corrupt_or_stale_token_file_is_replaced(tmp_path, contents):
+    path = tmp_path / 'token.json'
+    path.write_text(contents)
+    fetch = Fetcher()
+
+    assert TokenCache(backend=FileTokenBackend(str(path))).get('key', fetch) == 'token-1'
+    assert fetch.calls == 1
+    assert json.loads(path.read_text())['key']['token'] == 'token-1'
+
+
+def _worker_get(path, calls_path, start, tokens):
+    def fetch():
+        with open(calls_path, 'a') as f:
+            f.write('fetch\n')
+        time.sleep(0.1)
+        return 'shared-token', 3600
+    start.wait()
+    tokens.put(TokenCache(backend=FileTokenBackend(path)).get('key', fetch))
+
+
+@pytest.mark.skipif(mpesa_service.fcntl is None, reason='needs flock and fork (POSIX)')
+def test_worker_processes_share_one_refresh(tmp_path):
+    context = multiprocessing.get_context('fork')
+    start, tokens = context.Event(), context.Queue()
+    calls_path = tmp_path / 'calls'
+    workers = [context.Process(target=_worker_get, args=(str(tmp_path / 'token.json'), str(calls_path), start, tokens))
+               for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    start.set()
+    for worker in workers:
+        worker.join(10)
+
+    assert [worker.exitcode for worker in workers] == [0] * 4
+    assert sorted(tokens.get(timeout=1) for _ in workers) == ['shared-token'] * 4
+    assert calls_path.read_text().splitlines() == ['fetch']
@@ -0,0 +1,60 @@
+from datetime import date, timedelta
+
+from schema import BOOKING_SPEC, STORAGE_UNIT_SPEC, validate_many
+from tests.helpers import booking_payload
+
+
+def test_unhashable_status_is_a_validation_error(client, make_unit):
+    unit_id = make_unit()
+    response = client.post('/api/bookings', json=booking_payload(unit_id, 1, 7, status={}))
+    assert response.status_code == 400
+    assert response.get_json()['messages'] == 'Invalid status'
+
+
+def test_non_object_body_is_a_validation_error(client, admin_headers):
+    assert client.post('/api/bookings', json=['x']).status_code == 400
+    assert client.post('/api/units', json=['x'], headers=admin_headers).status_code == 400
+    assert client.post('/api/admin/login', json=['username', 'password']).status_code == 400
+
+
+def test_bulk_import_reports_bad_rows_individually(client, admin_headers):
+    rows = [
+        {'unit_number': 'B-1', 'site': 'Main', 'monthly_rate': 500},
+        ['x'],
+        {'unit_number': 'B-2', 'site': 'Main', 'monthly_rate': 500, 'status': ['x']},
+        {'unit_number': '', 'site': 'Main', 'monthly_rate': 'x'},
+    ]
+    response = client.post('/api/units/bulk', json=rows, headers=admin_headers)
+
+    assert response.status_code == 201
+    body = response.get_json()
+    assert body['created'] == 1
+    assert [(error['row'], error['messages']) for error in body['errors']] == [
+        (1, ['Each record must be an object']),
+        (2, ['Status must be either available or booked']),
+        (3, ['Unit number must be between 1 and 20 characters', 'Monthly rate must be a valid number']),
+    ]
+
+
+def test_partial_check_skips_missing_fields_and_defaults():
+    result, messages = STORAGE_UNIT_SPEC.check({'monthly_rate': '750'}, partial=True)
+    assert (result, messages) == ({'monthly_rate': 750.0}, [])
+
+    result, messages = STORAGE_UNIT_SPEC.check({'unit_number': ' A-1 ', 'site': 'Main', 'monthly_rate': 1})
+    assert messages == []
+    assert result == {'unit_number': 'A-1', 'site': 'Main', 'monthly_rate': 1.0,
+                      'status': 'available', 'features': []}
+    # Each record gets its own default list
+    assert STORAGE_UNIT_SPEC.check({'unit_number': 'A-2', 'site': 'Main', 'monthly_rate': 1})[0]['features'] \
+        is not result['features']
+
+
+def test_cross_field_checks_run_only_on_parsed_values():
+    today = date.today()
+    record = {'unit_id': 1, 'customer_name': 'Jane', 'customer_email': 'jane@example.com',
+              'customer_phone': '0712345678', 'total_cost': 10,
+              'start_date': (today - timedelta(days=1)).isoformat(), 'end_date': 'soon'}
+    valid, errors = validate_many(BOOKING_SPEC, [record])
+    # The end date failed to parse, so only the start date check runs
+    assert not valid
+    assert errors[0]['messages'] == ['Invalid date format', 'Start date cannot be in the past']